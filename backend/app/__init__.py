@@ -3,17 +3,45 @@
 from flask import Flask
 from flask_cors import CORS
 
+from app.chat import get_session_store
 from app.config import Config
+from app.logs import setup_logging
+from app.metrics import REQUEST_ID_HEADER, init_request_metrics, metrics_view, track_memory_store
 from app.routes.chat_api import chat_api_bp
+from app.services import create_service_registry
 
 
 def create_app():
+    # Before Flask sets up its own logger, so app.logger goes through the queue too
+    setup_logging()
     application = Flask(__name__)
     application.config.from_object(Config)
     application.logger.setLevel(application.config['LOG_LEVEL'])
     
-    CORS(application)
+    CORS(application, expose_headers=[REQUEST_ID_HEADER, 'Server-Timing'])
     
     application.register_blueprint(chat_api_bp, url_prefix='/chat_api')
+
+    # Services are built on first use, so media dependencies only load in
+    # workers that need them; the ones every request needs warm up in the background
+    services = application.extensions['services'] = create_service_registry()
+    preload = [name.strip() for name in application.config['SERVICES_PRELOAD'].split(',') if name.strip()]
+    if preload:
+        services.preload(preload)
+
+    # Request ids, per-stage timings and counters, scraped from /metrics
+    init_request_metrics(application)
+    application.add_url_rule('/metrics', 'metrics', metrics_view)
+    track_memory_store(lambda: services.get('memory_store'))
+
+    # Expire memories in the background so requests only see what is due
+    if application.config['MEMORY_SWEEP_INTERVAL'] > 0:
+        services.get('memory_store').start_sweeper(application.config['MEMORY_SWEEP_INTERVAL'])
+    # Delete idle sessions from disk, including ones no worker has in memory
+    if application.config['SESSION_DB_PATH'] and application.config['SESSION_SWEEP_INTERVAL'] > 0:
+        get_session_store().start_sweeper(application.config['SESSION_SWEEP_INTERVAL'])
+    # Merge journaled memories into the store off the request path
+    if application.config['MEMORY_JOURNAL_PATH'] and application.config['MEMORY_JOURNAL_MERGE_INTERVAL'] > 0:
+        services.get('memory_store').start_merger(application.config['MEMORY_JOURNAL_MERGE_INTERVAL'])
     
     return application
\ No newline at end of file
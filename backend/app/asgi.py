@@ -0,0 +1,224 @@
+# Async serving mode. The chat endpoints are served natively on the event
+# loop, so a model call that takes seconds holds a coroutine rather than a
+# worker thread. Every other route falls through to the regular Flask app.
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from uvicorn.middleware.wsgi import WSGIMiddleware
+
+from app import create_app
+from app.chat.turns import CHAT_MODEL, SSE_HEADERS, complete_turn, prepare_turn, sse_event, stream_known_reply
+from app.chatbotPlayground import load_memories
+from app.config import Config
+from app.llm import AsyncLLMGateway, LLMOverloadedError, LLMTimeoutError, gateway_settings
+from app.memory import DEFAULT_USER, RememberTagParser, extract_memories
+from app.metrics import (PROFILE_HEADER, REQUEST_ID_HEADER, begin_request, end_request, finish_profile,
+                         profiling_requested, record_request, stage, start_profile)
+
+
+class ChatASGIApp:
+    """
+    ASGI application for the chat API.
+
+    ``POST /chat_api/chat``, ``POST /chat_api/chat/stream`` and
+    ``GET /chat_api/memories`` behave exactly like their Flask views. The
+    model call is awaited through ``AsyncLLMGateway``; the blocking parts of
+    a turn (SQLite, session locks) run in a thread pool of their own, sized
+    with ``ASGI_BLOCKING_THREADS`` rather than the loop's small default pool.
+
+    :param flask_app: The Flask app serving every other route
+    """
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi = WSGIMiddleware(flask_app, workers=Config.ASGI_WSGI_THREADS)
+        self.executor = ThreadPoolExecutor(max_workers=Config.ASGI_BLOCKING_THREADS,
+                                           thread_name_prefix='chat-turn')
+        self.gateway = None
+        self.routes = {
+            ('POST', '/chat_api/chat'): self.chat,
+            ('POST', '/chat_api/chat/stream'): self.chat_stream,
+            ('GET', '/chat_api/memories'): self.get_memories,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        handler = self.routes.get((scope['method'], scope['path']))
+        if handler is None:
+            await self.wsgi(scope, receive, send)
+            return
+        await self._instrumented(handler, scope, receive, send)
+
+    async def _instrumented(self, handler, scope, receive, send):
+        # The request ids, timings and profiling the Flask app's hooks give every other route
+        headers = {name.decode('latin-1').lower(): value.decode('latin-1')
+                   for name, value in scope.get('headers', [])}
+        context, token = begin_request(headers.get(REQUEST_ID_HEADER.lower()))
+        profiler = None
+        if profiling_requested(headers.get(PROFILE_HEADER.lower())):
+            # A turn hops between the loop and pool threads, so every thread is sampled
+            profiler = start_profile(None, Config.PROFILER_INTERVAL)
+        status = {}
+
+        async def send_with_headers(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+                extra = [(b'x-request-id', context.request_id.encode('latin-1')),
+                         (b'access-control-expose-headers', b'X-Request-ID, Server-Timing')]
+                if context.timings:
+                    extra.append((b'server-timing', context.server_timing().encode('latin-1')))
+                message = dict(message, headers=list(message.get('headers', [])) + extra)
+            await send(message)
+
+        try:
+            await handler(scope, receive, send_with_headers)
+        finally:
+            record_request(scope['path'], scope['method'], status.get('code', 500), context.elapsed())
+            if profiler is not None:
+                await self._blocking(finish_profile, profiler, Config.PROFILER_DIR, context.request_id)
+            end_request(token)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.gateway = AsyncLLMGateway(**gateway_settings(async_mode=True))
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.gateway.close()
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _gateway(self):
+        # Servers without lifespan support still get a gateway, made in the running loop
+        if self.gateway is None:
+            self.gateway = AsyncLLMGateway(**gateway_settings(async_mode=True))
+        return self.gateway
+
+    async def _blocking(self, func, *args):
+        # Like asyncio.to_thread, request context included, but on our own pool
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, functools.partial(context.run, func, *args))
+
+    @staticmethod
+    async def _read_body(receive):
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                return body
+
+    @staticmethod
+    def _client_key(scope):
+        client = scope.get('client')
+        return client[0] if client else None
+
+    @staticmethod
+    async def _start(send, status, content_type, extra_headers=None):
+        headers = [(b'content-type', content_type.encode()),
+                   (b'access-control-allow-origin', b'*')]
+        for name, value in (extra_headers or {}).items():
+            headers.append((name.lower().encode(), value.encode()))
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+
+    async def _json(self, send, body, status=200):
+        await self._start(send, status, 'application/json')
+        await send({'type': 'http.response.body', 'body': json.dumps(body).encode('utf-8')})
+
+    async def _request_json(self, receive, send):
+        try:
+            data = json.loads(await self._read_body(receive) or b'null')
+        except ValueError:
+            data = None
+        if not isinstance(data, dict) or not data.get('message'):
+            await self._json(send, {"error": "No message provided"}, 400)
+            return None
+        return data
+
+    async def chat(self, scope, receive, send):
+        data = await self._request_json(receive, send)
+        if data is None:
+            return
+        try:
+            turn = await self._blocking(prepare_turn, data, self._client_key(scope))
+            if turn.body is not None:
+                await self._json(send, turn.body)
+                return
+
+            with stage('llm'):
+                reply = await self._gateway().complete(turn.messages, model=CHAT_MODEL)
+
+            with stage('parse'):
+                assistant_reply, new_memories = extract_memories(reply)
+            body = await self._blocking(complete_turn, turn, assistant_reply, new_memories)
+            await self._json(send, body)
+
+        except LLMOverloadedError as e:
+            logging.error(f"Model overloaded: {str(e)}")
+            await self._json(send, {"error": "The chat service is busy, please try again"}, 503)
+        except LLMTimeoutError as e:
+            logging.error(f"Model call timed out: {str(e)}")
+            await self._json(send, {"error": "The chat service took too long to answer"}, 504)
+        except Exception as e:
+            logging.error(f"An error occurred: {str(e)}")
+            await self._json(send, {"error": "An error occurred during the chat"}, 500)
+
+    async def chat_stream(self, scope, receive, send):
+        data = await self._request_json(receive, send)
+        if data is None:
+            return
+
+        await self._start(send, 200, 'text/event-stream', SSE_HEADERS)
+
+        async def event(text):
+            await send({'type': 'http.response.body', 'body': text.encode('utf-8'), 'more_body': True})
+
+        parser = RememberTagParser()
+        reply_parts = []
+        try:
+            turn = await self._blocking(prepare_turn, data, self._client_key(scope))
+            if turn.body is not None:
+                for text in stream_known_reply(turn.body):
+                    await event(text)
+            else:
+                with stage('llm'):
+                    async for delta in self._gateway().stream(turn.messages, model=CHAT_MODEL):
+                        visible = parser.feed(delta)
+                        if visible:
+                            reply_parts.append(visible)
+                            await event(sse_event({"delta": visible}))
+
+                tail = parser.close()
+                if tail:
+                    reply_parts.append(tail)
+                    await event(sse_event({"delta": tail}))
+
+                assistant_reply = ''.join(reply_parts).strip()
+                body = await self._blocking(complete_turn, turn, assistant_reply, parser.memories)
+                await event(sse_event(body, event="done"))
+
+        except Exception as e:
+            logging.error(f"An error occurred: {str(e)}")
+            await event(sse_event({"error": "An error occurred during the chat"}, event="error"))
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def get_memories(self, scope, receive, send):
+        query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        user_id = query.get('user_id', [DEFAULT_USER])[0] or DEFAULT_USER
+        await self._json(send, await self._blocking(load_memories, user_id))
+
+
+def create_asgi_app():
+    return ChatASGIApp(create_app())
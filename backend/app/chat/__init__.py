@@ -0,0 +1,6 @@
+# The chat package holds the server-side state behind /chat_api: sessions and
+# the helpers that decide what goes into each model call.
+from .sessions import Session, SessionStore, get_session_store
+from .context import ContextBuilder, ContextState, count_tokens
+from .activity import ActivityDecision, ActivityPipeline, parse_activity_alert
+from .reply_cache import InMemoryReplyCache, ReplyCache, SQLiteReplyCache, create_reply_cache, reply_cache_key
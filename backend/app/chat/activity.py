@@ -0,0 +1,212 @@
+import logging
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+ACTIVITY_ALERT_RE = re.compile(r'^\s*<ACTIVITY ALERT:\s*(.*?)\s*>\s*$', re.IGNORECASE | re.DOTALL)
+
+PRODUCTIVE = 'productive'
+DISTRACTING = 'distracting'
+IGNORED = 'ignored'
+
+# Sites we can answer for without asking the model. Anything not listed here
+# is ambiguous and goes to the model, which knows the boyfriend's plans.
+DOMAIN_RULES = {
+    'docs.google.com': PRODUCTIVE,
+    'sheets.google.com': PRODUCTIVE,
+    'slides.google.com': PRODUCTIVE,
+    'drive.google.com': PRODUCTIVE,
+    'calendar.google.com': PRODUCTIVE,
+    'github.com': PRODUCTIVE,
+    'gitlab.com': PRODUCTIVE,
+    'stackoverflow.com': PRODUCTIVE,
+    'notion.so': PRODUCTIVE,
+    'linear.app': PRODUCTIVE,
+    'figma.com': PRODUCTIVE,
+    'overleaf.com': PRODUCTIVE,
+    'leetcode.com': PRODUCTIVE,
+    'localhost': PRODUCTIVE,
+    'x.com': DISTRACTING,
+    'twitter.com': DISTRACTING,
+    'youtube.com': DISTRACTING,
+    'reddit.com': DISTRACTING,
+    'instagram.com': DISTRACTING,
+    'facebook.com': DISTRACTING,
+    'tiktok.com': DISTRACTING,
+    'netflix.com': DISTRACTING,
+    'twitch.tv': DISTRACTING,
+    # Browser pages that aren't really activity
+    'newtab': IGNORED,
+    'extensions': IGNORED,
+    'about:blank': IGNORED,
+}
+
+RESPONSE_TEMPLATES = {
+    PRODUCTIVE: [
+        "Sugoi~! {site} means you're working hard! I'm so proud of you 💖✨",
+        "Ganbatte on {site}, my love! You've got this 💪🌸",
+        "Look at you being so productive on {site}! Kyaa~ 😍📚",
+    ],
+    DISTRACTING: [
+        "Ehh~ {site} again? 🥺 Don't forget your goals, okay? Let's get back to work soon 💕",
+        "Mou~ {site} can wait, darling! Finish your tasks first and then relax with me 😘📝",
+        "I see you on {site}~ 👀 Just a little break, ne? Then back to being amazing! 💖",
+    ],
+}
+
+
+def parse_activity_alert(message):
+    """
+    :return: The activity inside ``<ACTIVITY ALERT: ...>``, or None if the message isn't an alert
+    """
+    match = ACTIVITY_ALERT_RE.match(message or '')
+    return match.group(1) if match else None
+
+
+def activity_domain(activity):
+    # Alerts carry a tab URL; fall back to the raw text for names like "YouTube"
+    parsed = urlparse(activity)
+    if parsed.scheme in ('chrome', 'edge', 'about', 'chrome-extension'):
+        return parsed.netloc or activity
+    host = parsed.hostname or activity.strip().lower()
+    for prefix in ('www.', 'm.', 'mobile.'):
+        if host.startswith(prefix):
+            return host[len(prefix):]
+    return host
+
+
+def classify_domain(domain, rules=DOMAIN_RULES):
+    # Match the most specific rule, so docs.google.com can differ from google.com
+    labels = domain.split('.')
+    for i in range(len(labels)):
+        category = rules.get('.'.join(labels[i:]))
+        if category:
+            return category
+    # Plain names such as "YouTube" or "Google Docs"
+    return rules.get(f"{domain.replace(' ', '')}.com")
+
+
+class ActivityDecision:
+    SKIP = 'skip'
+    REPLY = 'reply'
+    ESCALATE = 'escalate'
+
+    def __init__(self, action, domain=None, reply=None):
+        self.action = action
+        self.domain = domain
+        self.reply = reply
+
+
+class _ConversationActivity:
+    def __init__(self):
+        # When the current burst started, and its newest alert still to be
+        # answered when the burst window closes: (activity, on_settle)
+        self.burst_started = None
+        self.pending = None
+        self.last_domain = None
+        self.last_handled = 0.0
+
+
+class ActivityPipeline:
+    """
+    Cheap handling for ``<ACTIVITY ALERT: ...>`` traffic before it reaches the model.
+
+    * Bursts are coalesced to their latest activity. An alert after a quiet
+      spell is handled straight away; alerts for the same conversation
+      within ``burst_window`` seconds of it are skipped, and the newest of
+      them is decided when the window closes and passed to the
+      ``on_settle`` callback it came with. Nothing waits, so a request
+      thread is never held by an alert.
+    * Repeats of the domain last handled within ``repeat_window`` seconds are dropped.
+    * Domains in the rule table get a templated reply; anything else is
+      escalated to the model.
+
+    :param burst_window: Seconds over which a burst of alerts is coalesced
+    :param repeat_window: Seconds during which the same domain is not reported again
+    :param max_conversations: Number of conversations whose last alert is remembered
+    """
+
+    def __init__(self, burst_window=2.0, repeat_window=600, rules=DOMAIN_RULES, max_conversations=10000):
+        self.burst_window = burst_window
+        self.repeat_window = repeat_window
+        self.rules = rules
+        self.max_conversations = max_conversations
+        # Least recently alerted first
+        self._conversations = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _state(self, key):
+        state = self._conversations.get(key)
+        if state is None:
+            state = self._conversations[key] = _ConversationActivity()
+            while len(self._conversations) > self.max_conversations:
+                # Forget the conversation that has been quiet the longest
+                self._conversations.popitem(last=False)
+        else:
+            self._conversations.move_to_end(key)
+        return state
+
+    def handle(self, key, activity, on_settle=None):
+        """
+        :param key: Identifies the conversation (session id or client address)
+        :param activity: What the alert reported, usually the tab URL
+        :param on_settle: Called on a timer thread with this alert's
+                          ActivityDecision if the alert is skipped now but
+                          turns out to be the newest of its burst
+        """
+        domain = activity_domain(activity)
+        with self._lock:
+            state = self._state(key)
+            now = time.monotonic()
+            if state.burst_started is not None and now - state.burst_started < self.burst_window:
+                if state.pending is None:
+                    timer = threading.Timer(state.burst_started + self.burst_window - now, self._settle, (key, state))
+                    timer.daemon = True
+                    timer.start()
+                state.pending = (activity, on_settle)
+                logging.info(f"Activity alert for {domain} held back as part of a burst")
+                return ActivityDecision(ActivityDecision.SKIP, domain)
+            state.burst_started = now
+            state.pending = None
+            if not self._is_new(state, domain):
+                return ActivityDecision(ActivityDecision.SKIP, domain)
+        return self._decide(domain)
+
+    def _is_new(self, state, domain):
+        # Records the domain as handled unless it was just reported. Call with the lock held.
+        now = time.time()
+        if domain == state.last_domain and now - state.last_handled < self.repeat_window:
+            return False
+        state.last_domain = domain
+        state.last_handled = now
+        return True
+
+    def _settle(self, key, state):
+        # The burst window closed: answer its newest alert, which opens the next window
+        with self._lock:
+            if state.pending is None:
+                return
+            activity, on_settle = state.pending
+            state.pending = None
+            state.burst_started = time.monotonic()
+            domain = activity_domain(activity)
+            decision = (self._decide(domain) if self._is_new(state, domain)
+                        else ActivityDecision(ActivityDecision.SKIP, domain))
+        logging.info(f"Settled activity burst for {key} on {domain}: {decision.action}")
+        if on_settle is not None:
+            try:
+                on_settle(decision)
+            except Exception as e:
+                logging.error(f"Handling the settled activity alert for {domain} failed: {str(e)}")
+
+    def _decide(self, domain):
+        category = classify_domain(domain, self.rules)
+        if category == IGNORED:
+            return ActivityDecision(ActivityDecision.SKIP, domain)
+        if category in RESPONSE_TEMPLATES:
+            reply = random.choice(RESPONSE_TEMPLATES[category]).format(site=domain)
+            return ActivityDecision(ActivityDecision.REPLY, domain, reply)
+        return ActivityDecision(ActivityDecision.ESCALATE, domain)
@@ -0,0 +1,164 @@
+import logging
+
+try:
+    import tiktoken
+except ImportError:  # Token counts fall back to an estimate without tiktoken
+    tiktoken = None
+
+# Roughly what the chat format adds around every message
+MESSAGE_OVERHEAD_TOKENS = 4
+# How much of a compacted turn is kept in the rolling summary
+SUMMARY_LINE_CHARS = 200
+
+_encoding = None
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        _encoding = tiktoken.get_encoding('cl100k_base')
+    return _encoding
+
+
+def count_tokens(text):
+    if tiktoken is None:
+        # About four characters per token for English text
+        return len(text) // 4 + 1
+    return len(_get_encoding().encode(text))
+
+
+def truncate_to_tokens(text, max_tokens):
+    # The start of ``text`` that fits in ``max_tokens``
+    if max_tokens <= 0:
+        return ''
+    if tiktoken is None:
+        # count_tokens estimates len // 4 + 1, so keep one token's worth less
+        return text if count_tokens(text) <= max_tokens else text[:(max_tokens - 1) * 4]
+    tokens = _get_encoding().encode(text)
+    return text if len(tokens) <= max_tokens else _encoding.decode(tokens[:max_tokens])
+
+
+def count_message_tokens(messages):
+    return sum(count_tokens(m['content']) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def summarize_turns(summary, messages, max_tokens):
+    """
+    Default summarizer: folds old turns into the summary as one short line
+    each and drops the oldest lines once the summary is over ``max_tokens``.
+    Runs locally, so compaction never waits on the model.
+    """
+    lines = summary.splitlines() if summary else []
+    for message in messages:
+        content = ' '.join(message['content'].split())
+        if len(content) > SUMMARY_LINE_CHARS:
+            content = content[:SUMMARY_LINE_CHARS].rstrip() + '...'
+        lines.append(f"{message['role']}: {content}")
+    while len(lines) > 1 and count_tokens('\n'.join(lines)) > max_tokens:
+        lines.pop(0)
+    return '\n'.join(lines)
+
+
+class ContextState:
+    """
+    Per-conversation compaction state: the rolling summary and how many
+    history messages have been folded into it.
+    """
+
+    def __init__(self):
+        self.summary = ''
+        self.summarized_upto = 0
+
+
+class ContextBuilder:
+    """
+    Assembles the messages for a model call inside a token budget.
+
+    The system prompt is always sent. Memories get their own sub-budget
+    (newest kept first), and the conversation gets what is left. When the
+    unsummarized history no longer fits, the oldest turns are compacted into
+    the rolling summary until the history is back under half its budget, so
+    compaction happens once every few turns rather than on every one.
+
+    :param token_budget: Total prompt tokens allowed
+    :param memory_tokens: Tokens reserved for memories
+    :param summary_tokens: Tokens reserved for the rolling summary
+    :param summarizer: ``f(summary, messages, max_tokens) -> summary``
+    """
+
+    def __init__(self, token_budget=6000, memory_tokens=1000, summary_tokens=500,
+                 summarizer=summarize_turns):
+        self.token_budget = token_budget
+        self.memory_tokens = memory_tokens
+        self.summary_tokens = summary_tokens
+        self.summarizer = summarizer
+
+    def _fit_memories(self, memory_lines):
+        kept, used = [], 0
+        for line in reversed(memory_lines):
+            cost = count_tokens(line) + 2
+            if used + cost > self.memory_tokens:
+                break
+            kept.append(line)
+            used += cost
+        kept.reverse()
+        return kept
+
+    def _compact(self, history, state, history_budget):
+        pending = history[state.summarized_upto:]
+        if count_message_tokens(pending) <= history_budget:
+            return
+
+        # Keep the newest messages that fit in half the budget; always keep the last one
+        target = history_budget // 2
+        kept_tokens = 0
+        cut = len(pending) - 1
+        while cut > 0:
+            cost = count_message_tokens([pending[cut - 1]])
+            if kept_tokens + cost + count_message_tokens([pending[-1]]) > target:
+                break
+            kept_tokens += cost
+            cut -= 1
+
+        if cut > 0:
+            state.summary = self.summarizer(state.summary, pending[:cut], self.summary_tokens)
+            state.summarized_upto += cut
+            logging.info(f"Compacted {cut} messages into the conversation summary")
+
+    def _fit_newest(self, messages, history_budget):
+        # Compaction never touches the newest message, so on its own it can
+        # still be over the budget; send as much of it as fits
+        newest = messages[-1]
+        overflow = count_message_tokens([newest]) - history_budget
+        if overflow <= 0:
+            return messages
+        logging.warning(f"Newest {newest['role']} message is {overflow} tokens over the "
+                        f"history budget of {history_budget}, truncating it")
+        content = truncate_to_tokens(newest['content'], history_budget - MESSAGE_OVERHEAD_TOKENS)
+        return messages[:-1] + [dict(newest, content=content)]
+
+    def build(self, system_prompt, memory_lines, history, state):
+        """
+        :param system_prompt: The persona prompt
+        :param memory_lines: Memories already formatted for the prompt
+        :param history: The conversation, ending with the new user message
+        :param state: The conversation's ContextState, updated in place
+        :return: Messages for the chat completion call
+        """
+        memory_lines = self._fit_memories(memory_lines)
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "system", "content": f"Current memories: {memory_lines}"}
+        ]
+        history_budget = (self.token_budget - count_message_tokens(messages)
+                          - self.summary_tokens)
+        history_budget = max(history_budget, 0)
+        self._compact(history, state, history_budget)
+
+        if state.summary:
+            messages.append({"role": "system",
+                             "content": f"Summary of the earlier conversation:\n{state.summary}"})
+        recent = history[state.summarized_upto:]
+        if recent:
+            recent = self._fit_newest(recent, history_budget)
+        return messages + recent
@@ -0,0 +1,181 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+# Reads of the SQLite cache note the entries they used and write them in one go
+TOUCH_BATCH_SIZE = 64
+
+
+def reply_cache_key(model, system_prompt, memory_version, messages, turns=4, summary=''):
+    """
+    Hash of what decides the model's reply: the model, the system prompt,
+    the memory store version, the summary of the compacted history and the
+    last ``turns`` messages (whitespace and case normalized).
+    """
+    recent = [{"role": m['role'], "content": ' '.join(m['content'].split()).lower()}
+              for m in messages[-turns:]]
+    payload = json.dumps({
+        "model": model,
+        "prompt": hashlib.sha1(system_prompt.encode('utf-8')).hexdigest(),
+        "memories": memory_version,
+        "summary": hashlib.sha1(summary.encode('utf-8')).hexdigest(),
+        "messages": recent,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ReplyCache:
+    """
+    Base class for reply caches. Entries live for ``ttl`` seconds and the
+    least recently used entries are evicted past ``max_entries``.
+    """
+
+    def __init__(self, ttl=300, max_entries=1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self._get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self._set(key, value)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self)}
+
+    def _get(self, key):
+        raise NotImplementedError
+
+    def _set(self, key, value):
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+
+class InMemoryReplyCache(ReplyCache):
+    # Per-process cache, an OrderedDict kept in least recently used order
+
+    def __init__(self, ttl=300, max_entries=1000):
+        super().__init__(ttl, max_entries)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class SQLiteReplyCache(ReplyCache):
+    """
+    Cache in a SQLite file, so every worker process on the host shares it.
+
+    Reads don't write: the entries they used are remembered and their
+    ``last_used`` is updated in batches, so a hit never waits for the
+    database's write lock. Eviction order lags by at most a batch.
+
+    :param db_path: Path of the SQLite database file
+    """
+
+    def __init__(self, db_path, ttl=300, max_entries=1000):
+        super().__init__(ttl, max_entries)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS reply_cache ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS reply_cache_last_used ON reply_cache (last_used)")
+        self._conn.commit()
+        # key -> when it was last read, not written to the database yet
+        self._touched = {}
+
+    def _flush_touches(self):
+        # Call with the lock held
+        if self._touched:
+            self._conn.executemany("UPDATE reply_cache SET last_used = ? WHERE key = ?",
+                                   [(used, key) for key, used in self._touched.items()])
+            self._touched.clear()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM reply_cache").fetchone()[0]
+
+    def _get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM reply_cache WHERE key = ?",
+                                     (key,)).fetchone()
+            # Expired rows are left for the next write to delete
+            if row is None or row[1] <= now:
+                return None
+            self._touched[key] = now
+            if len(self._touched) >= TOUCH_BATCH_SIZE:
+                with self._conn:
+                    self._flush_touches()
+            return json.loads(row[0])
+
+    def _set(self, key, value):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO reply_cache (key, value, expires_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + self.ttl, now)
+            )
+            self._touched.pop(key, None)
+            self._flush_touches()
+            # Drop expired entries, then the least recently used ones past the cap
+            self._conn.execute("DELETE FROM reply_cache WHERE expires_at <= ?", (now,))
+            self._conn.execute(
+                "DELETE FROM reply_cache WHERE key IN ("
+                " SELECT key FROM reply_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+
+def create_reply_cache(backend, ttl=300, max_entries=1000, db_path=None):
+    """
+    :param backend: "memory", "sqlite" or "none"
+    :return: A ReplyCache, or None when caching is disabled
+    """
+    if backend == 'memory':
+        return InMemoryReplyCache(ttl, max_entries)
+    if backend == 'sqlite':
+        return SQLiteReplyCache(db_path, ttl, max_entries)
+    if backend != 'none':
+        logging.warning(f"Unknown reply cache backend '{backend}', caching disabled")
+    return None
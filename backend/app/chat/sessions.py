@@ -0,0 +1,243 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from app.config import Config
+from app.logs import log_event
+from .context import ContextState
+
+
+class Session:
+    def __init__(self, session_id, history=None, last_active=None, next_seq=None):
+        self.id = session_id
+        self.history = history or []
+        self.last_active = last_active or time.time()
+        self.lock = threading.Lock()
+        # Sequence number of the next message on disk; it keeps counting when old messages are dropped
+        self.next_seq = len(self.history) if next_seq is None else next_seq
+        # Rolling summary of the turns that no longer fit in the prompt
+        self.context = ContextState()
+
+    def snapshot(self):
+        # Copy so a turn can build its prompt while another turn appends
+        with self.lock:
+            return list(self.history)
+
+
+class SessionStore:
+    """
+    Conversation sessions keyed by session id, so clients only send the new
+    message each turn instead of the whole history.
+
+    Sessions are kept in an LRU: the least recently used session is dropped
+    when there are more than ``max_sessions``, and sessions idle for longer
+    than ``idle_timeout`` seconds are forgotten. With a ``db_path`` every turn
+    is also appended to SQLite, so sessions dropped from memory (or lost in a
+    restart) are reloaded on their next message. ``sweep`` deletes idle
+    sessions from SQLite too, including ones this process never loaded.
+
+    Each session keeps its newest ``max_messages`` messages; older ones were
+    folded into the rolling summary long ago and are dropped.
+
+    :param max_sessions: Number of sessions kept in memory
+    :param idle_timeout: Seconds of inactivity after which a session is deleted
+    :param db_path: Optional SQLite file backing the sessions
+    :param max_messages: Messages kept per session
+    """
+
+    def __init__(self, max_sessions=1000, idle_timeout=6 * 3600, db_path=None, max_messages=200):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.max_messages = max_messages
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._sweeper = None
+        self._conn = None
+        if db_path:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " id TEXT PRIMARY KEY,"
+                " last_active REAL NOT NULL)"
+            )
+            # Messages are appended one row at a time so a turn never rewrites the history
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS session_messages ("
+                " session_id TEXT NOT NULL,"
+                " seq INTEGER NOT NULL,"
+                " message TEXT NOT NULL,"
+                " PRIMARY KEY (session_id, seq))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_active ON sessions (last_active)")
+            self._conn.commit()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _load(self, session_id):
+        if self._conn is None:
+            return None
+        row = self._conn.execute("SELECT last_active FROM sessions WHERE id = ?",
+                                 (session_id,)).fetchone()
+        if row is None:
+            return None
+        rows = self._conn.execute(
+            "SELECT seq, message FROM session_messages WHERE session_id = ? ORDER BY seq DESC LIMIT ?",
+            (session_id, self.max_messages)).fetchall()
+        rows.reverse()
+        history = [json.loads(message) for _, message in rows]
+        return Session(session_id, history, row[0], rows[-1][0] + 1 if rows else 0)
+
+    def _delete_from_disk(self, session_ids):
+        if self._conn is None or not session_ids:
+            return
+        with self._conn:
+            params = [(session_id,) for session_id in session_ids]
+            self._conn.executemany("DELETE FROM session_messages WHERE session_id = ?", params)
+            self._conn.executemany("DELETE FROM sessions WHERE id = ?", params)
+
+    def _evict(self):
+        # The OrderedDict is in least recently used order, so idle sessions are at the front
+        now = time.time()
+        expired = []
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if now - session.last_active <= self.idle_timeout:
+                break
+            expired.append(self._sessions.popitem(last=False)[0])
+        self._delete_from_disk(expired)
+
+        while len(self._sessions) > self.max_sessions:
+            session_id, _ = self._sessions.popitem(last=False)
+            log_event('session.evicted', "Evicted session from memory", session_id=session_id)
+
+        if expired:
+            logging.info(f"Expired {len(expired)} idle sessions")
+        return len(expired)
+
+    def get_or_create(self, session_id=None):
+        """
+        Returns the session for ``session_id``, creating a new one when the id
+        is missing or unknown.
+        """
+        with self._lock:
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None and session_id:
+                session = self._load(session_id)
+                if session is not None and time.time() - session.last_active > self.idle_timeout:
+                    self._delete_from_disk([session_id])
+                    session = None
+            if session is None:
+                session = Session(session_id or str(uuid.uuid4()))
+            session.last_active = time.time()
+            self._sessions[session.id] = session
+            self._sessions.move_to_end(session.id)
+            self._evict()
+            return session
+
+    def append(self, session, messages):
+        """
+        Adds the messages of a finished turn to the session, dropping the
+        oldest ones past ``max_messages``.
+        """
+        with session.lock:
+            start = session.next_seq
+            session.next_seq += len(messages)
+            session.history.extend(messages)
+            dropped = len(session.history) - self.max_messages
+            if dropped > 0:
+                del session.history[:dropped]
+                # The summary indexes into the history, so it moves with the cut
+                session.context.summarized_upto = max(session.context.summarized_upto - dropped, 0)
+            session.last_active = time.time()
+            if self._conn is not None:
+                with self._lock, self._conn:
+                    self._conn.execute(
+                        "INSERT INTO sessions (id, last_active) VALUES (?, ?)"
+                        " ON CONFLICT(id) DO UPDATE SET last_active = excluded.last_active",
+                        (session.id, session.last_active)
+                    )
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO session_messages (session_id, seq, message) VALUES (?, ?, ?)",
+                        [(session.id, start + i, json.dumps(message)) for i, message in enumerate(messages)]
+                    )
+                    if dropped > 0:
+                        self._conn.execute("DELETE FROM session_messages WHERE session_id = ? AND seq < ?",
+                                           (session.id, session.next_seq - self.max_messages))
+
+    def sweep(self):
+        """
+        Forgets sessions idle for longer than ``idle_timeout``: in memory, and
+        on disk whether or not this process ever loaded them (other workers,
+        sessions the LRU dropped, previous runs). Called by the background sweeper.
+
+        :return: Number of idle sessions deleted
+        """
+        with self._lock:
+            expired = self._evict()
+            if self._conn is None:
+                return expired
+            cutoff = time.time() - self.idle_timeout
+            # A session still live here may not have written a turn for a while; leave it be
+            live = set(self._sessions)
+            idle = [session_id for (session_id,) in self._conn.execute(
+                "SELECT id FROM sessions WHERE last_active < ?", (cutoff,)) if session_id not in live]
+            self._delete_from_disk(idle)
+        if idle:
+            logging.info(f"Deleted {len(idle)} idle sessions from disk")
+        return expired + len(idle)
+
+    def start_sweeper(self, interval=600):
+        with self._lock:
+            if self._sweeper is None:
+                self._sweeper = SessionSweeper(self, interval).start()
+            return self._sweeper
+
+
+class SessionSweeper:
+    """
+    Background thread that periodically deletes idle sessions, so the
+    session database doesn't grow with every conversation ever had.
+    """
+
+    def __init__(self, store, interval=600):
+        self.store = store
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='session-sweeper', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.store.sweep()
+            except Exception as e:
+                logging.error(f"Sweeping idle sessions failed: {e}")
+
+
+_session_store = None
+_session_store_lock = threading.Lock()
+
+
+def get_session_store():
+    global _session_store
+    if _session_store is None:
+        with _session_store_lock:
+            if _session_store is None:
+                _session_store = SessionStore(max_sessions=Config.SESSION_MAX_SESSIONS,
+                                              idle_timeout=Config.SESSION_IDLE_TIMEOUT,
+                                              db_path=Config.SESSION_DB_PATH or None,
+                                              max_messages=Config.SESSION_MAX_MESSAGES)
+    return _session_store
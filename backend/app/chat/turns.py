@@ -0,0 +1,249 @@
+import json
+import logging
+
+from app.ai_waifu_prompt import AI_WAIFU_PROMPT
+from app.chatbotPlayground import find_relevant_memories, memory_version, save_memories
+from app.config import Config
+from app.logs import log_event
+from app.memory.backends import DEFAULT_USER
+from app.metrics import stage
+from .activity import ActivityDecision, ActivityPipeline, parse_activity_alert
+from .context import ContextBuilder, ContextState
+from .reply_cache import create_reply_cache, reply_cache_key
+from .sessions import get_session_store
+
+# Everything a chat turn does apart from the model call itself, shared by the
+# Flask views and the async entry point
+
+CHAT_MODEL = Config.LLM_MODEL
+
+context_builder = ContextBuilder(token_budget=Config.CONTEXT_TOKEN_BUDGET,
+                                 memory_tokens=Config.CONTEXT_MEMORY_TOKENS,
+                                 summary_tokens=Config.CONTEXT_SUMMARY_TOKENS)
+activity_pipeline = ActivityPipeline(burst_window=Config.ACTIVITY_BURST_WINDOW,
+                                     repeat_window=Config.ACTIVITY_REPEAT_WINDOW)
+reply_cache = create_reply_cache(Config.REPLY_CACHE_BACKEND,
+                                 ttl=Config.REPLY_CACHE_TTL,
+                                 max_entries=Config.REPLY_CACHE_MAX_ENTRIES,
+                                 db_path=Config.REPLY_CACHE_PATH)
+
+
+class Turn:
+    """
+    One user message on its way through the chat pipeline.
+
+    ``body`` is set when the turn was answered without the model (activity
+    rules, reply cache); otherwise ``messages`` holds the prompt to send.
+    """
+
+    def __init__(self, user_input, session, conversation_history, user_id=DEFAULT_USER):
+        self.user_input = user_input
+        self.user_id = user_id
+        self.session = session
+        self.conversation_history = conversation_history
+        self.body = None
+        self.cache_key = None
+        self.messages = None
+
+
+def build_messages(session, conversation_history, user_id=DEFAULT_USER):
+    # Rank memories against the new message rather than sending all of them
+    with stage('memories'):
+        memories = find_relevant_memories(conversation_history[-1]['content'], Config.MEMORY_TOP_K,
+                                          user_id=user_id)
+    with stage('prompt'):
+        simplified_memories = [f"{m['timestamp'].split('T')[0]}: {m['content']}" for m in memories]
+        if session is None:
+            return context_builder.build(AI_WAIFU_PROMPT, simplified_memories,
+                                         conversation_history, ContextState())
+        # The summary is cached on the session, so only take one turn's lock at a time
+        with session.lock:
+            return context_builder.build(AI_WAIFU_PROMPT, simplified_memories,
+                                         conversation_history, session.context)
+
+
+def commit_memories(memories, user_id=DEFAULT_USER):
+    # Saves new memories; returns the ones actually stored, i.e. not duplicates
+    if not memories:
+        return []
+    new_memories = save_memories(memories, user_id=user_id)
+    for new_memory in new_memories:
+        log_event('memory.created', "New memory created", user_id=user_id,
+                  timeframe=new_memory.get('timeframe'), content=new_memory.get('content'))
+    return new_memories
+
+
+def start_turn(data):
+    """
+    Works out the conversation a message belongs to.
+
+    Clients send a ``session_id`` (or nothing, to start a new session) and the
+    history is kept server side. Older clients that still post their whole
+    ``conversation_history`` get the old behaviour.
+
+    :return: (session or None, conversation history including the new user message)
+    """
+    user_message = {"role": "user", "content": data.get('message')}
+    if 'conversation_history' in data and not data.get('session_id'):
+        return None, data.get('conversation_history', []) + [user_message]
+    session = get_session_store().get_or_create(data.get('session_id'))
+    return session, session.snapshot() + [user_message]
+
+
+def finish_turn(session, conversation_history, assistant_reply):
+    # Returns the JSON body for the reply; sessions only send back what is new
+    assistant_message = {"role": "assistant", "content": assistant_reply}
+    if session is None:
+        conversation_history.append(assistant_message)
+        return {
+            "reply": assistant_reply,
+            "conversation_history": conversation_history
+        }
+    get_session_store().append(session, [conversation_history[-1], assistant_message])
+    return {
+        "reply": assistant_reply,
+        "session_id": session.id
+    }
+
+
+def record_settled_activity(session, alert_message, decision):
+    """
+    Takes the newest alert of a burst into the conversation once its burst
+    window has closed, so the tab the user ended up on is what the
+    conversation (and the model, on the next turn) knows about. Clients
+    without a session have nowhere to keep it.
+    """
+    log_event('activity.settled', "Answered the newest activity alert of a burst",
+              session_id=session.id if session is not None else None,
+              domain=decision.domain, action=decision.action)
+    if session is None or decision.action == ActivityDecision.SKIP:
+        return
+    messages = [alert_message]
+    if decision.action == ActivityDecision.REPLY:
+        messages.append({"role": "assistant", "content": decision.reply})
+    get_session_store().append(session, messages)
+
+
+def triage_activity(session, conversation_history, client_key):
+    """
+    Runs activity alerts through the activity pipeline.
+
+    :param client_key: Identifies clients without a session, e.g. their address
+    :return: The response body when the alert was answered without the model
+             (or dropped), None when the model should handle it
+    """
+    activity = parse_activity_alert(conversation_history[-1]['content'])
+    if activity is None:
+        return None
+
+    alert_message = conversation_history[-1]
+
+    def on_settle(settled):
+        # This alert was held back and then turned out to be the newest of its burst
+        record_settled_activity(session, alert_message, settled)
+
+    decision = activity_pipeline.handle(session.id if session else client_key, activity, on_settle)
+    if decision.action == ActivityDecision.SKIP:
+        body = {"reply": None, "skipped": True}
+        if session is None:
+            body["conversation_history"] = conversation_history
+        else:
+            body["session_id"] = session.id
+        return body
+    if decision.action == ActivityDecision.REPLY:
+        logging.info(f"Answered activity alert for {decision.domain} from the rule table")
+        return finish_turn(session, conversation_history, decision.reply)
+    return None
+
+
+def lookup_reply_cache(data, session, conversation_history, user_id=DEFAULT_USER):
+    """
+    Requests can opt out of the reply cache with ``"cache": false``.
+
+    :return: (cache key or None when caching is off, cached reply or None)
+    """
+    if reply_cache is None or data.get('cache', True) is False:
+        return None, None
+    # Versions are per user, so the user is part of the memory state in the key
+    summary = ''
+    if session is not None:
+        with session.lock:
+            summary = session.context.summary
+    key = reply_cache_key(CHAT_MODEL, AI_WAIFU_PROMPT, f"{user_id}:{memory_version(user_id)}",
+                          conversation_history, Config.REPLY_CACHE_TURNS, summary)
+    return key, reply_cache.get(key)
+
+
+def store_reply_cache(key, assistant_reply, new_memories):
+    # Replies that created memories change the memory version anyway, so don't keep them
+    if key is not None and not new_memories:
+        reply_cache.set(key, assistant_reply)
+
+
+def prepare_turn(data, client_key):
+    """
+    Everything before the model call: session, activity rules, reply cache
+    and prompt assembly. Blocking (SQLite, locks), so async callers should
+    run it in a thread.
+    """
+    with stage('session_load'):
+        session, conversation_history = start_turn(data)
+    # Memories are kept per user; clients that don't send an id share the default namespace
+    user_id = data.get('user_id') or DEFAULT_USER
+    turn = Turn(data.get('message'), session, conversation_history, user_id)
+
+    with stage('activity'):
+        turn.body = triage_activity(session, conversation_history, client_key)
+    if turn.body is not None:
+        return turn
+
+    with stage('reply_cache_lookup'):
+        turn.cache_key, cached_reply = lookup_reply_cache(data, session, conversation_history, user_id)
+    if cached_reply is not None:
+        turn.body = finish_turn(session, conversation_history, cached_reply)
+        return turn
+
+    turn.messages = build_messages(session, conversation_history, user_id)
+    return turn
+
+
+def complete_turn(turn, assistant_reply, new_memories):
+    """
+    Everything after the model call: saves memories, caches the reply and
+    records the turn. Blocking, like ``prepare_turn``.
+
+    :return: The response body
+    """
+    with stage('save_memories'):
+        stored_memories = commit_memories(new_memories, turn.user_id)
+    with stage('reply_cache_store'):
+        store_reply_cache(turn.cache_key, assistant_reply, new_memories)
+
+    # Only what this turn added is logged; the history is summed up by its length
+    with stage('logging'):
+        log_event('chat.turn', "Chat turn completed",
+                  user_id=turn.user_id,
+                  session_id=turn.session.id if turn.session is not None else None,
+                  history_messages=len(turn.conversation_history),
+                  user_input=turn.user_input,
+                  reply=assistant_reply,
+                  new_memories=len(stored_memories))
+
+    with stage('session_save'):
+        return finish_turn(turn.session, turn.conversation_history, assistant_reply)
+
+
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+
+def sse_event(data, event=None):
+    # One Server-Sent Event; the payload is always JSON so newlines are escaped
+    lines = f"event: {event}\n" if event else ""
+    return lines + f"data: {json.dumps(data)}\n\n"
+
+
+def stream_known_reply(body):
+    # Replies we already have (rule table, cache) go out as one delta and done
+    if body["reply"]:
+        yield sse_event({"delta": body["reply"]})
+    yield sse_event(body, event="done")
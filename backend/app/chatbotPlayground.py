@@ -1,38 +1,28 @@
-import os
-import json
-from openai import OpenAI
-from dotenv import load_dotenv
-from datetime import datetime, timedelta
+from datetime import datetime
 from app.ai_waifu_prompt import AI_WAIFU_PROMPT
+from app.llm import get_llm_gateway
+from app.memory.parser import extract_memories
+from app.memory.backends import DEFAULT_USER
+from app.memory.store import get_memory_store, is_memory_expired
 import uuid
 
-# Load environment variables from .env file OL
-load_dotenv()
+def load_memories(user_id=DEFAULT_USER):
+    # Each user's memories are cached by the store, which only rereads them
+    # when another process has written to them
+    return get_memory_store().load(user_id)
 
-# Set up OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+def find_relevant_memories(query, top_k=8, user_id=DEFAULT_USER):
+    # Only the memories that matter for this message, plus the permanent ones
+    return get_memory_store().search(query, top_k, user_id=user_id)
 
-def load_memories():
-    try:
-        with open('memories.json', 'r') as f:
-            memories = json.load(f)
-        # Add timestamps and IDs to existing memories if missing
-        current_time = datetime.now().isoformat()
-        for memory in memories:
-            if 'timestamp' not in memory:
-                memory['timestamp'] = current_time
-            if 'id' not in memory:
-                memory['id'] = str(uuid.uuid4())
-        return prune_expired_memories(memories)
-    except FileNotFoundError:
-        return []
+def memory_version(user_id=DEFAULT_USER):
+    # Changes whenever the user's memories are added or expire
+    return get_memory_store().version(user_id)
 
-def save_memories(memories):
-    existing_memories = load_memories()
-    new_memories = [m for m in memories if not any(em['content'] == m['content'] for em in existing_memories)]
-    updated_memories = existing_memories + new_memories
-    with open('memories.json', 'w') as f:
-        json.dump(updated_memories, f, default=str)
+def save_memories(memories, user_id=DEFAULT_USER):
+    # Accepts any iterable of memories, so bulk imports can pass a generator.
+    # Duplicates (ignoring case and spacing) are skipped.
+    return get_memory_store().add(memories, user_id=user_id)
 
 def prune_expired_memories(memories):
     current_time = datetime.now()
@@ -41,19 +31,6 @@ def prune_expired_memories(memories):
         if not is_memory_expired(memory, current_time)
     ]
 
-def is_memory_expired(memory, current_time):
-    timestamp = datetime.fromisoformat(memory['timestamp'])
-    timeframe = memory['timeframe']
-    
-    if timeframe == 'day':
-        return current_time - timestamp > timedelta(days=1)
-    elif timeframe == 'week':
-        return current_time - timestamp > timedelta(weeks=1)
-    elif timeframe == 'indefinitely':
-        return False
-    else:
-        return True  # Invalid timeframe, consider it expired
-
 def chat_with_gpt():
     print("Welcome to the AI Waifu Assistant Terminal Interface! 💖")
     print("Type 'exit' to end the conversation.")
@@ -75,28 +52,18 @@ def chat_with_gpt():
         conversation_history.append({"role": "user", "content": user_input})
         
         try:
-            response = client.chat.completions.create(
-                model="gpt-4",
-                messages=conversation_history + [{"role": "system", "content": f"Current memories: {[m['content'] for m in memories]}"}]
+            assistant_reply = get_llm_gateway().complete(
+                conversation_history + [{"role": "system", "content": f"Current memories: {[m['content'] for m in memories]}"}]
             )
             
-            assistant_reply = response.choices[0].message.content
-            
             # Check for memory commands
-            if "<REMEMBER THIS FOR" in assistant_reply:
-                memory_parts = assistant_reply.split("<REMEMBER THIS FOR ", 1)[1].split(">", 1)
-                if len(memory_parts) == 2:
-                    timeframe, content = memory_parts[0].split(":", 1)
-                    new_memory = {
-                        "id": str(uuid.uuid4()),
-                        "timeframe": timeframe.strip(),
-                        "content": content.strip(),
-                        "timestamp": datetime.now().isoformat()
-                    }
-                    new_memories.append(new_memory)
-                    assistant_reply = memory_parts[1].strip()
-                    # Print the updated memories for debugging
-                    print("DEBUG - New memory:", new_memory)
+            assistant_reply, reply_memories = extract_memories(assistant_reply)
+            for new_memory in reply_memories:
+                new_memory["id"] = str(uuid.uuid4())
+                new_memory["timestamp"] = datetime.now().isoformat()
+                new_memories.append(new_memory)
+                # Print the updated memories for debugging
+                print("DEBUG - New memory:", new_memory)
             
             print("AI Waifu:", assistant_reply)
             
@@ -1,3 +1,12 @@
+import os
+import tempfile
+
+from dotenv import load_dotenv
+
+# Make .env settings visible to the config below
+load_dotenv()
+
+
 class Config:
     SECRET_KEY = 'your_secret_key_here'
     DEBUG = True
@@ -5,6 +14,120 @@ class Config:
     # Database configuration
     SQLALCHEMY_DATABASE_URI = 'sqlite:///yourdatabase.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Language model access
+    LLM_MODEL = os.getenv('LLM_MODEL', 'gpt-4')
+    # Point at any OpenAI compatible server, e.g. a local stub for benchmarks
+    LLM_BASE_URL = os.getenv('LLM_BASE_URL', '')
+    LLM_MAX_CONNECTIONS = int(os.getenv('LLM_MAX_CONNECTIONS', '20'))
+    LLM_MAX_IN_FLIGHT = int(os.getenv('LLM_MAX_IN_FLIGHT', '16'))
+    # The async entry point waits on the model without tying up threads, so it can keep more calls open
+    LLM_ASYNC_MAX_CONNECTIONS = int(os.getenv('LLM_ASYNC_MAX_CONNECTIONS', '200'))
+    LLM_ASYNC_MAX_IN_FLIGHT = int(os.getenv('LLM_ASYNC_MAX_IN_FLIGHT', '200'))
+    # Threads for the blocking parts of async chat turns (SQLite, session locks), and for
+    # the Flask routes the async entry point passes through
+    ASGI_BLOCKING_THREADS = int(os.getenv('ASGI_BLOCKING_THREADS', '64'))
+    ASGI_WSGI_THREADS = int(os.getenv('ASGI_WSGI_THREADS', '10'))
+    LLM_CONNECT_TIMEOUT = float(os.getenv('LLM_CONNECT_TIMEOUT', '5'))
+    # Seconds a whole model call may take, including queueing and retries
+    LLM_DEADLINE = float(os.getenv('LLM_DEADLINE', '60'))
+    LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '3'))
+    # Ask for token usage at the end of streamed replies; turn off for servers that reject stream_options
+    LLM_STREAM_USAGE = os.getenv('LLM_STREAM_USAGE', 'true').lower() in ('1', 'true', 'yes')
+    # Memory store configuration: 'sqlite' keeps memories in a local file,
+    # 'dynamodb' shares them between nodes
+    MEMORY_BACKEND = os.getenv('MEMORY_BACKEND', 'sqlite')
+    MEMORY_DB_PATH = os.getenv('MEMORY_DB_PATH', 'memories.db')
+    MEMORY_DYNAMODB_TABLE = os.getenv('MEMORY_DYNAMODB_TABLE', 'memories')
+    # Seconds a DynamoDB version read is reused before checking for other nodes' writes again
+    MEMORY_DYNAMODB_VERSION_TTL = float(os.getenv('MEMORY_DYNAMODB_VERSION_TTL', '1.0'))
+    # Point at DynamoDB Local to run without AWS
+    DYNAMODB_ENDPOINT_URL = os.getenv('DYNAMODB_ENDPOINT_URL', '')
+    # How many users' memories are kept cached in each process
+    MEMORY_MAX_CACHED_USERS = int(os.getenv('MEMORY_MAX_CACHED_USERS', '1000'))
+    # Old flat file store, imported into the database the first time it is opened
+    MEMORY_LEGACY_JSON_PATH = os.getenv('MEMORY_LEGACY_JSON_PATH', 'memories.json')
+    # Seconds between background sweeps for expired memories, 0 disables the sweeper
+    MEMORY_SWEEP_INTERVAL = int(os.getenv('MEMORY_SWEEP_INTERVAL', '60'))
+    # New memories are appended to this journal and merged into the store in
+    # the background, so a reply never waits on the database; empty writes straight through
+    MEMORY_JOURNAL_PATH = os.getenv('MEMORY_JOURNAL_PATH', 'memories.journal')
+    # Seconds between merges of the journal into the store
+    MEMORY_JOURNAL_MERGE_INTERVAL = float(os.getenv('MEMORY_JOURNAL_MERGE_INTERVAL', '1.0'))
+    # Sync every journal append to disk; turning it off risks losing the last memories on a crash
+    MEMORY_JOURNAL_FSYNC = os.getenv('MEMORY_JOURNAL_FSYNC', 'true').lower() in ('1', 'true', 'yes')
+    # How many relevant memories go into each prompt, on top of the permanent ones
+    MEMORY_TOP_K = int(os.getenv('MEMORY_TOP_K', '8'))
+    # Local cache for media downloaded from S3 (videos, images, audio). Every worker on the
+    # host shares it: files in use are pinned with file locks and the size cap is for all of them
+    MEDIA_CACHE_DIR = os.getenv('MEDIA_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'waifu-media-cache'))
+    MEDIA_CACHE_MAX_BYTES = int(os.getenv('MEDIA_CACHE_MAX_BYTES', str(2 * 1024 ** 3)))
+    # Seconds a cached object is trusted before its ETag is checked with S3 again
+    MEDIA_CACHE_REVALIDATE_AFTER = int(os.getenv('MEDIA_CACHE_REVALIDATE_AFTER', '60'))
+    # Scoped temp directories used by the S3 service while rendering
+    S3_TEMP_ROOT = os.getenv('S3_TEMP_ROOT', os.path.join(tempfile.gettempdir(), 'waifu-s3'))
+    # Disk usage allowed for those directories before new temp files are refused, 0 for no limit
+    S3_TEMP_QUOTA_BYTES = int(os.getenv('S3_TEMP_QUOTA_BYTES', str(20 * 1024 ** 3)))
+    # Seconds between janitor sweeps for directories left by dead workers
+    S3_TEMP_JANITOR_INTERVAL = int(os.getenv('S3_TEMP_JANITOR_INTERVAL', '300'))
+    S3_TEMP_MAX_AGE = int(os.getenv('S3_TEMP_MAX_AGE', str(6 * 3600)))
+    # Bulk S3 transfers: files in flight at once, and multipart part size and concurrency per file
+    S3_TRANSFER_WORKERS = int(os.getenv('S3_TRANSFER_WORKERS', '8'))
+    S3_MULTIPART_CHUNK_SIZE = int(os.getenv('S3_MULTIPART_CHUNK_SIZE', str(16 * 1024 ** 2)))
+    S3_MULTIPART_CONCURRENCY = int(os.getenv('S3_MULTIPART_CONCURRENCY', '4'))
+    # Presigned URLs kept in memory for reuse until shortly before they expire
+    S3_PRESIGN_CACHE_MAX_ENTRIES = int(os.getenv('S3_PRESIGN_CACHE_MAX_ENTRIES', '10000'))
+    # Video rendering: output fps, x264 preset and CRF, encoder threads (0 lets ffmpeg decide)
+    RENDER_FPS = int(os.getenv('RENDER_FPS', '24'))
+    RENDER_PRESET = os.getenv('RENDER_PRESET', 'medium')
+    RENDER_CRF = int(os.getenv('RENDER_CRF', '23'))
+    RENDER_THREADS = int(os.getenv('RENDER_THREADS', '0'))
+    # JSON documents (transcriptions) in S3: empty for plain JSON, or 'gzip'/'zstd' once
+    # every reader handles Content-Encoding, and how much decoded JSON is cached in
+    # memory for ETag revalidation
+    S3_DOCUMENT_ENCODING = os.getenv('S3_DOCUMENT_ENCODING', '')
+    S3_DOCUMENT_CACHE_MAX_BYTES = int(os.getenv('S3_DOCUMENT_CACHE_MAX_BYTES', str(256 * 1024 ** 2)))
+    # Sampling profiler for single requests, run when a request sends X-Profile: 1.
+    # Off unless enabled, profiles are written to PROFILER_DIR as <request id>.folded
+    PROFILER_ENABLED = os.getenv('PROFILER_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    PROFILER_INTERVAL = float(os.getenv('PROFILER_INTERVAL', '0.005'))
+    PROFILER_DIR = os.getenv('PROFILER_DIR', os.path.join(tempfile.gettempdir(), 'waifu-profiles'))
+    # Logging: records are queued on the request thread and written by a background thread,
+    # one 'json' or 'text' line each, to stderr and to LOG_FILE (rotated) if set
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+    LOG_FILE = os.getenv('LOG_FILE', '')
+    LOG_FILE_MAX_BYTES = int(os.getenv('LOG_FILE_MAX_BYTES', str(10 * 1024 ** 2)))
+    LOG_FILE_BACKUPS = int(os.getenv('LOG_FILE_BACKUPS', '5'))
+    # Records waiting to be written; beyond this they are dropped rather than block a request
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+    # Longest message and field value kept, in characters
+    LOG_MESSAGE_MAX_CHARS = int(os.getenv('LOG_MESSAGE_MAX_CHARS', '4000'))
+    LOG_FIELD_MAX_CHARS = int(os.getenv('LOG_FIELD_MAX_CHARS', '500'))
+    # Fraction of each high-volume event that is logged, as event=rate pairs
+    LOG_SAMPLE_RATES = os.getenv('LOG_SAMPLE_RATES', 'media_cache.hit=0.1,session.evicted=0.1')
+    # Services built in the background as soon as a worker starts, instead of on first use
+    # (llm, memory_store, s3_client, dynamodb); the media services are best left to load on demand
+    SERVICES_PRELOAD = os.getenv('SERVICES_PRELOAD', 'llm')
+    # Chat sessions, kept in memory and optionally backed by SQLite (empty path disables it)
+    SESSION_MAX_SESSIONS = int(os.getenv('SESSION_MAX_SESSIONS', '1000'))
+    SESSION_IDLE_TIMEOUT = int(os.getenv('SESSION_IDLE_TIMEOUT', str(6 * 3600)))
+    SESSION_DB_PATH = os.getenv('SESSION_DB_PATH', '')
+    # Messages kept per session (older ones live on in the summary), and how often idle sessions are deleted
+    SESSION_MAX_MESSAGES = int(os.getenv('SESSION_MAX_MESSAGES', '200'))
+    SESSION_SWEEP_INTERVAL = int(os.getenv('SESSION_SWEEP_INTERVAL', '600'))
+    # Activity alerts: seconds over which a burst is coalesced to its newest alert, and to ignore repeats of a site
+    ACTIVITY_BURST_WINDOW = float(os.getenv('ACTIVITY_BURST_WINDOW', '2'))
+    ACTIVITY_REPEAT_WINDOW = float(os.getenv('ACTIVITY_REPEAT_WINDOW', '600'))
+    # Reply cache: "memory" (per process), "sqlite" (shared by workers) or "none"
+    REPLY_CACHE_BACKEND = os.getenv('REPLY_CACHE_BACKEND', 'memory')
+    REPLY_CACHE_PATH = os.getenv('REPLY_CACHE_PATH', 'reply_cache.db')
+    REPLY_CACHE_TTL = int(os.getenv('REPLY_CACHE_TTL', '300'))
+    REPLY_CACHE_MAX_ENTRIES = int(os.getenv('REPLY_CACHE_MAX_ENTRIES', '1000'))
+    # Number of recent messages that go into the cache key
+    REPLY_CACHE_TURNS = int(os.getenv('REPLY_CACHE_TURNS', '4'))
+    # Prompt size limits, in tokens
+    CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', '6000'))
+    CONTEXT_MEMORY_TOKENS = int(os.getenv('CONTEXT_MEMORY_TOKENS', '1000'))
+    CONTEXT_SUMMARY_TOKENS = int(os.getenv('CONTEXT_SUMMARY_TOKENS', '500'))
     # Additional configuration variables can go here
 class DevelopmentConfig(Config):
     DEBUG = True
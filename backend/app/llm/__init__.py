@@ -0,0 +1,4 @@
+# Shared access to the language model. Everything that talks to OpenAI (or a
+# compatible server) goes through the gateway in this package.
+from .gateway import (AsyncLLMGateway, LLMError, LLMGateway, LLMOverloadedError, LLMTimeoutError,
+                      gateway_settings, get_llm_gateway)
@@ -0,0 +1,336 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+
+from app.chat.context import count_message_tokens, count_tokens
+from app.config import Config
+from app.metrics.instruments import LLM_CALLS, LLM_RETRIES, record_llm_tokens
+
+
+class LLMError(Exception):
+    pass
+
+
+class LLMTimeoutError(LLMError):
+    # The call's deadline passed before the model answered
+    pass
+
+
+class LLMOverloadedError(LLMError):
+    # Too many calls already in flight and none finished in time
+    pass
+
+
+def _is_retryable(error):
+    from openai import APIConnectionError, APIStatusError, APITimeoutError
+
+    if isinstance(error, (APIConnectionError, APITimeoutError)):
+        return True
+    return isinstance(error, APIStatusError) and (error.status_code == 429 or error.status_code >= 500)
+
+
+def _retry_after(error):
+    # Honour the server's Retry-After (seconds) when it sends one
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+def _outcome(error):
+    # Label for the model call counter
+    if isinstance(error, LLMTimeoutError):
+        return 'timeout'
+    if isinstance(error, LLMOverloadedError):
+        return 'overloaded'
+    return 'error'
+
+
+def _record_call(model, usage, messages, reply):
+    # Servers that don't report usage get an estimate from the text
+    LLM_CALLS.labels(model=model, outcome='ok').inc()
+    if usage is not None:
+        record_llm_tokens(model, usage.prompt_tokens, usage.completion_tokens)
+    else:
+        record_llm_tokens(model, count_message_tokens(messages), count_tokens(reply or ''))
+
+
+def _stream_kwargs(stream_usage):
+    # With include_usage the last chunk carries the token counts and no choices
+    return {'stream_options': {'include_usage': True}} if stream_usage else {}
+
+
+class _RetryPolicy:
+    # Retry decisions shared by the sync and async gateways
+
+    def __init__(self, max_retries, backoff_base, backoff_max):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def next_delay(self, error, attempt, deadline_at):
+        """
+        :return: Seconds to wait before retrying ``error``. Raises when the
+                 error is final or the wait would run past the deadline.
+        """
+        if not _is_retryable(error) or attempt >= self.max_retries:
+            from openai import APITimeoutError
+
+            if isinstance(error, APITimeoutError):
+                raise LLMTimeoutError(str(error)) from error
+            raise error
+        delay = _retry_after(error)
+        if delay is None:
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if time.monotonic() + delay >= deadline_at:
+            raise LLMTimeoutError(f"Model call deadline exceeded after {attempt + 1} attempts") from error
+        logging.warning(f"Model call failed ({error}), retry {attempt + 1} in {delay:.2f}s")
+        LLM_RETRIES.inc()
+        return delay
+
+
+class LLMGateway:
+    """
+    One place for model calls, with the limits a web worker needs.
+
+    * A shared httpx connection pool (``max_connections`` / ``max_keepalive``).
+    * A deadline per call covering queueing, every attempt and the backoff between them.
+    * Retries with full-jitter exponential backoff on 429, 5xx and connection errors.
+    * At most ``max_in_flight`` calls at once; extra callers queue on a
+      semaphore until their deadline.
+    * Calls, retries and tokens in and out are counted for /metrics; streams
+      ask for usage in their last chunk unless ``stream_usage`` is off.
+
+    :param backend: Anything shaped like an OpenAI client. Defaults to one
+                    built on the pooled httpx client; pass ``base_url`` to
+                    point it at a local stub server instead.
+    """
+
+    def __init__(self, backend=None, model='gpt-4', base_url=None, api_key=None,
+                 max_connections=20, max_keepalive=10, connect_timeout=5.0,
+                 deadline=60.0, max_retries=3, backoff_base=0.5, backoff_max=8.0,
+                 max_in_flight=16, stream_usage=True):
+        self.model = model
+        self.deadline = deadline
+        self.stream_usage = stream_usage
+        self.retry_policy = _RetryPolicy(max_retries, backoff_base, backoff_max)
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self._http_client = None
+        if backend is None:
+            # openai and httpx take a good part of a second to import, so only when a gateway is built
+            import httpx
+            from openai import OpenAI
+
+            self._http_client = httpx.Client(
+                limits=httpx.Limits(max_connections=max_connections,
+                                    max_keepalive_connections=max_keepalive),
+                timeout=httpx.Timeout(deadline, connect=connect_timeout),
+            )
+            # Retries are ours, so the SDK's own retry loop is switched off
+            backend = OpenAI(api_key=api_key or os.getenv("OPENAI_API_KEY"),
+                             base_url=base_url,
+                             http_client=self._http_client,
+                             max_retries=0)
+        self.backend = backend
+
+    def _acquire(self, deadline_at):
+        if not self._in_flight.acquire(timeout=max(deadline_at - time.monotonic(), 0)):
+            raise LLMOverloadedError("Too many model calls in flight")
+
+    def _create(self, deadline_at, **kwargs):
+        # Call the backend, retrying transient failures until the deadline
+        attempt = 0
+        while True:
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                raise LLMTimeoutError("Model call deadline exceeded")
+            try:
+                return self.backend.chat.completions.create(timeout=remaining, **kwargs)
+            except Exception as e:
+                delay = self.retry_policy.next_delay(e, attempt, deadline_at)
+                attempt += 1
+                time.sleep(delay)
+
+    def complete(self, messages, model=None, deadline=None):
+        """
+        :return: The reply text
+        """
+        model = model or self.model
+        deadline_at = time.monotonic() + (deadline or self.deadline)
+        try:
+            self._acquire(deadline_at)
+            try:
+                response = self._create(deadline_at, model=model, messages=messages)
+            finally:
+                self._in_flight.release()
+        except Exception as e:
+            LLM_CALLS.labels(model=model, outcome=_outcome(e)).inc()
+            raise
+        reply = response.choices[0].message.content
+        _record_call(model, response.usage, messages, reply)
+        return reply
+
+    def stream(self, messages, model=None, deadline=None):
+        """
+        Yields the reply text as it arrives. The in-flight slot is held until
+        the stream is exhausted or closed; only opening the stream is retried.
+        """
+        model = model or self.model
+        deadline_at = time.monotonic() + (deadline or self.deadline)
+        parts = []
+        usage = None
+        try:
+            self._acquire(deadline_at)
+            try:
+                stream = self._create(deadline_at, model=model, messages=messages, stream=True,
+                                      **_stream_kwargs(self.stream_usage))
+                try:
+                    for chunk in stream:
+                        usage = getattr(chunk, 'usage', None) or usage
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            parts.append(chunk.choices[0].delta.content)
+                            yield chunk.choices[0].delta.content
+                finally:
+                    # Hands the pooled connection back even when the consumer stops early
+                    stream.close()
+            finally:
+                self._in_flight.release()
+        except Exception as e:
+            LLM_CALLS.labels(model=model, outcome=_outcome(e)).inc()
+            raise
+        _record_call(model, usage, messages, ''.join(parts))
+
+    def close(self):
+        if self._http_client is not None:
+            self._http_client.close()
+
+
+class AsyncLLMGateway:
+    """
+    The asyncio twin of ``LLMGateway`` for the ASGI entry point: same pool,
+    deadline, retry and in-flight limits, but waiting never blocks a thread.
+    Create it inside the event loop that will use it.
+    """
+
+    def __init__(self, backend=None, model='gpt-4', base_url=None, api_key=None,
+                 max_connections=100, max_keepalive=20, connect_timeout=5.0,
+                 deadline=60.0, max_retries=3, backoff_base=0.5, backoff_max=8.0,
+                 max_in_flight=64, stream_usage=True):
+        self.model = model
+        self.deadline = deadline
+        self.stream_usage = stream_usage
+        self.retry_policy = _RetryPolicy(max_retries, backoff_base, backoff_max)
+        self._in_flight = asyncio.BoundedSemaphore(max_in_flight)
+        self._http_client = None
+        if backend is None:
+            import httpx
+            from openai import AsyncOpenAI
+
+            self._http_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=max_connections,
+                                    max_keepalive_connections=max_keepalive),
+                timeout=httpx.Timeout(deadline, connect=connect_timeout),
+            )
+            backend = AsyncOpenAI(api_key=api_key or os.getenv("OPENAI_API_KEY"),
+                                  base_url=base_url,
+                                  http_client=self._http_client,
+                                  max_retries=0)
+        self.backend = backend
+
+    async def _acquire(self, deadline_at):
+        try:
+            await asyncio.wait_for(self._in_flight.acquire(),
+                                   timeout=max(deadline_at - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            raise LLMOverloadedError("Too many model calls in flight")
+
+    async def _create(self, deadline_at, **kwargs):
+        attempt = 0
+        while True:
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                raise LLMTimeoutError("Model call deadline exceeded")
+            try:
+                return await self.backend.chat.completions.create(timeout=remaining, **kwargs)
+            except Exception as e:
+                delay = self.retry_policy.next_delay(e, attempt, deadline_at)
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    async def complete(self, messages, model=None, deadline=None):
+        model = model or self.model
+        deadline_at = time.monotonic() + (deadline or self.deadline)
+        try:
+            await self._acquire(deadline_at)
+            try:
+                response = await self._create(deadline_at, model=model, messages=messages)
+            finally:
+                self._in_flight.release()
+        except Exception as e:
+            LLM_CALLS.labels(model=model, outcome=_outcome(e)).inc()
+            raise
+        reply = response.choices[0].message.content
+        _record_call(model, response.usage, messages, reply)
+        return reply
+
+    async def stream(self, messages, model=None, deadline=None):
+        model = model or self.model
+        deadline_at = time.monotonic() + (deadline or self.deadline)
+        parts = []
+        usage = None
+        try:
+            await self._acquire(deadline_at)
+            try:
+                stream = await self._create(deadline_at, model=model, messages=messages, stream=True,
+                                            **_stream_kwargs(self.stream_usage))
+                try:
+                    async for chunk in stream:
+                        usage = getattr(chunk, 'usage', None) or usage
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            parts.append(chunk.choices[0].delta.content)
+                            yield chunk.choices[0].delta.content
+                finally:
+                    # Hands the pooled connection back even when the consumer stops early
+                    await stream.close()
+            finally:
+                self._in_flight.release()
+        except Exception as e:
+            LLM_CALLS.labels(model=model, outcome=_outcome(e)).inc()
+            raise
+        _record_call(model, usage, messages, ''.join(parts))
+
+    async def close(self):
+        if self._http_client is not None:
+            await self._http_client.aclose()
+
+
+def gateway_settings(async_mode=False):
+    # Keyword arguments for either gateway, from the app config
+    return dict(model=Config.LLM_MODEL,
+                base_url=Config.LLM_BASE_URL or None,
+                max_connections=Config.LLM_ASYNC_MAX_CONNECTIONS if async_mode else Config.LLM_MAX_CONNECTIONS,
+                connect_timeout=Config.LLM_CONNECT_TIMEOUT,
+                deadline=Config.LLM_DEADLINE,
+                max_retries=Config.LLM_MAX_RETRIES,
+                stream_usage=Config.LLM_STREAM_USAGE,
+                max_in_flight=Config.LLM_ASYNC_MAX_IN_FLIGHT if async_mode else Config.LLM_MAX_IN_FLIGHT)
+
+
+_llm_gateway = None
+_llm_gateway_lock = threading.Lock()
+
+
+def get_llm_gateway():
+    # Built on first use, so importing the app doesn't need an API key
+    global _llm_gateway
+    if _llm_gateway is None:
+        with _llm_gateway_lock:
+            if _llm_gateway is None:
+                _llm_gateway = LLMGateway(**gateway_settings())
+    return _llm_gateway
@@ -0,0 +1,3 @@
+# Logging for the whole app: structured records, capped in size and
+# sampled on the request thread, written to disk by a background thread.
+from .pipeline import BoundedQueueHandler, StructuredFormatter, cap, log_event, parse_sample_rates, setup_logging
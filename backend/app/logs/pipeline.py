@@ -0,0 +1,162 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+
+from app.config import Config
+from app.metrics.instruments import LOG_RECORDS_DROPPED, current_request_id
+
+
+def log_event(event, message, level=logging.INFO, **fields):
+    """
+    Logs a structured record. ``event`` names the kind of record, for
+    sampling and for searching the logs; ``fields`` become separate keys in
+    the output, each cut to LOG_FIELD_MAX_CHARS.
+    """
+    logging.log(level, message, extra={'event': event, 'fields': fields})
+
+
+def cap(value, max_chars):
+    # Plain values pass through; long strings and the repr of anything else are cut
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    text = value if isinstance(value, str) else repr(value)
+    if len(text) <= max_chars:
+        return text
+    return f"{text[:max_chars]}...(+{len(text) - max_chars} chars)"
+
+
+def parse_sample_rates(text):
+    # "media_cache.hit=0.1,session.evicted=0.5" -> {"media_cache.hit": 0.1, ...}
+    rates = {}
+    for item in filter(None, (part.strip() for part in text.split(','))):
+        event, _, rate = item.partition('=')
+        try:
+            rates[event.strip()] = min(max(float(rate), 0.0), 1.0)
+        except ValueError:
+            logging.warning(f"Ignoring bad log sample rate: {item}")
+    return rates
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """
+    Request-side half of the logging pipeline. Records are sampled, stamped
+    with the request id, cut to size and put on a bounded queue; formatting
+    and I/O happen on the listener's thread. When the queue is full the
+    record is dropped and counted, so a slow disk never stalls a request.
+
+    :param sample_rates: Fraction of records kept per event name; warnings
+                         and errors are always kept
+    """
+
+    def __init__(self, log_queue, message_max_chars=4000, field_max_chars=500, sample_rates=None):
+        super().__init__(log_queue)
+        self.message_max_chars = message_max_chars
+        self.field_max_chars = field_max_chars
+        self.sample_rates = sample_rates or {}
+
+    def filter(self, record):
+        if not super().filter(record):
+            return False
+        rate = self.sample_rates.get(getattr(record, 'event', None))
+        if rate is not None and record.levelno < logging.WARNING:
+            if random.random() >= rate:
+                LOG_RECORDS_DROPPED.labels(reason='sampled').inc()
+                return False
+            record.sample_rate = rate
+        # The request id lives in a context variable, so it has to be read on the request's thread
+        record.request_id = current_request_id()
+        return True
+
+    def prepare(self, record):
+        # Runs before enqueueing: merges args and traceback into the message,
+        # then caps everything so the queue only holds small, immutable values
+        record = super().prepare(record)
+        record.msg = record.message = cap(record.msg, self.message_max_chars)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            record.fields = {name: cap(value, self.field_max_chars) for name, value in fields.items()}
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.labels(reason='queue_full').inc()
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    One line per record: a JSON object, or ``key=value`` pairs after the
+    message in 'text' mode.
+    """
+
+    def __init__(self, style='json'):
+        super().__init__()
+        self.style = style
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for name in ('request_id', 'event', 'sample_rate'):
+            value = getattr(record, name, None)
+            if value is not None:
+                entry[name] = value
+        entry.update(getattr(record, 'fields', None) or {})
+        if self.style == 'json':
+            return json.dumps(entry, default=str, ensure_ascii=False)
+        head = f"{entry.pop('ts')} {entry.pop('level')} {entry.pop('logger')}: {entry.pop('msg')}"
+        return ' '.join([head] + [f"{name}={value}" for name, value in entry.items()])
+
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def _writers(formatter):
+    stream = logging.StreamHandler(sys.stderr)
+    handlers = [stream]
+    if Config.LOG_FILE:
+        # Rotation caps the disk used at LOG_FILE_MAX_BYTES * (LOG_FILE_BACKUPS + 1)
+        handlers.append(logging.handlers.RotatingFileHandler(Config.LOG_FILE,
+                                                             maxBytes=Config.LOG_FILE_MAX_BYTES,
+                                                             backupCount=Config.LOG_FILE_BACKUPS,
+                                                             encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def setup_logging():
+    """
+    Routes the root logger through a bounded queue to a background writer
+    (stderr, plus a rotated LOG_FILE if set). Safe to call more than once;
+    only the first call does anything.
+    """
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            return _listener
+        log_queue = queue.Queue(maxsize=Config.LOG_QUEUE_SIZE)
+        handler = BoundedQueueHandler(log_queue,
+                                      message_max_chars=Config.LOG_MESSAGE_MAX_CHARS,
+                                      field_max_chars=Config.LOG_FIELD_MAX_CHARS,
+                                      sample_rates=parse_sample_rates(Config.LOG_SAMPLE_RATES))
+        _listener = logging.handlers.QueueListener(log_queue, *_writers(StructuredFormatter(Config.LOG_FORMAT)),
+                                                   respect_handler_level=True)
+        root = logging.getLogger()
+        root.handlers = [handler]
+        root.setLevel(Config.LOG_LEVEL)
+        _listener.start()
+        # Write out whatever is still queued when the process exits
+        atexit.register(_listener.stop)
+        return _listener
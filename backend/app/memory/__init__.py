@@ -0,0 +1,7 @@
+# The memory package holds everything the waifu uses to remember things
+# between chats: the persistent store and the helpers around it.
+from .backends import DEFAULT_USER, DynamoDBMemoryBackend, MemoryBackend, SQLiteMemoryBackend
+from .journal import MemoryJournal
+from .store import MemoryStore, get_memory_store
+from .parser import RememberTagParser, extract_memories
+from .retrieval import MemoryIndex
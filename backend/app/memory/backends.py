@@ -0,0 +1,385 @@
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from app.metrics import instrument_client
+from .expiry import compute_expires_at
+
+DEFAULT_USER = 'default'
+# Sort key of the per-user version counter in the DynamoDB table
+_VERSION_ITEM_ID = '#version'
+# Conditional puts a DynamoDB insert has in flight at once
+DYNAMODB_INSERT_CONCURRENCY = 16
+# Users whose DynamoDB version counter is remembered between reads
+DYNAMODB_VERSION_CACHE_SIZE = 10000
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_content(content):
+    # Memories that only differ by case, unicode form or spacing are the same memory
+    content = unicodedata.normalize('NFKC', content)
+    return _WHITESPACE_RE.sub(' ', content).strip().casefold()
+
+
+def content_hash(content):
+    return hashlib.sha1(normalize_content(content).encode('utf-8')).hexdigest()
+
+
+class MemoryBackend:
+    """
+    Where memories are persisted, one namespace per user.
+
+    Rows are dicts with ``id``, ``timeframe``, ``content``, ``timestamp``,
+    ``content_hash`` and ``expires_at``. Each namespace has a version counter
+    that every write bumps; writes return the new version so the caching
+    layer above can tell whether somebody else wrote in between.
+    """
+
+    def version(self, user_id):
+        raise NotImplementedError
+
+    def load(self, user_id):
+        """
+        :return: (rows in the order they were stored, version)
+        """
+        raise NotImplementedError
+
+    def insert(self, user_id, rows):
+        """
+        :return: (number of rows actually stored, version)
+        """
+        raise NotImplementedError
+
+    def delete(self, user_id, memory_ids):
+        """
+        :return: version
+        """
+        raise NotImplementedError
+
+    def delete_expired(self, now):
+        """
+        Removes expired rows in every namespace.
+
+        :return: The user ids that lost rows
+        """
+        raise NotImplementedError
+
+    def count(self, user_id):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SQLiteMemoryBackend(MemoryBackend):
+    """
+    Memories in a local SQLite file. Namespaces share one table keyed by
+    ``id``, with a unique ``(user_id, content_hash)`` index for dedup and an
+    ``expires_at`` index for the sweeper.
+
+    :param db_path: Path of the SQLite database file
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        # WAL lets readers in other processes keep going while we write
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS memories ("
+            " id TEXT PRIMARY KEY,"
+            " timeframe TEXT NOT NULL,"
+            " content TEXT NOT NULL,"
+            " timestamp TEXT NOT NULL,"
+            " content_hash TEXT,"
+            " expires_at REAL,"
+            f" user_id TEXT NOT NULL DEFAULT '{DEFAULT_USER}')"
+        )
+        # A counter per user bumped by every write, so callers can tell when the memories changed
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS memory_versions (user_id TEXT PRIMARY KEY, version INTEGER NOT NULL)"
+        )
+        self._migrate()
+        self._conn.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS memories_user_content_hash ON memories (user_id, content_hash)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS memories_expires_at ON memories (expires_at)"
+        )
+        self._conn.commit()
+
+    def _migrate(self):
+        # Bring databases written by older versions of the store up to date
+        columns = {row['name'] for row in self._conn.execute("PRAGMA table_info(memories)")}
+        if 'content_hash' not in columns:
+            self._conn.execute("ALTER TABLE memories ADD COLUMN content_hash TEXT")
+        if 'expires_at' not in columns:
+            self._conn.execute("ALTER TABLE memories ADD COLUMN expires_at REAL")
+            rows = self._conn.execute("SELECT rowid, timestamp, timeframe FROM memories").fetchall()
+            self._conn.executemany(
+                "UPDATE memories SET expires_at = ? WHERE rowid = ?",
+                [(compute_expires_at(row['timestamp'], row['timeframe']), row['rowid']) for row in rows]
+            )
+        if 'user_id' not in columns:
+            # Everything stored before namespaces belongs to the default user
+            self._conn.execute(
+                f"ALTER TABLE memories ADD COLUMN user_id TEXT NOT NULL DEFAULT '{DEFAULT_USER}'")
+            self._conn.execute("DROP INDEX IF EXISTS memories_content_hash")
+        tables = {row[0] for row in self._conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if 'memory_meta' in tables:
+            row = self._conn.execute("SELECT value FROM memory_meta WHERE key = 'version'").fetchone()
+            if row:
+                self._conn.execute("INSERT OR IGNORE INTO memory_versions (user_id, version) VALUES (?, ?)",
+                                   (DEFAULT_USER, row[0]))
+            self._conn.execute("DROP TABLE memory_meta")
+
+        # Rows from before the content hash existed need it backfilled, and
+        # any rows that now collide dropped, before the unique index is built
+        rows = self._conn.execute(
+            "SELECT rowid, user_id, content FROM memories WHERE content_hash IS NULL ORDER BY rowid"
+        ).fetchall()
+        if not rows:
+            return
+        seen = {(row[0], row[1]) for row in self._conn.execute(
+            "SELECT user_id, content_hash FROM memories WHERE content_hash IS NOT NULL")}
+        updates, duplicates = [], []
+        for row in rows:
+            key = (row['user_id'], content_hash(row['content']))
+            if key in seen:
+                duplicates.append((row['rowid'],))
+            else:
+                seen.add(key)
+                updates.append((key[1], row['rowid']))
+        self._conn.executemany("DELETE FROM memories WHERE rowid = ?", duplicates)
+        self._conn.executemany("UPDATE memories SET content_hash = ? WHERE rowid = ?", updates)
+        logging.info(f"Backfilled content hashes for {len(updates)} memories, dropped {len(duplicates)} duplicates")
+
+    def _bump_version(self, user_id):
+        # Called inside the write transaction so the counter moves with the rows
+        self._conn.execute(
+            "INSERT INTO memory_versions (user_id, version) VALUES (?, 1)"
+            " ON CONFLICT(user_id) DO UPDATE SET version = version + 1", (user_id,))
+        return self._version(user_id)
+
+    def _version(self, user_id):
+        row = self._conn.execute("SELECT version FROM memory_versions WHERE user_id = ?",
+                                 (user_id,)).fetchone()
+        return row[0] if row else 0
+
+    def version(self, user_id):
+        with self._lock:
+            return self._version(user_id)
+
+    def load(self, user_id):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, timeframe, content, timestamp, content_hash, expires_at"
+                " FROM memories WHERE user_id = ? ORDER BY rowid", (user_id,)
+            ).fetchall()
+            return [dict(row) for row in rows], self._version(user_id)
+
+    def insert(self, user_id, rows):
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO memories"
+                " (id, timeframe, content, timestamp, content_hash, expires_at, user_id)"
+                " VALUES (:id, :timeframe, :content, :timestamp, :content_hash, :expires_at, :user_id)",
+                [dict(row, user_id=user_id) for row in rows]
+            )
+            stored = self._conn.total_changes - before
+            return stored, self._bump_version(user_id) if stored else self._version(user_id)
+
+    def delete(self, user_id, memory_ids):
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM memories WHERE id = ? AND user_id = ?",
+                                   [(memory_id, user_id) for memory_id in memory_ids])
+            return self._bump_version(user_id)
+
+    def delete_expired(self, now):
+        with self._lock, self._conn:
+            user_ids = [row[0] for row in self._conn.execute(
+                "SELECT DISTINCT user_id FROM memories WHERE expires_at <= ?", (now,))]
+            if user_ids:
+                self._conn.execute("DELETE FROM memories WHERE expires_at <= ?", (now,))
+                for user_id in user_ids:
+                    self._bump_version(user_id)
+            return user_ids
+
+    def count(self, user_id):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM memories WHERE user_id = ?",
+                                      (user_id,)).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class DynamoDBMemoryBackend(MemoryBackend):
+    """
+    Memories in a DynamoDB table partitioned by ``user_id`` with ``id`` as the
+    sort key, so each user is one partition read with a paginated query and
+    users spread across nodes. Inserts are conditional puts, sent in
+    parallel, so an id that is already stored is neither overwritten nor
+    counted; deletes go through ``batch_writer``. Point ``dynamo_db`` at
+    DynamoDB Local (``endpoint_url``) to run against a local stand-in.
+
+    Expired rows are left to DynamoDB's native TTL on ``expires_at``; enable
+    TTL on that attribute for the table. Dedup by content hash happens in the
+    caching layer, so two nodes writing the same memory at the same moment
+    can both store it.
+
+    The version counter is a strongly consistent read, and the caching layer
+    checks it on every read, so it is remembered for ``version_ttl`` seconds.
+    Our own writes update it straight away; writes from other nodes show up
+    within ``version_ttl``.
+
+    :param dynamo_db: A boto3 DynamoDB resource
+    :param table_name: Name of the memories table
+    :param version_ttl: Seconds a version read is reused, 0 to read it every time
+    """
+
+    def __init__(self, dynamo_db, table_name='memories', version_ttl=1.0):
+        self.dynamo_db = dynamo_db
+        instrument_client(dynamo_db.meta.client)
+        self.table = dynamo_db.Table(table_name)
+        self.version_ttl = version_ttl
+        # The resource's client is thread safe, unlike the resource, and takes
+        # the same plain Python values, so parallel puts go through it
+        self._client = dynamo_db.meta.client
+        # user_id -> (version, when it was read), least recently used first
+        self._versions = OrderedDict()
+        self._versions_lock = threading.Lock()
+        logging.info(f"DynamoDB memory backend using table {table_name}")
+
+    def _remember_version(self, user_id, version):
+        with self._versions_lock:
+            self._versions[user_id] = (version, time.monotonic())
+            self._versions.move_to_end(user_id)
+            while len(self._versions) > DYNAMODB_VERSION_CACHE_SIZE:
+                self._versions.popitem(last=False)
+        return version
+
+    @staticmethod
+    def _to_item(user_id, row):
+        item = {
+            "user_id": user_id,
+            "id": row['id'],
+            "timeframe": row['timeframe'],
+            "content": row['content'],
+            "timestamp": row['timestamp'],
+            "content_hash": row['content_hash'],
+        }
+        # TTL attributes must be whole epoch seconds; indefinite memories have none
+        if row['expires_at'] is not None:
+            item["expires_at"] = int(row['expires_at'] + 1)
+        return item
+
+    @staticmethod
+    def _from_item(item):
+        expires_at = item.get('expires_at')
+        return {
+            "id": item['id'],
+            "timeframe": item['timeframe'],
+            "content": item['content'],
+            "timestamp": item['timestamp'],
+            "content_hash": item['content_hash'],
+            "expires_at": float(expires_at) if expires_at is not None else None,
+        }
+
+    def _bump_version(self, user_id):
+        response = self.table.update_item(
+            Key={"user_id": user_id, "id": _VERSION_ITEM_ID},
+            UpdateExpression="ADD version :one",
+            ExpressionAttributeValues={":one": 1},
+            ReturnValues="UPDATED_NEW",
+        )
+        return self._remember_version(user_id, int(response['Attributes']['version']))
+
+    def version(self, user_id):
+        with self._versions_lock:
+            cached = self._versions.get(user_id)
+        if cached is not None and time.monotonic() - cached[1] < self.version_ttl:
+            return cached[0]
+        item = self.table.get_item(Key={"user_id": user_id, "id": _VERSION_ITEM_ID},
+                                   ConsistentRead=True).get('Item')
+        return self._remember_version(user_id, int(item['version']) if item else 0)
+
+    def load(self, user_id):
+        from boto3.dynamodb.conditions import Key
+
+        rows, version = [], 0
+        query_args = {
+            'KeyConditionExpression': Key('user_id').eq(user_id),
+            'ConsistentRead': True,
+        }
+        # Follow LastEvaluatedKey so partitions over 1 MB are read completely
+        while True:
+            response = self.table.query(**query_args)
+            for item in response.get('Items', []):
+                if item['id'] == _VERSION_ITEM_ID:
+                    version = int(item['version'])
+                else:
+                    rows.append(self._from_item(item))
+            if 'LastEvaluatedKey' not in response:
+                break
+            query_args['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        rows.sort(key=lambda row: row['timestamp'])
+        return rows, self._remember_version(user_id, version)
+
+    def _put_if_new(self, user_id, row):
+        # 1 if the row was stored, 0 if its id was already there
+        from botocore.exceptions import ClientError
+
+        try:
+            self._client.put_item(TableName=self.table.name, Item=self._to_item(user_id, row),
+                                  ConditionExpression='attribute_not_exists(id)')
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return 0
+            raise
+        return 1
+
+    def insert(self, user_id, rows):
+        if len(rows) <= 1:
+            stored = sum(self._put_if_new(user_id, row) for row in rows)
+        else:
+            with ThreadPoolExecutor(max_workers=min(len(rows), DYNAMODB_INSERT_CONCURRENCY)) as pool:
+                stored = sum(pool.map(lambda row: self._put_if_new(user_id, row), rows))
+        if not stored:
+            return 0, self.version(user_id)
+        return stored, self._bump_version(user_id)
+
+    def delete(self, user_id, memory_ids):
+        with self.table.batch_writer(overwrite_by_pkeys=['user_id', 'id']) as batch:
+            for memory_id in memory_ids:
+                batch.delete_item(Key={"user_id": user_id, "id": memory_id})
+        return self._bump_version(user_id)
+
+    def delete_expired(self, now):
+        # DynamoDB's TTL removes expired items; the cache drops them as they fall due
+        return []
+
+    def count(self, user_id):
+        from boto3.dynamodb.conditions import Key
+
+        total = 0
+        query_args = {'KeyConditionExpression': Key('user_id').eq(user_id), 'Select': 'COUNT'}
+        while True:
+            response = self.table.query(**query_args)
+            total += response['Count']
+            if 'LastEvaluatedKey' not in response:
+                break
+            query_args['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        return total - (1 if self.version(user_id) else 0)
@@ -0,0 +1,112 @@
+import calendar
+import heapq
+import logging
+import re
+import threading
+from datetime import datetime, timedelta
+
+# Named timeframes the prompt advertises, plus the units accepted in
+# free-form durations such as "3 days" or "2 weeks"
+INDEFINITELY = 'indefinitely'
+_UNIT_ALIASES = {
+    'minute': 'minutes', 'minutes': 'minutes', 'min': 'minutes', 'mins': 'minutes',
+    'hour': 'hours', 'hours': 'hours', 'hr': 'hours', 'hrs': 'hours',
+    'day': 'days', 'days': 'days',
+    'week': 'weeks', 'weeks': 'weeks',
+    'month': 'months', 'months': 'months',
+    'year': 'years', 'years': 'years',
+}
+_DURATION_RE = re.compile(r'^(?:(\d+)\s*)?([a-z]+)$')
+
+
+def add_months(moment, months):
+    # Calendar months, clamped to the end of shorter months (Jan 31 + 1 month = Feb 28/29)
+    month_index = moment.month - 1 + months
+    year = moment.year + month_index // 12
+    month = month_index % 12 + 1
+    day = min(moment.day, calendar.monthrange(year, month)[1])
+    return moment.replace(year=year, month=month, day=day)
+
+
+def compute_expires_at(timestamp, timeframe):
+    """
+    Works out when a memory stops being relevant.
+
+    :param timestamp: ISO timestamp the memory was created at
+    :param timeframe: "day", "week", "month", "indefinitely" or a duration like "3 days"
+    :return: Expiry as a POSIX timestamp, or None for memories kept indefinitely.
+             Timeframes that can't be understood expire immediately, as they always have.
+    """
+    created_at = datetime.fromisoformat(timestamp)
+    timeframe = (timeframe or '').strip().lower()
+    if timeframe == INDEFINITELY:
+        return None
+
+    match = _DURATION_RE.match(timeframe)
+    unit = _UNIT_ALIASES.get(match.group(2)) if match else None
+    if unit is None:
+        logging.warning(f"Unknown memory timeframe '{timeframe}', treating it as expired")
+        return created_at.timestamp()
+
+    amount = int(match.group(1) or 1)
+    if unit == 'months':
+        expires_at = add_months(created_at, amount)
+    elif unit == 'years':
+        expires_at = add_months(created_at, amount * 12)
+    else:
+        expires_at = created_at + timedelta(**{unit: amount})
+    return expires_at.timestamp()
+
+
+class ExpiryIndex:
+    """
+    Min-heap of (expires_at, memory_id) so callers only ever touch the
+    memories that are actually due. Entries for memories that were removed
+    some other way are skipped lazily when they reach the top.
+    """
+
+    def __init__(self, entries=()):
+        self._heap = [(expires_at, memory_id) for memory_id, expires_at in entries
+                      if expires_at is not None]
+        heapq.heapify(self._heap)
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, memory_id, expires_at):
+        if expires_at is not None:
+            heapq.heappush(self._heap, (expires_at, memory_id))
+
+    def pop_due(self, now):
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due.append(heapq.heappop(self._heap)[1])
+        return due
+
+
+class ExpirySweeper:
+    """
+    Background thread that periodically asks the store to drop expired
+    memories, so requests rarely find anything due.
+    """
+
+    def __init__(self, store, interval=60):
+        self.store = store
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='memory-expiry-sweeper', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.store.sweep()
+            except Exception as e:
+                logging.error(f"Memory expiry sweep failed: {e}")
@@ -0,0 +1,197 @@
+import glob
+import itertools
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # No advisory file locks (Windows); threads in this process are still serialized
+    fcntl = None
+
+# Suffix of a journal that was renamed aside to be merged: <path>.<pid>-<n>.merging
+MERGING_SUFFIX = '.merging'
+
+
+def _fsync(fd):
+    # fdatasync skips the metadata flush where the platform has it
+    getattr(os, 'fdatasync', os.fsync)(fd)
+
+
+def _fsync_dir(path):
+    # Makes a rename or a newly created file in the directory survive a crash
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # Exists but belongs to someone else
+        return True
+    return True
+
+
+class MemoryJournal:
+    """
+    Append-only log of memories that were accepted but not merged into the
+    backend yet. Appending one line and syncing it is much cheaper than a
+    database commit, so a chat turn only waits for that; the store merges
+    the journal into the backend in batches later, and replays whatever is
+    left of it on the next start.
+
+    Every line is ``{"user_id": ..., "row": {...}}``. Writers in any process
+    take an advisory lock on ``<path>.lock``, so lines never interleave and
+    a merge never races an append. To merge, the journal is renamed aside
+    (atomic, new appends start a fresh file) and only deleted once its rows
+    are committed, so a crash mid-merge leaves it to be merged again.
+
+    :param path: Journal file
+    :param fsync: Sync every append to disk; off trades crash safety for speed
+    """
+
+    def __init__(self, path, fsync=True):
+        self.path = path
+        self.fsync = fsync
+        self.lock_path = path + '.lock'
+        self._thread_lock = threading.Lock()
+        self._claims = itertools.count()
+        # Claimed files this process is still merging, so they aren't taken as stale
+        self._claimed = set()
+
+    @contextmanager
+    def _locked(self):
+        with self._thread_lock:
+            if fcntl is None:
+                yield
+                return
+            fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                yield
+            finally:
+                os.close(fd)
+
+    def append(self, user_id, rows):
+        """
+        Durably records ``rows`` for ``user_id``. Returns once they are on disk.
+        """
+        data = ''.join(json.dumps({"user_id": user_id, "row": row}) + '\n' for row in rows).encode()
+        if not data:
+            return
+        with self._locked():
+            created = not os.path.exists(self.path)
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(fd, view):]
+                if self.fsync:
+                    _fsync(fd)
+            finally:
+                os.close(fd)
+            if created and self.fsync:
+                _fsync_dir(self.path)
+
+    def _stale(self):
+        # Claimed files left behind by processes that died before finishing their merge
+        own_pid = os.getpid()
+        stale = []
+        for path in glob.glob(glob.escape(self.path) + '.*' + MERGING_SUFFIX):
+            if path in self._claimed:
+                continue
+            try:
+                pid = int(path[len(self.path) + 1:-len(MERGING_SUFFIX)].split('-', 1)[0])
+            except ValueError:
+                continue
+            if pid == own_pid or not _pid_alive(pid):
+                stale.append(path)
+        return sorted(stale)
+
+    def claim(self):
+        """
+        Takes the journal for merging, along with any batches a crashed
+        process left behind.
+
+        :return: Paths of the claimed files, oldest first; pass each to
+                 ``release`` once its rows are committed
+        """
+        claimed = []
+        with self._locked():
+            sources = self._stale()
+            if os.path.exists(self.path) and os.path.getsize(self.path):
+                sources.append(self.path)
+            for source in sources:
+                target = f"{self.path}.{os.getpid()}-{next(self._claims)}{MERGING_SUFFIX}"
+                os.rename(source, target)
+                self._claimed.add(target)
+                claimed.append(target)
+            if claimed and self.fsync:
+                _fsync_dir(self.path)
+        return claimed
+
+    def release(self, path):
+        # The claimed file's rows are committed to the backend, so it can go
+        os.remove(path)
+        self._claimed.discard(path)
+
+    def unclaim(self, path):
+        # Merging failed; leave the file to be picked up again by the next claim
+        self._claimed.discard(path)
+
+    @staticmethod
+    def read(path):
+        """
+        :return: [(user_id, row)] in the order they were appended. A line cut
+                 short by a crash mid-append is skipped.
+        """
+        entries = []
+        with open(path, 'rb') as f:
+            for number, line in enumerate(f, 1):
+                try:
+                    entry = json.loads(line)
+                    entries.append((entry['user_id'], entry['row']))
+                except (ValueError, KeyError, TypeError):
+                    logging.warning(f"Skipping unreadable line {number} of memory journal {path}")
+        return entries
+
+
+class JournalMerger:
+    """
+    Background thread that periodically merges the store's journal into
+    its backend, so the journal stays short.
+    """
+
+    def __init__(self, store, interval=1.0):
+        self.store = store
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='memory-journal-merger', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.store.merge_journal()
+            except Exception as e:
+                logging.error(f"Merging the memory journal failed: {e}")
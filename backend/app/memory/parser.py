@@ -0,0 +1,113 @@
+import logging
+
+REMEMBER_MARKER = "<REMEMBER THIS FOR "
+# A tag longer than this is almost certainly not a tag, so give it back as text
+MAX_TAG_LENGTH = 2000
+
+_TEXT, _MARKER, _TAG = range(3)
+
+
+class RememberTagParser:
+    """
+    Incremental parser for ``<REMEMBER THIS FOR [TIMEFRAME]: [THING]>`` tags.
+
+    Feed it the reply as it streams in; ``feed`` returns the text that is safe
+    to show the user right away and withholds anything that might still turn
+    out to be a tag. Completed tags are collected in ``memories`` as
+    ``{"timeframe": ..., "content": ...}`` dicts for the caller to save once
+    the reply is finished.
+    """
+
+    def __init__(self):
+        self.memories = []
+        self._state = _TEXT
+        self._buffer = ''
+        # Leading whitespace is dropped so a reply that starts with a tag
+        # doesn't start with a stray space
+        self._started = False
+        self._last_char = None
+        # Set after a tag is removed next to a space, so the space after it is dropped
+        self._after_tag = False
+
+    def _emit(self, text):
+        if not self._started:
+            text = text.lstrip()
+            self._started = bool(text)
+        return text
+
+    def _text(self, visible, text):
+        if text:
+            visible.append(text)
+            self._last_char = text[-1]
+            self._after_tag = False
+
+    def _commit_tag(self, body):
+        self._after_tag = self._last_char is None or self._last_char.isspace()
+        timeframe, sep, content = body.partition(':')
+        if not sep or not content.strip():
+            logging.warning(f"Ignoring malformed memory tag: {body}")
+            return
+        self.memories.append({
+            "timeframe": timeframe.strip(),
+            "content": content.strip(),
+        })
+
+    def _step(self, char, visible):
+        if self._state == _TEXT:
+            if char == '<':
+                self._state = _MARKER
+                self._buffer = char
+            elif not (self._after_tag and char in ' \t'):
+                self._text(visible, char)
+        elif self._state == _MARKER:
+            self._buffer += char
+            if not REMEMBER_MARKER.upper().startswith(self._buffer.upper()):
+                # Not a tag after all. The last character may start one
+                # (think "<<REMEMBER"), so only it goes round again.
+                text = self._buffer[:-1]
+                self._buffer = ''
+                self._state = _TEXT
+                self._text(visible, text)
+                self._step(char, visible)
+            elif len(self._buffer) == len(REMEMBER_MARKER):
+                self._state = _TAG
+                self._buffer = ''
+        else:
+            if char == '>':
+                self._commit_tag(self._buffer)
+                self._buffer = ''
+                self._state = _TEXT
+            else:
+                self._buffer += char
+                if len(self._buffer) > MAX_TAG_LENGTH:
+                    text = REMEMBER_MARKER + self._buffer
+                    self._buffer = ''
+                    self._state = _TEXT
+                    self._text(visible, text)
+
+    def feed(self, chunk):
+        visible = []
+        for char in chunk:
+            self._step(char, visible)
+        return self._emit(''.join(visible))
+
+    def close(self):
+        # Whatever is still held back was never closed, so it was just text
+        if self._state == _TAG:
+            tail = REMEMBER_MARKER + self._buffer
+        else:
+            tail = self._buffer
+        self._buffer = ''
+        self._state = _TEXT
+        return self._emit(tail)
+
+
+def extract_memories(reply):
+    """
+    Splits a complete reply into the text to show and the memories it asked to keep.
+
+    :return: (visible_reply, memories)
+    """
+    parser = RememberTagParser()
+    visible_reply = parser.feed(reply) + parser.close()
+    return visible_reply.strip(), parser.memories
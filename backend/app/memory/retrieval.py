@@ -0,0 +1,86 @@
+import heapq
+import math
+import re
+from collections import Counter
+
+_TOKEN_RE = re.compile(r'\w+')
+# Words that say nothing about which memory is relevant, including the
+# boilerplate around activity alerts and URLs
+STOPWORDS = frozenset("""
+    a an and are as at be but by for from has have he her his i if in is it its
+    me my of on or our she so that the their them they this to was we were what
+    when where which who will with you your boyfriend
+    activity alert http https www com
+""".split())
+
+
+def tokenize(text):
+    return [token for token in _TOKEN_RE.findall(text.lower()) if token not in STOPWORDS]
+
+
+class MemoryIndex:
+    """
+    In-memory BM25 index over memory content.
+
+    Memories are added and removed one at a time as the store changes, so
+    keeping the index current costs O(words in the memory) rather than a
+    rebuild. Everything is local; nothing leaves the process.
+
+    :param k1: BM25 term frequency saturation
+    :param b: BM25 length normalisation
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        # term -> {memory_id: term frequency}
+        self._postings = {}
+        # memory_id -> Counter of terms
+        self._documents = {}
+        self._lengths = {}
+        self._total_length = 0
+
+    def __len__(self):
+        return len(self._documents)
+
+    def add(self, memory_id, content):
+        if memory_id in self._documents:
+            self.remove(memory_id)
+        terms = Counter(tokenize(content))
+        self._documents[memory_id] = terms
+        self._lengths[memory_id] = sum(terms.values())
+        self._total_length += self._lengths[memory_id]
+        for term, frequency in terms.items():
+            self._postings.setdefault(term, {})[memory_id] = frequency
+
+    def remove(self, memory_id):
+        terms = self._documents.pop(memory_id, None)
+        if terms is None:
+            return
+        self._total_length -= self._lengths.pop(memory_id)
+        for term in terms:
+            postings = self._postings[term]
+            del postings[memory_id]
+            if not postings:
+                del self._postings[term]
+
+    def search(self, query, top_k=8):
+        """
+        :return: Up to ``top_k`` (memory_id, score) pairs, best first. Memories
+                 sharing no terms with the query are never returned.
+        """
+        if not self._documents:
+            return []
+        document_count = len(self._documents)
+        average_length = self._total_length / document_count or 1
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (document_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for memory_id, frequency in postings.items():
+                length = self._lengths[memory_id]
+                norm = frequency + self.k1 * (1 - self.b + self.b * length / average_length)
+                scores[memory_id] = scores.get(memory_id, 0) + idf * frequency * (self.k1 + 1) / norm
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
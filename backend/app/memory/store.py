@@ -0,0 +1,457 @@
+import itertools
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+from app.config import Config
+from .backends import DEFAULT_USER, DynamoDBMemoryBackend, SQLiteMemoryBackend, content_hash
+from .expiry import INDEFINITELY, ExpiryIndex, ExpirySweeper, compute_expires_at
+from .journal import JournalMerger, MemoryJournal
+from .retrieval import MemoryIndex
+
+
+def is_memory_expired(memory, current_time):
+    expires_at = compute_expires_at(memory['timestamp'], memory['timeframe'])
+    return expires_at is not None and expires_at <= current_time.timestamp()
+
+
+class _Namespace:
+    # Cached view of one user's memories and the indexes built over them
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.lock = threading.RLock()
+        # id -> memory, in insertion order; None means reload from the backend
+        self.cache = None
+        self.hashes = set()
+        self.expiry = ExpiryIndex()
+        self.index = MemoryIndex()
+        self.version = None
+
+
+class MemoryStore:
+    """
+    Memory store with a per-user in-process cache over a pluggable backend
+    (SQLite locally, DynamoDB when memories are shared across nodes).
+
+    A user's memories are only read from the backend when their cache is cold
+    or the backend's version counter for that user has moved, i.e. another
+    process wrote since we last looked. Our own writes update the cache
+    directly, so a chat turn only pays for the memories it adds.
+
+    Deduplication runs against a set of normalized content hashes. Expiry is
+    tracked with a min-heap, so reads only pop the memories that are due
+    instead of parsing every timestamp. A BM25 index over the content is kept
+    in step with the cache for ``search``.
+
+    With a ``journal``, new memories are appended to it and show up in the
+    cache straight away, while ``merge_journal`` (on the merger thread)
+    commits them to the backend in batches. Until then they are kept as
+    pending and laid over every reload.
+
+    :param backend: A MemoryBackend
+    :param max_cached_users: Number of users whose memories stay cached
+    :param journal: Optional MemoryJournal for write-behind adds
+    """
+
+    def __init__(self, backend, max_cached_users=1000, journal=None):
+        self.backend = backend
+        self.max_cached_users = max_cached_users
+        self.journal = journal
+        self._namespaces = OrderedDict()
+        self._lock = threading.Lock()
+        self._sweeper = None
+        self._merger = None
+        self._merge_lock = threading.Lock()
+        # user_id -> {id: row} journaled but not merged yet, and the sequence
+        # number of each user's latest journaled write so versions move before
+        # the merge does. The sequence is process-wide, so dropping a user's
+        # entry once everything is merged can never make a version repeat.
+        self._pending = {}
+        self._pending_writes = {}
+        self._write_sequence = itertools.count(1)
+
+    def _namespace(self, user_id):
+        with self._lock:
+            namespace = self._namespaces.get(user_id)
+            if namespace is None:
+                namespace = self._namespaces[user_id] = _Namespace(user_id)
+            self._namespaces.move_to_end(user_id)
+            while len(self._namespaces) > self.max_cached_users:
+                self._namespaces.popitem(last=False)
+            return namespace
+
+    def _refresh(self, namespace):
+        # Only reread the user's memories if somebody else wrote since the last read
+        if namespace.cache is not None and self.backend.version(namespace.user_id) == namespace.version:
+            return
+
+        rows, version = self.backend.load(namespace.user_id)
+        namespace.cache = {}
+        namespace.hashes = set()
+        namespace.index = MemoryIndex()
+        expiries = []
+        for row in rows:
+            memory = dict(row)
+            namespace.hashes.add(memory.pop('content_hash'))
+            expiries.append((memory['id'], memory.pop('expires_at')))
+            namespace.cache[memory['id']] = memory
+            namespace.index.add(memory['id'], memory['content'])
+        merged_elsewhere = []
+        for row in self._pending_rows(namespace.user_id):
+            # Journaled by this process and not in the backend yet, unless
+            # another process merged the journal in the meantime
+            if row['id'] in namespace.cache or row['content_hash'] in namespace.hashes:
+                merged_elsewhere.append(row['id'])
+                continue
+            memory = {k: v for k, v in row.items() if k not in ('content_hash', 'expires_at')}
+            namespace.hashes.add(row['content_hash'])
+            expiries.append((memory['id'], row['expires_at']))
+            namespace.cache[memory['id']] = memory
+            namespace.index.add(memory['id'], memory['content'])
+        self._discard_pending(namespace.user_id, merged_elsewhere)
+        namespace.expiry = ExpiryIndex(expiries)
+        namespace.version = version
+        logging.info(f"Loaded {len(namespace.cache)} memories for user {namespace.user_id}")
+
+    def _apply_write(self, namespace, version):
+        # Our write should have moved the version by exactly one; anything
+        # else means another process wrote too, so resync on the next read
+        expected = namespace.version + 1
+        namespace.version = version
+        if version != expected:
+            namespace.cache = None
+            return False
+        return True
+
+    def _pop_expired(self, namespace, now):
+        # Only the memories that are due come off the heap; ids that are
+        # already gone from the cache were removed some other way
+        expired_ids = [memory_id for memory_id in namespace.expiry.pop_due(now)
+                       if memory_id in namespace.cache]
+        if not expired_ids:
+            return 0
+        version = self.backend.delete(namespace.user_id, expired_ids)
+        # Expired rows still waiting in the journal must not come back with
+        # the next merge; _merge_rows skips rows that are already due
+        self._discard_pending(namespace.user_id, expired_ids)
+        for memory_id in expired_ids:
+            memory = namespace.cache.pop(memory_id)
+            namespace.hashes.discard(content_hash(memory['content']))
+            namespace.index.remove(memory_id)
+        self._apply_write(namespace, version)
+        return len(expired_ids)
+
+    def _pending_rows(self, user_id):
+        with self._lock:
+            return list(self._pending.get(user_id, {}).values())
+
+    def _discard_pending(self, user_id, memory_ids):
+        with self._lock:
+            pending = self._pending.get(user_id)
+            if pending is None:
+                return
+            for memory_id in memory_ids:
+                pending.pop(memory_id, None)
+            if not pending:
+                del self._pending[user_id]
+                self._pending_writes.pop(user_id, None)
+
+    def _current(self, user_id):
+        # The user's namespace, refreshed and with due memories expired. Call with its lock held.
+        namespace = self._namespace(user_id)
+        self._refresh(namespace)
+        self._pop_expired(namespace, time.time())
+        if namespace.cache is None:
+            self._refresh(namespace)
+        return namespace
+
+    def load(self, user_id=DEFAULT_USER):
+        """
+        Returns every memory of ``user_id`` that has not expired yet. Memories
+        that fell due since the last call are deleted on the way out.
+        """
+        namespace = self._namespace(user_id)
+        with namespace.lock:
+            namespace = self._current(user_id)
+            return [dict(memory) for memory in namespace.cache.values()]
+
+    def search(self, query, top_k=8, user_id=DEFAULT_USER):
+        """
+        Returns the memories most relevant to ``query`` plus every memory kept
+        indefinitely, which are always worth knowing. Memories come back in
+        the order they were stored.
+        """
+        namespace = self._namespace(user_id)
+        with namespace.lock:
+            namespace = self._current(user_id)
+            selected = {memory_id for memory_id, _ in namespace.index.search(query, top_k)}
+            return [dict(memory) for memory_id, memory in namespace.cache.items()
+                    if memory_id in selected or memory['timeframe'].strip().lower() == INDEFINITELY]
+
+    def version(self, user_id=DEFAULT_USER):
+        """
+        Changes whenever one of the user's memories is added or removed, by this process or another.
+        """
+        namespace = self._namespace(user_id)
+        with namespace.lock:
+            version = self._current(user_id).version
+        with self._lock:
+            if user_id in self._pending:
+                return f"{version}+{self._pending_writes[user_id]}"
+        return version
+
+    def stats(self):
+        # Size of the in-process cache, read by the /metrics gauges
+        with self._lock:
+            namespaces = list(self._namespaces.values())
+        return {"cached_users": len(namespaces),
+                "cached_memories": sum(len(n.cache) for n in namespaces if n.cache is not None)}
+
+    def sweep(self):
+        """
+        Drops expired memories. Called by the background sweeper: due memories
+        are popped from every cached user, then the backend removes expired
+        rows nobody has cached.
+        """
+        now = time.time()
+        with self._lock:
+            namespaces = list(self._namespaces.values())
+        removed = 0
+        for namespace in namespaces:
+            with namespace.lock:
+                if namespace.cache is not None:
+                    removed += self._pop_expired(namespace, now)
+        for user_id in self.backend.delete_expired(now):
+            # Rows we did not know about were removed, so resync
+            with self._lock:
+                namespace = self._namespaces.get(user_id)
+            if namespace is not None:
+                namespace.cache = None
+        return removed
+
+    def start_sweeper(self, interval=60):
+        with self._lock:
+            if self._sweeper is None:
+                self._sweeper = ExpirySweeper(self, interval).start()
+            return self._sweeper
+
+    def start_merger(self, interval=1.0):
+        with self._lock:
+            if self._merger is None and self.journal is not None:
+                self._merger = JournalMerger(self, interval).start()
+            return self._merger
+
+    def merge_journal(self, batch_size=1000):
+        """
+        Commits journaled memories to the backend, including any a previous
+        run left in the journal. Inserts are idempotent, so a batch that was
+        partly merged before a crash is simply merged again.
+
+        :return: Number of journaled memories merged
+        """
+        if self.journal is None:
+            return 0
+        merged = 0
+        with self._merge_lock:
+            remaining = self.journal.claim()
+            try:
+                while remaining:
+                    path = remaining[0]
+                    by_user = OrderedDict()
+                    for user_id, row in self.journal.read(path):
+                        by_user.setdefault(user_id, []).append(row)
+                    for user_id, rows in by_user.items():
+                        merged += self._merge_rows(user_id, rows, batch_size)
+                    self.journal.release(path)
+                    remaining.pop(0)
+            finally:
+                # Whatever was not merged is left for the next claim
+                for path in remaining:
+                    self.journal.unclaim(path)
+        if merged:
+            logging.info(f"Merged {merged} journaled memories into the store")
+        return merged
+
+    def _merge_rows(self, user_id, rows, batch_size):
+        # Rows that fell due while they sat in the journal were already
+        # expired from the cache (or would be on the next read); don't store them
+        now = time.time()
+        due = [row['id'] for row in rows if row['expires_at'] is not None and row['expires_at'] <= now]
+        if due:
+            self._discard_pending(user_id, due)
+            rows = [row for row in rows if row['expires_at'] is None or row['expires_at'] > now]
+        in_sync = not due
+        with self._lock:
+            journaled_here = set(self._pending.get(user_id, {}))
+        versions = []
+        for start in range(0, len(rows), batch_size):
+            chunk = rows[start:start + batch_size]
+            stored, version = self.backend.insert(user_id, chunk)
+            if stored != len(chunk):
+                in_sync = False
+            if stored:
+                versions.append(version)
+        # Only now that the backend has them can reloads stop laying them over
+        self._discard_pending(user_id, [row['id'] for row in rows])
+
+        with self._lock:
+            namespace = self._namespaces.get(user_id)
+        if namespace is None:
+            return len(rows)
+        with namespace.lock:
+            if namespace.cache is None:
+                return len(rows)
+            # Rows another process journaled were never added to our cache,
+            # so moving the version past them would hide them until a reload
+            known = all(row['id'] in namespace.cache or row['id'] in journaled_here for row in rows)
+            if not in_sync or not known:
+                # Rows were already stored (replayed, or another process had
+                # the same content), expired ones were skipped, or they're new to us
+                namespace.cache = None
+                return len(rows)
+            for version in versions:
+                if not self._apply_write(namespace, version):
+                    break
+        return len(rows)
+
+    def add(self, memories, user_id=DEFAULT_USER, batch_size=1000, write_behind=True):
+        """
+        Inserts new memories for ``user_id``, skipping ones whose normalized
+        content is already stored (or repeated earlier in ``memories``).
+        Missing ids and timestamps are filled in.
+
+        ``memories`` can be any iterable, so bulk imports can stream straight
+        from a generator. Rows go to the backend in chunks of ``batch_size``
+        and each dedup check is one set lookup.
+
+        If the store has a journal and ``write_behind`` is set, the chunks are
+        appended to the journal instead and reach the backend on the next merge.
+
+        :return: The memories that were actually inserted
+        """
+        namespace = self._namespace(user_id)
+        with namespace.lock:
+            self._refresh(namespace)
+            current_time = datetime.now().isoformat()
+            inserted = []
+            batch = []
+
+            def journal():
+                self.journal.append(user_id, batch)
+                with self._lock:
+                    pending = self._pending.setdefault(user_id, {})
+                    for row in batch:
+                        pending[row['id']] = row
+                    self._pending_writes[user_id] = next(self._write_sequence)
+                for row in batch:
+                    memory = {k: v for k, v in row.items() if k not in ('content_hash', 'expires_at')}
+                    inserted.append(memory)
+                    namespace.cache[memory['id']] = memory
+                    namespace.expiry.push(memory['id'], row['expires_at'])
+                    namespace.index.add(memory['id'], memory['content'])
+                batch.clear()
+
+            def flush():
+                if self.journal is not None and write_behind:
+                    return journal()
+                stored, version = self.backend.insert(user_id, batch)
+                in_sync = namespace.cache is not None and stored == len(batch)
+                if stored and not self._apply_write(namespace, version):
+                    in_sync = False
+                for row in batch:
+                    memory = {k: v for k, v in row.items() if k not in ('content_hash', 'expires_at')}
+                    inserted.append(memory)
+                    if in_sync:
+                        namespace.cache[memory['id']] = memory
+                        namespace.expiry.push(memory['id'], row['expires_at'])
+                        namespace.index.add(memory['id'], memory['content'])
+                if not in_sync:
+                    # Another process stored some of these first; reload before going on
+                    namespace.cache = None
+                    self._refresh(namespace)
+                batch.clear()
+
+            try:
+                for memory in memories:
+                    memory_hash = content_hash(memory['content'])
+                    if memory_hash in namespace.hashes:
+                        continue
+                    namespace.hashes.add(memory_hash)
+                    timestamp = memory.get('timestamp') or current_time
+                    batch.append({
+                        "id": memory.get('id') or str(uuid.uuid4()),
+                        "timeframe": memory['timeframe'],
+                        "content": memory['content'],
+                        "timestamp": timestamp,
+                        "content_hash": memory_hash,
+                        "expires_at": compute_expires_at(timestamp, memory['timeframe']),
+                    })
+                    if len(batch) >= batch_size:
+                        flush()
+                if batch:
+                    flush()
+            except Exception:
+                # The hash set may now be ahead of the backend
+                namespace.cache = None
+                raise
+            return inserted
+
+    def import_legacy_json(self, path, user_id=DEFAULT_USER):
+        # One-off import of the old memories.json file into an empty namespace
+        if not path or self.backend.count(user_id):
+            return
+        try:
+            with open(path, 'r') as f:
+                legacy_memories = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        if legacy_memories:
+            # Straight to the backend, the check above must see them in other processes
+            self.add(legacy_memories, user_id=user_id, write_behind=False)
+            logging.info(f"Imported {len(legacy_memories)} memories from {path}")
+
+    def close(self):
+        if self._sweeper is not None:
+            self._sweeper.stop()
+        if self._merger is not None:
+            self._merger.stop()
+        self.merge_journal()
+        self.backend.close()
+
+
+def create_memory_backend():
+    if Config.MEMORY_BACKEND == 'dynamodb':
+        import boto3
+
+        dynamo_db = boto3.resource('dynamodb', endpoint_url=Config.DYNAMODB_ENDPOINT_URL or None)
+        return DynamoDBMemoryBackend(dynamo_db, Config.MEMORY_DYNAMODB_TABLE,
+                                     version_ttl=Config.MEMORY_DYNAMODB_VERSION_TTL)
+    return SQLiteMemoryBackend(Config.MEMORY_DB_PATH)
+
+
+_memory_store = None
+_memory_store_lock = threading.Lock()
+
+
+def get_memory_store():
+    # The store is created on first use so importing this module stays cheap
+    global _memory_store
+    if _memory_store is None:
+        with _memory_store_lock:
+            if _memory_store is None:
+                journal = None
+                if Config.MEMORY_JOURNAL_PATH:
+                    journal = MemoryJournal(Config.MEMORY_JOURNAL_PATH, fsync=Config.MEMORY_JOURNAL_FSYNC)
+                store = MemoryStore(create_memory_backend(),
+                                    max_cached_users=Config.MEMORY_MAX_CACHED_USERS,
+                                    journal=journal)
+                # Replay whatever a previous run journaled but never merged
+                store.merge_journal()
+                store.import_legacy_json(Config.MEMORY_LEGACY_JSON_PATH)
+                _memory_store = store
+    return _memory_store
@@ -0,0 +1,8 @@
+# Instrumentation for the hot paths: per-stage timers, request ids, LLM
+# token and AWS call counters, exposed in Prometheus format on /metrics,
+# and a sampling profiler that can be switched on per request.
+from .instruments import (RequestContext, begin_request, current_request, current_request_id, end_request,
+                          record_llm_tokens, record_request, stage, track_memory_store)
+from .aws import instrument_client
+from .profiler import SamplingProfiler, finish_profile, start_profile
+from .web import PROFILE_HEADER, REQUEST_ID_HEADER, init_request_metrics, metrics_view, profiling_requested
@@ -0,0 +1,85 @@
+import threading
+import weakref
+
+from .instruments import AWS_BYTES, AWS_CALLS
+
+# Where the request body size waits in the call context until the call is counted
+_SENT_BYTES = 'waifu_sent_bytes'
+
+_instrumented = weakref.WeakSet()
+_instrumented_lock = threading.Lock()
+
+
+def _operation(event_name):
+    # Event names look like 'after-call.s3.GetObject'
+    parts = event_name.split('.')
+    return parts[2] if len(parts) > 2 else 'unknown'
+
+
+def _content_length(headers, *names):
+    for name in names:
+        try:
+            value = int(headers.get(name) or 0)
+        except (TypeError, ValueError):
+            continue
+        if value:
+            return value
+    return 0
+
+
+def instrument_client(client):
+    """
+    Counts the calls a boto3 client makes and the body bytes it sends and
+    receives, through botocore's event hooks. Calls and bytes are counted
+    once per call, however many retries it took: every attempt notes its
+    body size in the call's context, and the last one is counted when the
+    call finishes. Sizes come from headers where possible, so streamed
+    bodies are never read here.
+
+    Safe to call more than once for the same client.
+
+    :param client: boto3 client (``resource.meta.client`` for resources)
+    """
+    # Imported here so the metrics package doesn't load botocore for chat-only workers
+    from botocore.utils import determine_content_length
+
+    with _instrumented_lock:
+        if client in _instrumented:
+            return client
+        _instrumented.add(client)
+    service = client.meta.service_model.service_name
+
+    def on_request(request, **kwargs):
+        # Fires for every attempt; a retry overwrites the size rather than adding to it
+        context = getattr(request, 'context', None)
+        if context is None:
+            return
+        # Checksummed S3 uploads are sent aws-chunked, with the payload size in its own header
+        sent = _content_length(request.headers, 'X-Amz-Decoded-Content-Length', 'Content-Length')
+        if not sent and request.body:
+            sent = determine_content_length(request.body) or 0
+        context[_SENT_BYTES] = sent
+
+    def count_sent(operation, context):
+        sent = context.pop(_SENT_BYTES, 0) if context is not None else 0
+        if sent:
+            AWS_BYTES.labels(service=service, operation=operation, direction='sent').inc(sent)
+
+    def on_response(http_response, event_name, context=None, **kwargs):
+        operation = _operation(event_name)
+        AWS_CALLS.labels(service=service, operation=operation, status=str(http_response.status_code)).inc()
+        count_sent(operation, context)
+        received = _content_length(http_response.headers, 'Content-Length')
+        if received:
+            AWS_BYTES.labels(service=service, operation=operation, direction='received').inc(received)
+
+    def on_error(event_name, context=None, **kwargs):
+        operation = _operation(event_name)
+        AWS_CALLS.labels(service=service, operation=operation, status='error').inc()
+        count_sent(operation, context)
+
+    events = client.meta.events
+    events.register('request-created', on_request)
+    events.register('after-call', on_response)
+    events.register('after-call-error', on_error)
+    return client
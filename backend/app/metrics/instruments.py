@@ -0,0 +1,117 @@
+import re
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from prometheus_client import Counter, Gauge, Histogram
+
+# Seconds; fine at the low end for cache hits, up to the LLM deadline at the top
+LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60)
+
+STAGE_SECONDS = Histogram('waifu_stage_duration_seconds',
+                          'Time spent in each stage of a chat turn',
+                          ['stage'], buckets=LATENCY_BUCKETS)
+REQUEST_SECONDS = Histogram('waifu_request_duration_seconds',
+                            'Time to serve a request, until the last byte for streams',
+                            ['route', 'method'], buckets=LATENCY_BUCKETS)
+REQUESTS = Counter('waifu_requests_total', 'Requests served', ['route', 'method', 'status'])
+
+LLM_TOKENS = Counter('waifu_llm_tokens_total',
+                     'Tokens sent to (in) and received from (out) the language model',
+                     ['model', 'direction'])
+LLM_CALLS = Counter('waifu_llm_calls_total', 'Model calls by outcome', ['model', 'outcome'])
+LLM_RETRIES = Counter('waifu_llm_retries_total', 'Model call attempts that were retried')
+
+MEMORY_STORE_USERS = Gauge('waifu_memory_store_cached_users', 'Users whose memories are cached in this process')
+MEMORY_STORE_MEMORIES = Gauge('waifu_memory_store_cached_memories', 'Memories cached in this process')
+
+AWS_CALLS = Counter('waifu_aws_calls_total', 'AWS API calls by HTTP status (error when no response came back)',
+                    ['service', 'operation', 'status'])
+AWS_BYTES = Counter('waifu_aws_bytes_total', 'Request and response body bytes of AWS API calls',
+                    ['service', 'operation', 'direction'])
+
+LOG_RECORDS_DROPPED = Counter('waifu_log_records_dropped_total',
+                              'Log records dropped by sampling or because the log queue was full', ['reason'])
+
+# Incoming ids are only trusted if they look like an id, since they end up in logs and headers
+_REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._:-]{1,128}$')
+
+
+class RequestContext:
+    """
+    What instrumentation knows about the request being served: its id and
+    how long each stage took. Shared with worker threads through a
+    context variable, so ``stage`` records into it from anywhere.
+    """
+
+    def __init__(self, request_id):
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.timings = {}
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        # Server-Timing header value, durations in milliseconds
+        return ', '.join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.timings.items())
+
+
+_current_request = ContextVar('waifu_request', default=None)
+
+
+def begin_request(incoming_id=None):
+    """
+    :param incoming_id: X-Request-ID sent by the client or a proxy, kept if valid
+    :return: (RequestContext, token for ``end_request``)
+    """
+    if incoming_id and _REQUEST_ID_PATTERN.match(incoming_id):
+        request_id = incoming_id
+    else:
+        request_id = uuid.uuid4().hex
+    context = RequestContext(request_id)
+    return context, _current_request.set(context)
+
+
+def end_request(token):
+    _current_request.reset(token)
+
+
+def current_request():
+    return _current_request.get()
+
+
+def current_request_id():
+    context = _current_request.get()
+    return context.request_id if context is not None else None
+
+
+@contextmanager
+def stage(name):
+    # Times the block into the stage histogram and the current request's timings
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.labels(stage=name).observe(elapsed)
+        context = _current_request.get()
+        if context is not None:
+            context.timings[name] = context.timings.get(name, 0) + elapsed
+
+
+def record_llm_tokens(model, tokens_in, tokens_out):
+    LLM_TOKENS.labels(model=model, direction='in').inc(tokens_in)
+    LLM_TOKENS.labels(model=model, direction='out').inc(tokens_out)
+
+
+def record_request(route, method, status, seconds):
+    REQUESTS.labels(route=route, method=method, status=str(status)).inc()
+    REQUEST_SECONDS.labels(route=route, method=method).observe(seconds)
+
+
+def track_memory_store(get_store):
+    # The gauges read the store's cache when scraped, so nothing is counted on the hot path
+    MEMORY_STORE_USERS.set_function(lambda: get_store().stats()['cached_users'])
+    MEMORY_STORE_MEMORIES.set_function(lambda: get_store().stats()['cached_memories'])
@@ -0,0 +1,122 @@
+import logging
+import os
+import sys
+import threading
+from collections import Counter
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler for deep dives into single requests. A background
+    thread snapshots the stacks of the profiled threads every ``interval``
+    seconds and counts identical stacks, so the profiled code runs at full
+    speed between samples.
+
+    The result is in collapsed-stack format (``frame;frame;frame count``),
+    which flamegraph.pl, speedscope and most flame graph tools read.
+
+    :param thread_ids: Threads to sample, None for every thread but the sampler's own
+    :param interval: Seconds between samples
+    :param max_depth: Innermost frames kept per stack
+    """
+
+    def __init__(self, thread_ids=None, interval=0.005, max_depth=64):
+        self.thread_ids = set(thread_ids) if thread_ids is not None else None
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _stack(self, frame):
+        labels = []
+        while frame is not None and len(labels) < self.max_depth:
+            labels.append(_frame_label(frame))
+            frame = frame.f_back
+        labels.reverse()
+        return labels
+
+    def _sample(self):
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                continue
+            stack = self._stack(frame)
+            if self.thread_ids is None:
+                # Sampling every thread, so say which one the stack came from
+                stack.insert(0, names.get(thread_id, str(thread_id)))
+            self.stacks[';'.join(stack)] += 1
+        self.samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self
+
+    def collapsed(self):
+        return [f"{stack} {count}" for stack, count in self.stacks.most_common()]
+
+    def hottest(self, top=5):
+        # Functions most often on top of the stack, i.e. where the time was actually spent
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        return leaves.most_common(top)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            f.write('\n'.join(self.collapsed()) + '\n')
+        return path
+
+
+# One profile at a time: sampling is cheap but not free, and several
+# overlapping whole-process profiles would only blur each other
+_profiling = threading.Lock()
+
+
+def start_profile(thread_ids=None, interval=0.005):
+    """
+    :return: A running SamplingProfiler, or None if another profile is already running
+    """
+    if not _profiling.acquire(blocking=False):
+        logging.warning("Profiling already in progress, not profiling this request")
+        return None
+    try:
+        return SamplingProfiler(thread_ids, interval).start()
+    except BaseException:
+        _profiling.release()
+        raise
+
+
+def finish_profile(profiler, directory, request_id):
+    """
+    Stops the profiler and writes ``<request_id>.folded`` to ``directory``.
+
+    :return: Path of the profile
+    """
+    try:
+        profiler.stop()
+        path = profiler.save(os.path.join(directory, f"{request_id}.folded"))
+    finally:
+        _profiling.release()
+    hottest = ', '.join(f"{label} x{count}" for label, count in profiler.hottest())
+    logging.info(f"Profile for request {request_id}: {profiler.samples} samples in {path}; hottest: {hottest}")
+    return path
@@ -0,0 +1,70 @@
+import os
+import threading
+
+from flask import Response, g, request
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest, multiprocess
+
+from app.config import Config
+from .instruments import begin_request, end_request, record_request
+from .profiler import finish_profile, start_profile
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+PROFILE_HEADER = 'X-Profile'
+
+
+def profiling_requested(header_value):
+    # Only honoured when profiling is switched on in the config
+    return Config.PROFILER_ENABLED and (header_value or '').lower() in ('1', 'true', 'yes')
+
+
+def metrics_view():
+    # Gunicorn workers each have their own counters; with PROMETHEUS_MULTIPROC_DIR
+    # set they share them through files and the scrape adds them up
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+
+def _before_request():
+    g.request_metrics, g.request_metrics_token = begin_request(request.headers.get(REQUEST_ID_HEADER))
+    g.profiler = None
+    if profiling_requested(request.headers.get(PROFILE_HEADER)):
+        g.profiler = start_profile([threading.get_ident()], Config.PROFILER_INTERVAL)
+
+
+def _after_request(response):
+    context = g.get('request_metrics')
+    if context is not None:
+        response.headers[REQUEST_ID_HEADER] = context.request_id
+        # Streams are still running here, so only complete responses get timings
+        if context.timings:
+            response.headers['Server-Timing'] = context.server_timing()
+    g.response_status = response.status_code
+    return response
+
+
+def _teardown_request(error=None):
+    # Runs after a streamed body has been sent, so streams are timed to the last byte
+    context = g.get('request_metrics')
+    if context is None:
+        return
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    status = g.get('response_status', 500)
+    record_request(route, request.method, status, context.elapsed())
+    if g.get('profiler') is not None:
+        finish_profile(g.profiler, Config.PROFILER_DIR, context.request_id)
+    end_request(g.request_metrics_token)
+
+
+def init_request_metrics(application):
+    """
+    Gives every request an id (taken from X-Request-ID when the caller sent
+    one, and echoed back), times it, and profiles it when asked to with an
+    ``X-Profile: 1`` header and PROFILER_ENABLED is set.
+    """
+    application.before_request(_before_request)
+    application.after_request(_after_request)
+    application.teardown_request(_teardown_request)
@@ -1,83 +1,97 @@
 import logging
-import os
-from flask import Blueprint, Flask, abort, jsonify, request
-from werkzeug.utils import secure_filename
-from dotenv import load_dotenv
-from openai import OpenAI
+from flask import Response, jsonify, request, stream_with_context
 
-from app.chatbotPlayground import load_memories, save_memories, prune_expired_memories
+from app.chat.turns import (CHAT_MODEL, SSE_HEADERS, complete_turn, prepare_turn, sse_event,
+                            stream_known_reply)
+from app.chatbotPlayground import load_memories
+from app.llm import LLMOverloadedError, LLMTimeoutError
+from app.memory import DEFAULT_USER, RememberTagParser, extract_memories
+from app.metrics import stage
+from app.services import get_service
 from . import chat_api_bp  # Import the Blueprint
-from app.ai_waifu_prompt import AI_WAIFU_PROMPT
-import uuid
-from datetime import datetime
 
-logging.basicConfig(level=logging.INFO)
-
-# Load environment variables and set up OpenAI client
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 @chat_api_bp.route('/chat', methods=['POST'])
 def chat():
     data = request.json
     user_input = data.get('message')
-    conversation_history = data.get('conversation_history', [])
 
     if not user_input:
         return jsonify({"error": "No message provided"}), 400
-
-    memories = load_memories()
-    simplified_memories = [f"{m['timestamp'].split('T')[0]}: {m['content']}" for m in memories]
-    
-    conversation_history.append({"role": "user", "content": user_input})
     
     try:
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": AI_WAIFU_PROMPT},
-                {"role": "system", "content": f"Current memories: {simplified_memories}"}
-            ] + conversation_history
-        )
-        
-        assistant_reply = response.choices[0].message.content
+        turn = prepare_turn(data, request.remote_addr)
+        if turn.body is not None:
+            return jsonify(turn.body)
+
+        with stage('llm'):
+            reply = get_service('llm').complete(turn.messages, model=CHAT_MODEL)
         
-        new_memories = []
-        if "<REMEMBER THIS FOR" in assistant_reply:
-            memory_parts = assistant_reply.split("<REMEMBER THIS FOR ", 1)[1].split(">", 1)
-            if len(memory_parts) == 2:
-                timeframe, content = memory_parts[0].split(":", 1)
-                new_memory = {
-                    "id": str(uuid.uuid4()),
-                    "timeframe": timeframe.strip(),
-                    "content": content.strip(),
-                    "timestamp": datetime.now().isoformat()
-                }
-                new_memories.append(new_memory)
-                assistant_reply = memory_parts[1].strip()
-                logging.info(f"New memory created: {new_memory}")
-
-        # Save new memories
-        if new_memories:
-            save_memories(new_memories)
-
-        # Log the user input and assistant reply
-        logging.info(f"User input: {user_input}")
-        logging.info(f"Assistant reply: {assistant_reply}")
-        logging.info(f"Conversation history: {conversation_history}")
-
-        conversation_history.append({"role": "assistant", "content": assistant_reply})
-
-        return jsonify({
-            "reply": assistant_reply,
-            "conversation_history": conversation_history
-        })
+        with stage('parse'):
+            assistant_reply, new_memories = extract_memories(reply)
+        return jsonify(complete_turn(turn, assistant_reply, new_memories))
 
+    except LLMOverloadedError as e:
+        logging.error(f"Model overloaded: {str(e)}")
+        return jsonify({"error": "The chat service is busy, please try again"}), 503
+    except LLMTimeoutError as e:
+        logging.error(f"Model call timed out: {str(e)}")
+        return jsonify({"error": "The chat service took too long to answer"}), 504
     except Exception as e:
         logging.error(f"An error occurred: {str(e)}")
         return jsonify({"error": "An error occurred during the chat"}), 500
 
+
+def sse_response(events):
+    return Response(events, mimetype='text/event-stream', headers=SSE_HEADERS)
+
+
+@chat_api_bp.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Same request as /chat, but the reply is streamed back as Server-Sent Events:
+    a ``data: {"delta": ...}`` event per chunk of visible text, then a ``done``
+    event with the same body /chat would return. Memory tags are held back
+    from the stream and saved once the reply is complete.
+    """
+    data = request.json
+    user_input = data.get('message')
+
+    if not user_input:
+        return jsonify({"error": "No message provided"}), 400
+
+    def generate():
+        parser = RememberTagParser()
+        reply_parts = []
+        try:
+            turn = prepare_turn(data, request.remote_addr)
+            if turn.body is not None:
+                yield from stream_known_reply(turn.body)
+                return
+
+            # Tags are parsed as the reply streams in, so that time counts towards the llm stage
+            with stage('llm'):
+                for delta in get_service('llm').stream(turn.messages, model=CHAT_MODEL):
+                    visible = parser.feed(delta)
+                    if visible:
+                        reply_parts.append(visible)
+                        yield sse_event({"delta": visible})
+
+            tail = parser.close()
+            if tail:
+                reply_parts.append(tail)
+                yield sse_event({"delta": tail})
+
+            assistant_reply = ''.join(reply_parts).strip()
+            yield sse_event(complete_turn(turn, assistant_reply, parser.memories), event="done")
+
+        except Exception as e:
+            logging.error(f"An error occurred: {str(e)}")
+            yield sse_event({"error": "An error occurred during the chat"}, event="error")
+
+    return sse_response(stream_with_context(generate()))
+
 @chat_api_bp.route('/memories', methods=['GET'])
 def get_memories():
-    memories = load_memories()
-    return jsonify(memories)
\ No newline at end of file
+    memories = load_memories(request.args.get('user_id') or DEFAULT_USER)
+    return jsonify(memories)
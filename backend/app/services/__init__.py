@@ -1,2 +1,17 @@
-from .dynamo_db import DynamoDB
-from .s3 import S3
+# Services for the media side of the app (S3, DynamoDB, rendering). They
+# pull in boto3 and moviepy, so they are only imported when first used:
+# through the registry create_app() sets up, or by name from this package.
+import importlib
+
+from .registry import ServiceRegistry, create_service_registry, get_service
+
+_LAZY = {
+    'DynamoDB': '.dynamo_db',
+    'S3': '.s3',
+}
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        return getattr(importlib.import_module(_LAZY[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
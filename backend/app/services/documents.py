@@ -0,0 +1,216 @@
+import gzip
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+from botocore.exceptions import ClientError
+
+from app.config import Config
+
+try:
+    import orjson
+except ImportError:  # Falls back to the stdlib codec, just slower
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:  # zstd documents can't be written or read without it
+    zstandard = None
+
+
+class DocumentConflict(Exception):
+    # A conditional write lost against a concurrent writer
+    pass
+
+
+def encode_json(document):
+    if orjson is not None:
+        # Integer keys (e.g. segment indexes) become strings, as they do with json
+        return orjson.dumps(document, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(document, separators=(',', ':')).encode('utf-8')
+
+
+def decode_json(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def compress(data, encoding):
+    """
+    :param encoding: None, 'gzip' or 'zstd'; zstd falls back to gzip when
+                     the zstandard package isn't installed
+    :return: (compressed bytes, Content-Encoding value or None)
+    """
+    if not encoding:
+        return data, None
+    if encoding == 'zstd':
+        if zstandard is not None:
+            return zstandard.ZstdCompressor(level=3).compress(data), 'zstd'
+        logging.warning("zstandard is not installed, writing the document with gzip instead")
+        encoding = 'gzip'
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=6), 'gzip'
+    raise ValueError(f"Unknown document encoding: {encoding}")
+
+
+def decompress(data, content_encoding):
+    if not content_encoding:
+        return data
+    if content_encoding == 'gzip':
+        return gzip.decompress(data)
+    if content_encoding == 'zstd':
+        if zstandard is None:
+            raise ValueError("Document is zstd encoded but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    raise ValueError(f"Unknown Content-Encoding: {content_encoding}")
+
+
+def _error_code(error):
+    return error.response.get('Error', {}).get('Code')
+
+
+class _DocumentCache:
+    # Byte-bounded LRU of (bucket, key) -> (etag, uncompressed JSON bytes)
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, cache_key):
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                self._entries.move_to_end(cache_key)
+            return entry
+
+    def set(self, cache_key, etag, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            self._discard(cache_key)
+            self._entries[cache_key] = (etag, data)
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def discard(self, cache_key):
+        with self._lock:
+            self._discard(cache_key)
+
+    def _discard(self, cache_key):
+        entry = self._entries.pop(cache_key, None)
+        if entry is not None:
+            self._size -= len(entry[1])
+
+
+_document_cache = _DocumentCache(Config.S3_DOCUMENT_CACHE_MAX_BYTES)
+
+
+class DocumentStore:
+    """
+    JSON documents in S3, optionally gzip or zstd compressed (recorded in
+    Content-Encoding, so plain JSON objects written before keep working).
+
+    Reads go through a process-wide cache: a cached document is revalidated
+    with ``IfNoneMatch`` and only downloaded again if its ETag changed.
+    Writes can be made conditional on the ETag that was read, and ``update``
+    wraps that into a read-modify-write loop so concurrent writers don't
+    overwrite each other's changes.
+
+    Documents come back freshly parsed on every call, so callers can modify
+    them without touching the cache.
+
+    :param s3: boto3 S3 client
+    :param encoding: Default encoding for writes: None, 'gzip' or 'zstd'
+    """
+
+    def __init__(self, s3, encoding=None):
+        self.s3 = s3
+        self.encoding = encoding
+
+    def get(self, bucket_name, object_key):
+        """
+        :return: (document, etag)
+        :raises KeyError: If the object does not exist
+        """
+        cache_key = (bucket_name, object_key)
+        cached = _document_cache.get(cache_key)
+        request = {'Bucket': bucket_name, 'Key': object_key}
+        if cached is not None:
+            request['IfNoneMatch'] = cached[0]
+
+        try:
+            response = self.s3.get_object(**request)
+        except ClientError as e:
+            code = _error_code(e)
+            if cached is not None and code in ('304', 'NotModified'):
+                return decode_json(cached[1]), cached[0]
+            if code in ('NoSuchKey', '404'):
+                _document_cache.discard(cache_key)
+                raise KeyError(object_key) from e
+            raise
+
+        data = decompress(response['Body'].read(), response.get('ContentEncoding'))
+        etag = response['ETag']
+        _document_cache.set(cache_key, etag, data)
+        return decode_json(data), etag
+
+    def put(self, bucket_name, object_key, document, encoding=None, if_match=None, if_none_match=None):
+        """
+        Writes a document, compressed with ``encoding`` (or the store's default).
+
+        :param if_match: Only write if the object still has this ETag
+        :param if_none_match: '*' to only write if the object doesn't exist yet
+        :return: The new ETag
+        :raises DocumentConflict: If the condition failed
+        """
+        data = encode_json(document)
+        body, content_encoding = compress(data, encoding if encoding is not None else self.encoding)
+        request = {'Bucket': bucket_name, 'Key': object_key, 'Body': body, 'ContentType': 'application/json'}
+        if content_encoding:
+            request['ContentEncoding'] = content_encoding
+        if if_match:
+            request['IfMatch'] = if_match
+        if if_none_match:
+            request['IfNoneMatch'] = if_none_match
+
+        cache_key = (bucket_name, object_key)
+        try:
+            response = self.s3.put_object(**request)
+        except ClientError as e:
+            if _error_code(e) in ('PreconditionFailed', 'ConditionalRequestConflict', '412', '409'):
+                _document_cache.discard(cache_key)
+                raise DocumentConflict(f"{object_key} was changed by another writer") from e
+            raise
+
+        _document_cache.set(cache_key, response['ETag'], data)
+        return response['ETag']
+
+    def update(self, bucket_name, object_key, change, encoding=None, max_attempts=5):
+        """
+        Read-modify-write: ``change(document)`` returns the new document
+        (``document`` is None if the object doesn't exist yet). It is rerun
+        on the fresh document whenever another writer got in first.
+
+        :return: (new document, new etag)
+        """
+        for attempt in range(max_attempts):
+            try:
+                document, etag = self.get(bucket_name, object_key)
+            except KeyError:
+                document, etag = None, None
+            new_document = change(document)
+            try:
+                if etag is None:
+                    new_etag = self.put(bucket_name, object_key, new_document, encoding, if_none_match='*')
+                else:
+                    new_etag = self.put(bucket_name, object_key, new_document, encoding, if_match=etag)
+                return new_document, new_etag
+            except DocumentConflict:
+                logging.info(f"Retrying update of {object_key} after a concurrent write ({attempt + 1}/{max_attempts})")
+        raise DocumentConflict(f"Gave up updating {object_key} after {max_attempts} attempts")
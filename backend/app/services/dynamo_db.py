@@ -1,32 +1,236 @@
 import json
 import logging
+import threading
+import time
+from collections import OrderedDict
 
 import boto3
 from botocore.exceptions import ClientError
 
-logging.basicConfig(level=logging.INFO)
+from app.metrics import instrument_client
+
+# BatchGetItem takes at most 100 keys per call
+BATCH_GET_SIZE = 100
+
+
+class UnprocessedKeysError(Exception):
+    """
+    BatchGetItem still left keys unprocessed after every retry, so the
+    result would be incomplete. ``items`` holds what was fetched and
+    ``unprocessed_keys`` what wasn't, for callers that can use a partial answer.
+    """
+
+    def __init__(self, message, items, unprocessed_keys):
+        super().__init__(message)
+        self.items = items
+        self.unprocessed_keys = unprocessed_keys
+
+
+class _TTLCache:
+    # Small thread-safe LRU whose entries expire after ``ttl`` seconds
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, predicate):
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
 
 class DynamoDB:
-    def __init__(self, 
-                 dynamo_db: boto3.resource):
+    def __init__(self,
+                 dynamo_db: boto3.resource,
+                 table_name: str = 'projects',
+                 sort_key: str = 'project_id',
+                 cache_ttl: float = 60,
+                 cache_max_entries: int = 1000):
+        """
+        :param dynamo_db: boto3 DynamoDB resource
+        :param table_name: Table holding the projects, partitioned by user_id
+        :param sort_key: Name of the table's sort key, used by batch_get_projects
+        :param cache_ttl: Seconds get_projects results are served from memory, 0 disables the cache
+        :param cache_max_entries: Number of (user, projection) results kept cached
+        """
         # Initialize the DynamoDB client
         self.dynamo_db = dynamo_db
-        self.table = self.dynamo_db.Table('projects')
+        instrument_client(dynamo_db.meta.client)
+        self.table = self.dynamo_db.Table(table_name)
+        self.sort_key = sort_key
+        self._cache = _TTLCache(cache_ttl, cache_max_entries) if cache_ttl > 0 else None
         logging.info("DynamoDB created")
 
-    def get_projects(self, user_id):
+    @staticmethod
+    def _projection_args(projection):
+        # Attribute names go through placeholders so reserved words like "name" work
+        if not projection:
+            return {}
+        names = {f"#p{i}": attribute for i, attribute in enumerate(projection)}
+        return {
+            'ProjectionExpression': ', '.join(names),
+            'ExpressionAttributeNames': names,
+        }
+
+    def iter_project_pages(self,
+                           user_id,
+                           projection=None,
+                           page_size=None):
+        """
+        Yields the user's projects one query page at a time, following
+        LastEvaluatedKey so results past DynamoDB's 1 MB page limit are not
+        dropped. Raises ClientError.
+
+        :param user_id: Partition key of the projects to read
+        :param projection: Optional list of attributes to fetch instead of whole items
+        :param page_size: Optional Limit on the items evaluated per query call
+        """
+        query_args = {
+            'KeyConditionExpression': boto3.dynamodb.conditions.Key('user_id').eq(user_id),
+            **self._projection_args(projection),
+        }
+        if page_size:
+            query_args['Limit'] = page_size
+
+        while True:
+            response = self.table.query(**query_args)
+            yield response.get('Items', [])
+            if 'LastEvaluatedKey' not in response:
+                return
+            query_args['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def iter_projects(self,
+                      user_id,
+                      projection=None,
+                      page_size=None,
+                      limit=None):
+        """
+        Yields the user's projects item by item, reading pages lazily.
+
+        :param limit: Optional maximum number of items to yield; no further pages are read past it
+        """
+        count = 0
+        for page in self.iter_project_pages(user_id, projection, page_size):
+            for item in page:
+                if limit is not None and count >= limit:
+                    return
+                yield item
+                count += 1
+
+    def get_projects(self,
+                     user_id,
+                     projection=None,
+                     use_cache=True):
+        """
+        Returns all of the user's projects. Results are cached for
+        ``cache_ttl`` seconds; call ``invalidate_projects`` after writing to
+        the table.
+
+        :param projection: Optional list of attributes to fetch instead of whole items
+        :param use_cache: Set to False to always read from the table
+        """
+        cache_key = (user_id, tuple(projection) if projection else None)
+        if use_cache and self._cache is not None:
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                return [dict(item) for item in cached]
+
         try:
             # Query the table for items with the specified user_id
-            response = self.table.query(
-                KeyConditionExpression=boto3.dynamodb.conditions.Key('user_id').eq(user_id)
-            )
-            # Check if items were found
-            if 'Items' in response and response['Items']:
-                logging.info(f"Projects found for user_id {user_id}: {response['Items']}")
-                return response['Items']
-            else:
-                logging.info(f"No projects found for user_id {user_id}")
-                return []
+            items = [item for page in self.iter_project_pages(user_id, projection) for item in page]
         except ClientError as e:
             logging.error(f"An error occurred: {e.response['Error']['Message']}")
-            return []
\ No newline at end of file
+            return []
+
+        # Only the count is logged; project payloads can be large
+        if items:
+            logging.info(f"Found {len(items)} projects for user_id {user_id}")
+        else:
+            logging.info(f"No projects found for user_id {user_id}")
+
+        if self._cache is not None:
+            self._cache.set(cache_key, items)
+        return [dict(item) for item in items]
+
+    def batch_get_projects(self,
+                           user_id,
+                           project_ids,
+                           projection=None,
+                           max_retries=5):
+        """
+        Fetches many of the user's projects by id with BatchGetItem, 100 keys
+        per call, retrying unprocessed keys with exponential backoff.
+        Projects that don't exist are left out of the result. Nothing is
+        cached, and the result is never partial: errors are raised instead.
+
+        :param project_ids: Values of the table's sort key
+        :return: List of items, in no particular order
+        :raises ClientError: A BatchGetItem call failed
+        :raises UnprocessedKeysError: Keys were still unprocessed after ``max_retries`` retries
+        """
+        table_name = self.table.name
+        keys = [{'user_id': user_id, self.sort_key: project_id}
+                for project_id in dict.fromkeys(project_ids)]
+        items = []
+        unprocessed = []
+
+        for start in range(0, len(keys), BATCH_GET_SIZE):
+            request = {table_name: {'Keys': keys[start:start + BATCH_GET_SIZE],
+                                    **self._projection_args(projection)}}
+            attempt = 0
+            while request:
+                try:
+                    response = self.dynamo_db.batch_get_item(RequestItems=request)
+                except ClientError as e:
+                    logging.error(f"Fetching projects for user_id {user_id} failed after {len(items)} "
+                                  f"of {len(keys)}: {e.response['Error']['Message']}")
+                    raise
+                items.extend(response.get('Responses', {}).get(table_name, []))
+                request = response.get('UnprocessedKeys') or None
+                if request:
+                    if attempt >= max_retries:
+                        unprocessed.extend(request[table_name]['Keys'])
+                        break
+                    time.sleep(min(0.05 * 2 ** attempt, 2))
+                    attempt += 1
+
+        if unprocessed:
+            logging.error(f"Gave up on {len(unprocessed)} unprocessed project keys for user_id {user_id}")
+            raise UnprocessedKeysError(f"{len(unprocessed)} of {len(keys)} project keys were not processed",
+                                       items, unprocessed)
+        logging.info(f"Fetched {len(items)} of {len(keys)} requested projects for user_id {user_id}")
+        return items
+
+    def invalidate_projects(self, user_id=None):
+        # Drop cached get_projects results for one user, or for everyone
+        if self._cache is None:
+            return
+        if user_id is None:
+            self._cache.clear()
+        else:
+            self._cache.discard(lambda key: key[0] == user_id)
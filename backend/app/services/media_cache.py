@@ -0,0 +1,279 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from botocore.exceptions import ClientError
+
+from app.config import Config
+from app.logs import log_event
+
+try:
+    import fcntl
+except ImportError:  # No advisory file locks (Windows); pins then only hold within the process
+    fcntl = None
+
+# Attempts at fetching an object that keeps changing between its HEAD and its download
+FETCH_ATTEMPTS = 3
+# Bytes read from the response body at a time
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class MediaCache:
+    """
+    On-disk cache for media downloaded from S3, so rendering the same assets
+    again reads them from local disk instead of the bucket.
+
+    Files are content addressed by bucket, key and ETag. A fetch asks S3 for
+    the object's current ETag (a HEAD request, skipped entirely if the key
+    was checked less than ``revalidate_after`` seconds ago) and only
+    downloads when that version is not cached yet. Downloads stream straight
+    into the cache directory and are conditional on that ETag, so an object
+    overwritten in between is fetched again under its new ETag rather than
+    cached under the old one.
+
+    Every worker process on the host shares the directory, so the cache is
+    coordinated on disk rather than in memory. A file handed out with
+    ``acquire`` is pinned with a shared ``flock`` on it until ``release``,
+    and eviction only deletes files it can lock exclusively, so a clip that
+    another worker still has open is never deleted from under moviepy.
+    The total size is capped at ``max_bytes`` across all workers, least
+    recently used (oldest mtime) first; evictions are serialized through
+    ``<cache_dir>/.lock``. Without fcntl (Windows) pins only hold within
+    the process.
+
+    :param cache_dir: Directory the cached files live in
+    :param max_bytes: Size cap for the whole cache
+    :param revalidate_after: Seconds a key's ETag is trusted without asking S3 again
+    """
+
+    def __init__(self, cache_dir, max_bytes=2 * 1024 ** 3, revalidate_after=60):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.revalidate_after = revalidate_after
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock_path = os.path.join(cache_dir, '.lock')
+
+        self._lock = threading.Lock()
+        # path -> [number of callers using it, fd holding the shared lock]
+        self._pins = {}
+        # (bucket, key) -> (etag, checked_at)
+        self._etags = {}
+        # path -> lock held while that file downloads in this process
+        self._downloads = {}
+        # Files from previous runs may already be over the cap
+        self._evict()
+
+    def _path(self, bucket_name, object_key, etag, suffix):
+        digest = hashlib.sha256(f"{bucket_name}/{object_key}/{etag}".encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, digest + suffix)
+
+    def _etag(self, s3, bucket_name, object_key):
+        now = time.monotonic()
+        with self._lock:
+            known = self._etags.get((bucket_name, object_key))
+        if known is not None and now - known[1] < self.revalidate_after:
+            return known[0]
+        etag = s3.head_object(Bucket=bucket_name, Key=object_key)['ETag'].strip('"')
+        with self._lock:
+            self._etags[(bucket_name, object_key)] = (etag, now)
+        return etag
+
+    def _files(self):
+        # [(mtime, path, size)] of the cached files, least recently used first
+        files = []
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if entry.is_file():
+                    files.append((stat.st_mtime, entry.path, stat.st_size))
+        files.sort()
+        return files
+
+    @staticmethod
+    def _remove_unpinned(path):
+        # Deletes the file unless some process holds a pin on it
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            return True
+        try:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return False
+            os.remove(path)
+            return True
+        finally:
+            os.close(fd)
+
+    def _evict(self):
+        with self._dir_locked():
+            files = self._files()
+            total = sum(size for _, _, size in files)
+            for _, path, size in files:
+                if total <= self.max_bytes:
+                    break
+                with self._lock:
+                    if path in self._pins:
+                        continue
+                if self._remove_unpinned(path):
+                    total -= size
+                    logging.info(f"Evicted {path} from the media cache")
+
+    @contextmanager
+    def _dir_locked(self):
+        if fcntl is None:
+            yield
+            return
+        fd = os.open(self._lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def _pin(self, path):
+        """
+        Pins the cached file at ``path``, also touching it for the LRU.
+
+        :return: False if it isn't cached (or was evicted before the pin took)
+        """
+        with self._lock:
+            pin = self._pins.get(path)
+            if pin is not None:
+                pin[0] += 1
+                return True
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            return False
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_SH)
+            # An eviction may have deleted the file while we waited for the lock
+            if os.fstat(fd).st_ino != os.stat(path).st_ino:
+                raise FileNotFoundError(path)
+            os.utime(path)
+        except FileNotFoundError:
+            os.close(fd)
+            return False
+        with self._lock:
+            pin = self._pins.get(path)
+            if pin is None:
+                self._pins[path] = [1, fd]
+                return True
+            pin[0] += 1
+        # Another thread pinned it meanwhile; its lock covers us
+        os.close(fd)
+        return True
+
+    def acquire(self, s3, bucket_name, object_key, suffix=''):
+        """
+        Returns a local path holding the current version of the object,
+        downloading it if needed. The file stays pinned until ``release``.
+
+        :param s3: boto3 S3 client
+        :param suffix: File extension to keep, e.g. '.mp4', for tools that look at it
+        """
+        for _ in range(FETCH_ATTEMPTS):
+            etag = self._etag(s3, bucket_name, object_key)
+            try:
+                return self._fetch(s3, bucket_name, object_key, etag, suffix)
+            except ClientError as e:
+                if e.response['Error']['Code'] not in ('PreconditionFailed', '412'):
+                    raise
+            # Overwritten since its ETag was read; look it up again
+            logging.info(f"{object_key} changed while it was being fetched, retrying")
+            self.invalidate(bucket_name, object_key)
+        raise RuntimeError(f"{object_key} kept changing while it was being fetched")
+
+    def _fetch(self, s3, bucket_name, object_key, etag, suffix):
+        # The cached file for this version of the object, downloaded if needed and pinned
+        path = self._path(bucket_name, object_key, etag, suffix)
+        with self._lock:
+            download_lock = self._downloads.setdefault(path, threading.Lock())
+
+        try:
+            # Concurrent fetches of the same object in this process wait for a single download
+            with download_lock:
+                if self._pin(path):
+                    log_event('media_cache.hit', "Media cache hit", bucket=bucket_name, key=object_key)
+                    return path
+
+                fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix='.download-', suffix=suffix)
+                try:
+                    # Only the version the path is named after may be stored under it
+                    body = s3.get_object(Bucket=bucket_name, Key=object_key, IfMatch=etag)['Body']
+                    with os.fdopen(fd, 'wb') as f:
+                        fd = None
+                        for chunk in body.iter_chunks(DOWNLOAD_CHUNK_SIZE):
+                            f.write(chunk)
+                    try:
+                        # Never replaces: if another worker got there first, its file is the same object
+                        os.link(tmp_path, path)
+                    except FileExistsError:
+                        pass
+                finally:
+                    if fd is not None:
+                        os.close(fd)
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+
+                if not self._pin(path):
+                    # Evicted between the download and the pin; only under extreme pressure
+                    raise RuntimeError(f"Media cache too small to hold {object_key}")
+                logging.info(f"Downloaded {object_key} into the media cache")
+        finally:
+            with self._lock:
+                self._downloads.pop(path, None)
+        self._evict()
+        return path
+
+    def release(self, path):
+        # The caller is done with the file; it may be evicted again
+        with self._lock:
+            pin = self._pins.get(path)
+            if pin is None:
+                return
+            pin[0] -= 1
+            if pin[0] > 0:
+                return
+            del self._pins[path]
+        os.close(pin[1])
+
+    def invalidate(self, bucket_name, object_key):
+        # Forget the remembered ETag, e.g. after overwriting the object
+        with self._lock:
+            self._etags.pop((bucket_name, object_key), None)
+
+    def stats(self):
+        files = self._files()
+        with self._lock:
+            pinned = len(self._pins)
+        return {"files": len(files), "bytes": sum(size for _, _, size in files), "pinned": pinned}
+
+
+_media_cache = None
+_media_cache_lock = threading.Lock()
+
+
+def get_media_cache():
+    # Shared by every S3 wrapper in the process, created on first use
+    global _media_cache
+    if _media_cache is None:
+        with _media_cache_lock:
+            if _media_cache is None:
+                _media_cache = MediaCache(Config.MEDIA_CACHE_DIR,
+                                          max_bytes=Config.MEDIA_CACHE_MAX_BYTES,
+                                          revalidate_after=Config.MEDIA_CACHE_REVALIDATE_AFTER)
+    return _media_cache
@@ -0,0 +1,137 @@
+import logging
+import threading
+import time
+
+from flask import current_app
+
+from app.config import Config
+
+
+class ServiceRegistry:
+    """
+    Named services, each built by its factory the first time it is asked
+    for. Nothing heavy is imported until then, so a worker that only serves
+    chat never loads moviepy or boto3.
+
+    Services named in ``per_use`` are built fresh on every ``get`` instead
+    of once per process, for objects with per-job state (temp files, pinned
+    cache entries) that are meant to be used in a ``with`` block.
+
+    :param factories: Optional {name: factory} to start with
+    :param per_use: Optional names of services built on every ``get``
+    """
+
+    def __init__(self, factories=None, per_use=()):
+        self._factories = dict(factories or {})
+        self._per_use = set(per_use)
+        self._instances = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, factory, per_use=False):
+        with self._lock:
+            self._factories[name] = factory
+            self._instances.pop(name, None)
+            if per_use:
+                self._per_use.add(name)
+            else:
+                self._per_use.discard(name)
+
+    def get(self, name):
+        if name in self._per_use:
+            return self._factories[name]()
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._lock:
+            instance = self._instances.get(name)
+            if instance is None:
+                try:
+                    factory = self._factories[name]
+                except KeyError:
+                    raise KeyError(f"No service named {name}") from None
+                started = time.perf_counter()
+                instance = self._instances[name] = factory()
+                logging.info(f"Started the {name} service in {time.perf_counter() - started:.3f}s")
+            return instance
+
+    def loaded(self):
+        # Names of the services built so far
+        return sorted(self._instances)
+
+    def preload(self, names):
+        """
+        Builds the named services on a background thread, so the worker is
+        ready straight away and the first request doesn't pay for the imports.
+        """
+        def run():
+            for name in names:
+                if name in self._per_use:
+                    logging.warning(f"The {name} service is built per use and can't be preloaded")
+                    continue
+                try:
+                    self.get(name)
+                except Exception as e:
+                    logging.error(f"Preloading the {name} service failed: {str(e)}")
+
+        thread = threading.Thread(target=run, name='service-preload', daemon=True)
+        thread.start()
+        return thread
+
+
+def _llm():
+    from app.llm import get_llm_gateway
+    return get_llm_gateway()
+
+
+def _memory_store():
+    from app.memory import get_memory_store
+    return get_memory_store()
+
+
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+
+def get_s3_client():
+    """
+    The boto3 S3 client every S3 service of this process shares. Bulk
+    transfers run S3_TRANSFER_WORKERS files at once, each with up to
+    S3_MULTIPART_CONCURRENCY parts in flight, so the connection pool is sized
+    for all of them.
+    """
+    global _s3_client
+    if _s3_client is None:
+        with _s3_client_lock:
+            if _s3_client is None:
+                import boto3
+                from botocore.config import Config as BotoConfig
+                pool_size = max(10, Config.S3_TRANSFER_WORKERS * Config.S3_MULTIPART_CONCURRENCY)
+                _s3_client = boto3.client('s3', config=BotoConfig(max_pool_connections=pool_size))
+    return _s3_client
+
+
+def _s3():
+    # A fresh wrapper per job, so temp files and cache pins are scoped to it
+    from .s3 import S3
+    return S3(get_s3_client())
+
+
+def _dynamodb():
+    import boto3
+    from .dynamo_db import DynamoDB
+    return DynamoDB(boto3.resource('dynamodb', endpoint_url=Config.DYNAMODB_ENDPOINT_URL or None))
+
+
+def create_service_registry():
+    return ServiceRegistry({
+        'llm': _llm,
+        'memory_store': _memory_store,
+        's3_client': get_s3_client,
+        's3': _s3,
+        'dynamodb': _dynamodb,
+    }, per_use=('s3',))
+
+
+def get_service(name):
+    # The registry create_app() made for the current app
+    return current_app.extensions['services'].get(name)
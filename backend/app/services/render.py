@@ -0,0 +1,281 @@
+import logging
+import math
+import os
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.config import Config
+
+# Lets ffmpeg write MP4 to a pipe: the moov box goes first and every
+# keyframe starts a fragment, so nothing has to be rewritten at the end
+FRAGMENTED_MP4_FLAGS = ['-movflags', 'frag_keyframe+empty_moov+default_base_moof']
+
+
+class RenderSettings:
+    """
+    Encoder settings for rendered videos. Anything left as None falls back
+    to the RENDER_* values in Config.
+
+    :param fps: Frames per second of the output; by default the clip's own fps if it has one
+    :param preset: x264 preset, faster presets trade file size for speed
+    :param crf: x264 constant rate factor, lower is better quality
+    :param threads: Encoder threads, 0 lets ffmpeg decide
+    """
+
+    def __init__(self, fps=None, preset=None, crf=None, threads=None,
+                 codec="libx264", audio_codec="aac"):
+        self.fps = fps
+        self.preset = preset or Config.RENDER_PRESET
+        self.crf = crf if crf is not None else Config.RENDER_CRF
+        self.threads = threads if threads is not None else Config.RENDER_THREADS
+        self.codec = codec
+        self.audio_codec = audio_codec
+
+    def fps_for(self, clip):
+        return self.fps or getattr(clip, 'fps', None) or Config.RENDER_FPS
+
+    def ffmpeg_params(self):
+        return ['-crf', str(self.crf), '-pix_fmt', 'yuv420p']
+
+
+class MultipartStreamUploader:
+    """
+    Uploads a stream of unknown length to S3 as a multipart upload, sending
+    each part as soon as it has been read, with a few parts in flight at
+    once. The upload is aborted if anything fails, so no orphaned parts are
+    left behind.
+
+    :param s3: boto3 S3 client
+    :param part_size: Bytes per part, at least 5 MB (S3's minimum for all but the last part)
+    :param max_in_flight: Parts uploading at the same time
+    """
+
+    def __init__(self, s3, bucket_name, object_key, part_size=None, max_in_flight=None):
+        self.s3 = s3
+        self.bucket_name = bucket_name
+        self.object_key = object_key
+        self.part_size = max(part_size or Config.S3_MULTIPART_CHUNK_SIZE, 5 * 1024 ** 2)
+        self.max_in_flight = max_in_flight or Config.S3_MULTIPART_CONCURRENCY
+
+    def upload(self, stream, content_type='video/mp4', confirm=None):
+        """
+        :param confirm: Optional callable run once the stream has ended; the
+                        upload is only completed if it returns True. Lets the
+                        producer veto a stream that ended because it crashed.
+        :return: The number of bytes uploaded
+        """
+        upload_id = self.s3.create_multipart_upload(Bucket=self.bucket_name, Key=self.object_key,
+                                                    ContentType=content_type)['UploadId']
+        slots = threading.BoundedSemaphore(self.max_in_flight)
+        futures = []
+        total = 0
+
+        def upload_part(part_number, body):
+            try:
+                response = self.s3.upload_part(Bucket=self.bucket_name, Key=self.object_key,
+                                               UploadId=upload_id, PartNumber=part_number, Body=body)
+                return {'PartNumber': part_number, 'ETag': response['ETag']}
+            finally:
+                slots.release()
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_in_flight) as pool:
+                part_number = 1
+                while True:
+                    body = _read_exactly(stream, self.part_size)
+                    if not body:
+                        break
+                    total += len(body)
+                    # Bounds memory to max_in_flight parts
+                    slots.acquire()
+                    futures.append(pool.submit(upload_part, part_number, body))
+                    part_number += 1
+            parts = [future.result() for future in futures]
+            if not parts:
+                raise ValueError(f"Nothing was rendered for {self.object_key}")
+            if confirm is not None and not confirm():
+                raise RuntimeError(f"Upload of {self.object_key} cancelled, the stream was incomplete")
+            self.s3.complete_multipart_upload(Bucket=self.bucket_name, Key=self.object_key, UploadId=upload_id,
+                                              MultipartUpload={'Parts': parts})
+        except BaseException:
+            self.s3.abort_multipart_upload(Bucket=self.bucket_name, Key=self.object_key, UploadId=upload_id)
+            raise
+        return total
+
+
+def _read_exactly(stream, size):
+    # Pipes return short reads; keep reading until the part is full or the stream ends
+    chunks = []
+    remaining = size
+    while remaining:
+        chunk = stream.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+
+def _unblock_reader(fifo_path):
+    # Opening the write end lets a reader still waiting in open() see end of
+    # file; it fails harmlessly while no reader has the pipe open
+    try:
+        fd = os.open(fifo_path, os.O_WRONLY | os.O_NONBLOCK)
+    except OSError:
+        return
+    os.close(fd)
+
+
+def render_and_upload(clip, s3, bucket_name, object_key, temp_dir, settings=None):
+    """
+    Encodes ``clip`` and uploads it to S3 in one pass. ffmpeg writes
+    fragmented MP4 into a named pipe and the parts are uploaded while later
+    frames are still being encoded, so no full size temp file is written
+    and the upload finishes right after the encode.
+
+    Falls back to encoding a temp file and uploading it where named pipes
+    aren't available.
+
+    :param temp_dir: ScopedTempDir for the pipe and moviepy's temp audio
+    :return: Number of bytes uploaded
+    """
+    settings = settings or RenderSettings()
+    if not hasattr(os, 'mkfifo'):
+        return _render_then_upload(clip, s3, bucket_name, object_key, temp_dir, settings)
+
+    with temp_dir.file(suffix='.mp4') as fifo_path, temp_dir.file(suffix='.m4a') as audio_path:
+        os.remove(fifo_path)
+        os.mkfifo(fifo_path)
+        uploader = MultipartStreamUploader(s3, bucket_name, object_key)
+        outcome = {}
+        encoded = threading.Event()
+
+        def upload():
+            try:
+                with open(fifo_path, 'rb') as stream:
+                    # The pipe also ends when the encoder dies; only publish a finished render
+                    outcome['bytes'] = uploader.upload(
+                        stream, confirm=lambda: encoded.wait() and outcome.get('encoded', False))
+            except BaseException as e:
+                outcome['error'] = e
+
+        upload_thread = threading.Thread(target=upload, name='render-upload', daemon=True)
+        upload_thread.start()
+        try:
+            clip.write_videofile(fifo_path,
+                                 fps=settings.fps_for(clip),
+                                 codec=settings.codec,
+                                 audio_codec=settings.audio_codec,
+                                 preset=settings.preset,
+                                 threads=settings.threads or None,
+                                 ffmpeg_params=settings.ffmpeg_params() + FRAGMENTED_MP4_FLAGS,
+                                 temp_audiofile=audio_path,
+                                 remove_temp=True,
+                                 logger=None)
+            outcome['encoded'] = True
+        finally:
+            encoded.set()
+            # If the encoder failed before opening the pipe the uploader is still waiting for it
+            while upload_thread.is_alive():
+                _unblock_reader(fifo_path)
+                upload_thread.join(0.1)
+
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome['bytes']
+
+
+def _render_then_upload(clip, s3, bucket_name, object_key, temp_dir, settings):
+    with temp_dir.file(suffix='.mp4') as video_path, temp_dir.file(suffix='.m4a') as audio_path:
+        clip.write_videofile(video_path,
+                             fps=settings.fps_for(clip),
+                             codec=settings.codec,
+                             audio_codec=settings.audio_codec,
+                             preset=settings.preset,
+                             threads=settings.threads or None,
+                             ffmpeg_params=settings.ffmpeg_params(),
+                             temp_audiofile=audio_path,
+                             remove_temp=True,
+                             logger=None)
+        s3.upload_file(Filename=video_path, Bucket=bucket_name, Key=object_key)
+        return os.path.getsize(video_path)
+
+
+def is_static_image_clip(clip):
+    """
+    True for an ImageClip whose frames are all the same picture and that has
+    no audio. Time based effects replace ``make_frame``, so checking that it
+    still hands back the clip's own image tells the two apart.
+    """
+    img = getattr(clip, 'img', None)
+    if img is None or clip.audio is not None or clip.duration is None:
+        return False
+    return all(clip.make_frame(t) is img for t in (0, clip.duration / 2, clip.duration))
+
+
+def _still_frame(clip):
+    # The clip's picture as 8-bit RGB, or RGBA when it has a mask. Frames
+    # can be float arrays (e.g. after effects), which PIL won't take as is.
+    import numpy as np
+    from PIL import Image
+
+    frame = np.clip(clip.get_frame(0), 0, 255).astype('uint8')
+    if clip.mask is None:
+        return Image.fromarray(frame)
+    alpha = np.clip(clip.mask.get_frame(0) * 255, 0, 255).astype('uint8')
+    if alpha.ndim == 3:
+        alpha = alpha[:, :, 0]
+    return Image.fromarray(np.dstack([frame[:, :, :3], alpha]), 'RGBA')
+
+
+def render_static_image(clip, s3, bucket_name, object_key, temp_dir, settings=None):
+    """
+    Fast path for still images: the frame is saved once and ffmpeg decodes
+    it once and repeats it, with x264 told the picture never moves. This
+    skips moviepy generating and piping the same raw frame ``fps * duration``
+    times, and the encoder's motion search on frames that are all the same.
+    The upload goes through the same streaming multipart uploader.
+
+    :return: Number of bytes uploaded
+    """
+    from moviepy.config import get_setting
+
+    settings = settings or RenderSettings()
+    with temp_dir.file(suffix='.png') as frame_path:
+        _still_frame(clip).save(frame_path)
+        command = [
+            get_setting('FFMPEG_BINARY'), '-y', '-loglevel', 'error',
+            # The picture is decoded once and repeated up to the output frame rate
+            '-loop', '1', '-framerate', f"1/{max(1, math.ceil(clip.duration))}", '-i', frame_path,
+            '-t', str(clip.duration), '-r', str(settings.fps_for(clip)),
+            # x264 needs even dimensions
+            '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2',
+            '-c:v', settings.codec, '-preset', settings.preset, '-tune', 'stillimage',
+            # Every frame after the first is a copy, so skip the motion search
+            # and B-frames that only pay off for moving pictures
+            '-x264-params', 'bframes=0:ref=1:me=dia:subme=1',
+            '-threads', str(settings.threads),
+            *settings.ffmpeg_params(), *FRAGMENTED_MP4_FLAGS,
+            '-f', 'mp4', 'pipe:1',
+        ]
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        # Drain stderr on the side so a chatty ffmpeg can't block on a full pipe
+        stderr = []
+        stderr_thread = threading.Thread(target=lambda: stderr.append(process.stderr.read()), daemon=True)
+        stderr_thread.start()
+        try:
+            # Only complete the upload if ffmpeg exited cleanly
+            uploaded = MultipartStreamUploader(s3, bucket_name, object_key).upload(
+                process.stdout, confirm=lambda: process.wait() == 0)
+        except BaseException:
+            process.kill()
+            process.wait()
+            stderr_thread.join()
+            if process.returncode:
+                logging.error(f"ffmpeg failed rendering {object_key}: {b''.join(stderr).decode(errors='replace')}")
+            raise
+        finally:
+            process.stdout.close()
+        stderr_thread.join()
+    return uploaded
@@ -1,21 +1,219 @@
-import json
+from __future__ import annotations
+
+import hashlib
 import logging
 import os
-import tempfile
+import queue
+import threading
+import time
+import weakref
 from base64 import b64decode
-from io import BytesIO
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
 
 import boto3
-from moviepy.editor import *
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
 from werkzeug.datastructures import FileStorage
 from werkzeug.utils import secure_filename
 
-logging.basicConfig(level=logging.INFO)
+from app.config import Config
+from app.metrics import instrument_client
+from .documents import DocumentConflict, DocumentStore
+from .media_cache import get_media_cache
+from .render import RenderSettings, is_static_image_clip, render_and_upload, render_static_image
+from .temp_files import ScopedTempDir, get_temp_janitor
+
+if TYPE_CHECKING:
+    from moviepy.editor import AudioFileClip, ImageClip, VideoFileClip
+
+# DeleteObjects takes at most 1000 keys per call
+DELETE_BATCH_SIZE = 1000
+# get_item_urls checks this many keys or fewer in one directory with a HEAD each, more with a listing
+HEAD_CHECK_MAX_KEYS = 32
+# A directory listing for get_item_urls stops after this many objects, HEADs check the rest
+LIST_CHECK_MAX_OBJECTS = 10000
+
+
+def transfer_config():
+    # Multipart settings for bulk transfers. Each worker runs up to
+    # S3_MULTIPART_CONCURRENCY part uploads, so size the client's
+    # max_pool_connections for workers * concurrency.
+    return TransferConfig(multipart_threshold=Config.S3_MULTIPART_CHUNK_SIZE,
+                          multipart_chunksize=Config.S3_MULTIPART_CHUNK_SIZE,
+                          max_concurrency=Config.S3_MULTIPART_CONCURRENCY)
+
+
+def _bulk_key(item):
+    # The object key an item of a bulk operation is reported under
+    if isinstance(item, tuple):
+        return item[1]
+    if isinstance(item, dict):
+        return item['key']
+    return item
+
+
+def _run_bulk(operation, items, max_workers):
+    """
+    Runs ``operation(item)`` for every item on a bounded thread pool.
+    ``operation`` returns the bytes it moved; exceptions are caught per item.
+    Items are pulled from the iterable as workers free up, so a lazy
+    listing streams through without being read into memory first.
+
+    :return: {"results": [{"key", "ok", "bytes", "error"}, ...] in item order,
+              "stats": {"count", "succeeded", "failed", "bytes", "seconds", "bytes_per_second"}}
+    """
+    max_workers = max_workers or Config.S3_TRANSFER_WORKERS
+    started = time.perf_counter()
+
+    def run(item):
+        key = _bulk_key(item)
+        try:
+            return {"key": key, "ok": True, "bytes": operation(item) or 0, "error": None}
+        except Exception as e:
+            logging.error(f"Bulk S3 operation failed for {key}: {str(e)}")
+            return {"key": key, "ok": False, "bytes": 0, "error": str(e)}
+
+    results = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        # A couple of items queued per worker keeps them busy without buffering the rest
+        in_flight = deque()
+        for item in items:
+            in_flight.append(pool.submit(run, item))
+            if len(in_flight) >= max_workers * 2:
+                results.append(in_flight.popleft().result())
+        results.extend(future.result() for future in in_flight)
+    return {"results": results, "stats": _bulk_stats(results, time.perf_counter() - started)}
+
+
+def _bulk_stats(results, seconds):
+    moved = sum(result["bytes"] for result in results)
+    succeeded = sum(1 for result in results if result["ok"])
+    return {
+        "count": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "bytes": moved,
+        "seconds": round(seconds, 3),
+        "bytes_per_second": round(moved / seconds) if seconds > 0 else 0,
+    }
+
+
+def _signer_identity(s3):
+    """
+    What a presigned URL from this client is bound to: the access key it is
+    signed with (a role's temporary key differs from the role's caller's)
+    plus the endpoint and region, hashed so no key material is kept. Our
+    clients all come from boto3's default session, whose credentials are
+    the ones they sign with (refreshed as a role's temporary key rotates).
+    """
+    session = boto3.DEFAULT_SESSION
+    credentials = session.get_credentials() if session is not None else None
+    access_key = credentials.access_key if credentials is not None else None
+    if access_key is None:
+        # Unknown credentials: only ever share URLs within the same client
+        return f"client-{id(s3)}"
+    identity = f"{access_key}|{s3.meta.endpoint_url}|{s3.meta.region_name}"
+    return hashlib.sha256(identity.encode('utf-8')).hexdigest()[:16]
+
+
+def _common_prefix(keys):
+    return os.path.commonprefix(list(keys)) if keys else ''
+
+
+class PresignedUrlCache:
+    """
+    Presigned GET URLs keyed by signer, bucket, key and expiry, so a URL
+    signed with one client's credentials is never handed to a caller using
+    another. A URL is handed out again until it is within
+    ``refresh_margin`` of expiring, then signed anew, so callers always get
+    at least that much validity.
+
+    :param max_entries: URLs kept, least recently used evicted first
+    :param refresh_margin: Fraction of the expiry before the end at which URLs are re-signed
+    """
+
+    def __init__(self, max_entries=10000, refresh_margin=0.1):
+        self.max_entries = max_entries
+        self.refresh_margin = refresh_margin
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_sign(self, s3, bucket_name, object_key, expiry_time):
+        cache_key = (_signer_identity(s3), bucket_name, object_key, expiry_time)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(cache_key)
+                return entry[1]
+
+        # Presigning is a local computation, no request goes to S3
+        url = s3.generate_presigned_url('get_object',
+                                        Params={'Bucket': bucket_name, 'Key': object_key},
+                                        ExpiresIn=expiry_time)
+        refresh_at = now + expiry_time * (1 - self.refresh_margin)
+        with self._lock:
+            self._entries[cache_key] = (refresh_at, url)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return url
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_presigned_urls = PresignedUrlCache(max_entries=Config.S3_PRESIGN_CACHE_MAX_ENTRIES)
+
+
+def _release_cached_files(media_cache, cached_files):
+    for file in cached_files:
+        media_cache.release(file)
+    cached_files.clear()
+
 
 class S3():
-    def __init__(self, s3: boto3.client):
-        self.temp_files = []
+    """
+    Wrapper around the S3 client for the media pipeline. Use it as a context
+    manager so its temp files are removed however the block exits:
+
+        with S3(boto3.client('s3')) as s3:
+            clip = s3.get_videofileclip(...)
+
+    Temp files live in a directory scoped to this instance, which a
+    finalizer also removes if the instance is garbage collected without
+    being disposed. A background janitor clears directories left behind by
+    crashed workers, and new temp files are refused past S3_TEMP_QUOTA_BYTES.
+    """
+
+    def __init__(self, s3: boto3.client, media_cache=None):
+        self.temp_dir = ScopedTempDir(self, Config.S3_TEMP_ROOT, quota_bytes=Config.S3_TEMP_QUOTA_BYTES)
+        # Media cache files this instance is using, released by dispose_temp_files
+        self.cached_files = []
         self.aws_s3: boto3.client = s3
+        instrument_client(s3)
+        self.media_cache = media_cache or get_media_cache()
+        # Transcriptions and other JSON documents, compressed and cached by ETag
+        self.documents = DocumentStore(s3, encoding=Config.S3_DOCUMENT_ENCODING or None)
+        self._release_cached = weakref.finalize(self, _release_cached_files,
+                                                self.media_cache, self.cached_files)
+        get_temp_janitor()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.dispose_temp_files()
+        return False
+
+    def _get_cached_file(self, bucket_name, object_key, suffix):
+        # Local copy of the object from the media cache, pinned until dispose_temp_files
+        local_path = self.media_cache.acquire(self.aws_s3, bucket_name, object_key, suffix)
+        self.cached_files.append(local_path)
+        return local_path
         
     def upload_mp4(self, 
                    file_name: str,
@@ -40,6 +238,7 @@ class S3():
         object_key = prefix + file_name  # Combine prefix and file name to form the full object key
 
         self.aws_s3.upload_fileobj(file, Bucket=bucket_name, Key=object_key)
+        self.media_cache.invalidate(bucket_name, object_key)
 
         # Construct the URL for the uploaded video file
         # Note: Consider using the AWS SDK to generate the URL if your bucket name or object key contains characters that require URL encoding
@@ -76,6 +275,7 @@ class S3():
                                    Bucket=bucket_name,
                                    Key=full_key_path,
                                    ExtraArgs={'ContentType': content_type})
+        self.media_cache.invalidate(bucket_name, full_key_path)
 
         logging.info(f"Successfully uploaded audio as .mp3 to S3 bucket {bucket_name} at {full_key_path}")
         
@@ -89,15 +289,11 @@ class S3():
         file_key = prefix + file_name
         
         try:
-            # Use the S3 client to get the object
-            obj = self.aws_s3.get_object(Bucket=bucket_name, Key=file_key)
-            # Read the file's content and decode it
-            json_content = obj['Body'].read().decode('utf-8')
-            # Convert JSON content to a dictionary
-            dict_from_s3 = json.loads(json_content)
+            # Only downloaded and decompressed again if it changed since we last read it
+            dict_from_s3, _ = self.documents.get(bucket_name, file_key)
             logging.info(f"Successfully retrieved transcription for file key: {file_key}")
             return dict_from_s3
-        except self.aws_s3.exceptions.NoSuchKey:
+        except KeyError:
             logging.error(f"Transcription file does not exist for file key: {file_key}")
             return None
         except Exception as e:
@@ -109,6 +305,7 @@ class S3():
                     object_key):
         try:
             self.aws_s3.delete_object(Bucket=bucket_name, Key=object_key)
+            self.media_cache.invalidate(bucket_name, object_key)
             logging.info(f"Deleted item from S3: {object_key}")
             return True
         except Exception as e:
@@ -124,55 +321,77 @@ class S3():
         file_key = prefix + file_name
         
         try:
-            # Serialize the transcription dictionary to a JSON string
-            json_data = json.dumps(dictionary)
-            # Convert the JSON string to bytes
-            transcription_bytes = json_data.encode('utf-8')
-            # Use the S3 client to put the object. This automatically "creates" the folder if it doesn't exist.
-            self.aws_s3.put_object(Bucket=bucket_name, Key=file_key, Body=transcription_bytes)
+            # Serialized and compressed per S3_DOCUMENT_ENCODING. This automatically "creates" the folder if it doesn't exist.
+            self.documents.put(bucket_name, file_key, dictionary)
             logging.info(f"Successfully wrote transcription for project_id: {prefix}")
             return True
         except Exception as e:
             logging.error(f"Failed to write transcription for project_id: {prefix}. Error: {str(e)}")
             return False
     
+    def update_video_data(self,
+                          prefix,
+                          file_name,
+                          bucket_name,
+                          change):
+        """
+        Safely changes a stored dictionary when several workers may write it:
+        ``change(dictionary)`` returns the new dictionary (it gets None if
+        none is stored yet) and is rerun if another writer got in first.
+
+        :return: The dictionary that was written, or None on failure
+        """
+        file_key = prefix + file_name
+        try:
+            dictionary, _ = self.documents.update(bucket_name, file_key, change)
+            logging.info(f"Successfully updated transcription for project_id: {prefix}")
+            return dictionary
+        except DocumentConflict as e:
+            logging.error(f"Gave up updating transcription for project_id: {prefix}. Error: {str(e)}")
+            return None
+        except Exception as e:
+            logging.error(f"Failed to update transcription for project_id: {prefix}. Error: {str(e)}")
+            return None
+
     def write_videofileclip(self,
                             clip: VideoFileClip,
                             video_id,
                             bucket_name,
-                            prefix=''):
+                            prefix='',
+                            settings: RenderSettings = None):
+        """
+        Renders a clip straight to S3: parts are uploaded while the rest of
+        the clip is still encoding.
+
+        :param settings: Optional RenderSettings (fps, preset, CRF, threads)
+        """
         # Combine the prefix with the video_id to form the full key path
         full_key_path = f"{prefix}{video_id}" if prefix else video_id
         logging.info(f"Uploading video {video_id} to S3 bucket {bucket_name} under prefix '{prefix}'")
 
-        # Use tempfile to create a temporary video file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as tmp_file:
-            
-            logging.info(f"Writing video {video_id} to temporary file {tmp_file.name}")
-            # Export the clip to the temporary file
-            clip.write_videofile(tmp_file.name, codec="libx264", audio_codec="aac")
-            
-            # Once the file is saved, upload it to S3 with the full key path including the prefix
-            self.aws_s3.upload_file(Filename=tmp_file.name, Bucket=bucket_name, Key=full_key_path)
+        render_and_upload(clip, self.aws_s3, bucket_name, full_key_path, self.temp_dir, settings)
+        self.media_cache.invalidate(bucket_name, full_key_path)
     
         logging.info(f"Successfully uploaded {video_id} to S3 bucket {bucket_name} under prefix '{prefix}'")
         
-        self.temp_files.append(tmp_file.name)
-        
         return True
     
     def write_imageclip_as_videofile(self, 
                                      image_clip: ImageClip,
                                      video_id: str,
                                      bucket_name: str,
-                                     prefix: str = ''):
+                                     prefix: str = '',
+                                     settings: RenderSettings = None):
         """
         Saves an ImageClip as an .mp4 file and uploads it to an S3 bucket.
+        A plain still image without audio takes a fast path where ffmpeg
+        loops one frame instead of moviepy generating every frame.
 
         :param image_clip: The ImageClip to be saved and uploaded.
         :param video_id: A unique identifier for the video file.
         :param bucket_name: The name of the S3 bucket to upload the file to.
         :param prefix: An optional prefix to prepend to the video_id for the S3 key path.
+        :param settings: Optional RenderSettings (fps, preset, CRF, threads)
         """
         # Ensure the ImageClip has a duration set
         if not hasattr(image_clip, 'duration') or image_clip.duration is None:
@@ -186,16 +405,11 @@ class S3():
         full_key_path = prefix + video_id if prefix else video_id
         logging.info(f"Uploading video {video_id} to S3 bucket {bucket_name} under prefix '{prefix}'")
 
-        # Use tempfile to create a temporary video file
-        with tempfile.NamedTemporaryFile(suffix='.mp4') as tmp_file:
-            # Export the ImageClip to the temporary file as a video, specifying fps
-            image_clip.write_videofile(tmp_file.name, fps=24, codec="libx264", audio_codec="aac", temp_audiofile=tmp_file.name + ".mp3", remove_temp=True)
-
-            # Rewind the file to ensure it's read from the beginning
-            tmp_file.seek(0)
-            
-            # Upload the file to S3
-            self.aws_s3.upload_file(Filename=tmp_file.name, Bucket=bucket_name, Key=full_key_path)
+        if is_static_image_clip(image_clip):
+            render_static_image(image_clip, self.aws_s3, bucket_name, full_key_path, self.temp_dir, settings)
+        else:
+            render_and_upload(image_clip, self.aws_s3, bucket_name, full_key_path, self.temp_dir, settings)
+        self.media_cache.invalidate(bucket_name, full_key_path)
         
         logging.info(f"Successfully uploaded {video_id} as .mp4 to S3 bucket {bucket_name} under prefix '{prefix}'")
         
@@ -208,23 +422,13 @@ class S3():
         full_key_path = f"{prefix}{video_id}" if prefix else video_id
         logging.info(f"Getting Video {full_key_path} from S3 bucket {bucket_name}")
 
-        file_buffer = BytesIO()
-        self.aws_s3.download_fileobj(Bucket=bucket_name,
-                                        Key=full_key_path,
-                                        Fileobj=file_buffer)
-        
-        # Use tempfile to create a temp file on disk for the video
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as tmp_file:
-            # Write the contents of the BytesIO buffer to the temp file
-            file_buffer.seek(0)  # Go to the start of the BytesIO buffer
-            tmp_file.write(file_buffer.read())
-            
-            # Now that the file is saved to disk, we can load it with VideoFileClip
-            video_clip = VideoFileClip(tmp_file.name)
-            
-            logging.info(f"Successfully retrieved video {video_id} from S3 bucket {bucket_name}")
-        
-        self.temp_files.append(tmp_file.name)
+        # moviepy.editor also attaches the effect methods (resize, ...) to clips
+        from moviepy.editor import VideoFileClip
+
+        # Served from the media cache; only downloaded if this version isn't on disk yet
+        video_clip = VideoFileClip(self._get_cached_file(bucket_name, full_key_path, '.mp4'))
+
+        logging.info(f"Successfully retrieved video {video_id} from S3 bucket {bucket_name}")
         return video_clip
     
     def get_imageclip(self,
@@ -235,23 +439,13 @@ class S3():
         full_key_path = f"{prefix}{image_id}" if prefix else image_id
         logging.info(f"Getting image {full_key_path} from S3 bucket {bucket_name}")
 
-        file_buffer = BytesIO()
-        self.aws_s3.download_fileobj(Bucket=bucket_name,
-                                        Key=full_key_path,
-                                        Fileobj=file_buffer)
-        
-        # Use tempfile to create a temp file on disk for the video
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as tmp_file:
-            # Write the contents of the BytesIO buffer to the temp file
-            file_buffer.seek(0)  # Go to the start of the BytesIO buffer
-            tmp_file.write(file_buffer.read())
-            
-            # Now that the file is saved to disk, we can load it with VideoFileClip
-            video_clip = ImageClip(tmp_file.name, duration=duration)
-            
-            logging.info(f"Successfully retrieved video {image_id} from {full_key_path}")
-        
-        self.temp_files.append(tmp_file.name)
+        # moviepy.editor also attaches the effect methods (resize, ...) to clips
+        from moviepy.editor import ImageClip
+
+        # Served from the media cache; only downloaded if this version isn't on disk yet
+        video_clip = ImageClip(self._get_cached_file(bucket_name, full_key_path, '.png'), duration=duration)
+
+        logging.info(f"Successfully retrieved video {image_id} from {full_key_path}")
         return video_clip
     
     def get_audiofileclip(self, 
@@ -262,23 +456,12 @@ class S3():
         full_key_path = f"{prefix}{audio_id}" if prefix else audio_id
         logging.info(f"Getting audio {full_key_path} from S3 bucket {bucket_name}")
 
-        file_buffer = BytesIO()
-        self.aws_s3.download_fileobj(Bucket=bucket_name,
-                                    Key=full_key_path,
-                                    Fileobj=file_buffer)
-
-        # Use tempfile to create a temp file on disk
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as tmp_file:
-            # Write the contents of the BytesIO buffer to the temp file
-            file_buffer.seek(0)  # Go to the start of the BytesIO buffer
-            tmp_file.write(file_buffer.read())
+        # moviepy.editor also attaches the effect methods (resize, ...) to clips
+        from moviepy.editor import AudioFileClip
 
-            # Now that the file is saved to disk, we can load it with AudioFileClip
-            audio_clip = AudioFileClip(tmp_file.name)
+        # Served from the media cache; only downloaded if this version isn't on disk yet
+        audio_clip = AudioFileClip(self._get_cached_file(bucket_name, full_key_path, '.mp3'))
 
-        # Optionally keep track of temp files for cleanup, assumed self.temp_files is initialized elsewhere
-        self.temp_files.append(tmp_file.name)
-        
         logging.info(f"Successfully retrieved audio {audio_id} from S3 bucket {bucket_name}")
         return audio_clip
 
@@ -286,58 +469,215 @@ class S3():
                      bucket_name,
                      object_key,
                      expiry_time=3600,
-                     prefix=''):
+                     prefix='',
+                     check_exists=True):
         full_key_path = f"{prefix}{object_key}" if prefix else object_key
         logging.info(f"Getting URL for item {object_key} from {full_key_path}'")
 
-        # Ensure the video exists
-        try:
-            self.aws_s3.head_object(Bucket=bucket_name, Key=full_key_path)
-        except:
-            logging.info(f"Video {object_key} not found in {full_key_path}'")
-            return None
+        # Ensure the video exists; pass check_exists=False to skip the round trip
+        if check_exists:
+            try:
+                self.aws_s3.head_object(Bucket=bucket_name, Key=full_key_path)
+            except:
+                logging.info(f"Video {object_key} not found in {full_key_path}'")
+                return None
+
+        # Generate presigned URL, reusing one signed earlier while it is still fresh
+        return _presigned_urls.get_or_sign(self.aws_s3, bucket_name, full_key_path, expiry_time)
 
-        # Generate presigned URL
-        return self.aws_s3.generate_presigned_url('get_object',
-                                                Params={'Bucket': bucket_name,
-                                                        'Key': full_key_path},
-                                                ExpiresIn=expiry_time)
+    def get_item_urls(self,
+                      bucket_name,
+                      object_keys,
+                      expiry_time=3600,
+                      prefix='',
+                      check_exists=False):
+        """
+        Presigned URLs for many objects at once, without a request per object.
+
+        :param object_keys: Keys relative to ``prefix``
+        :param check_exists: Give missing objects a None URL. Keys are grouped
+                             by directory; a few keys in a directory are
+                             checked with parallel HEADs, more with a listing
+                             of just that directory's range of keys.
+        :return: Dict of object key -> URL, or None for missing objects
+        """
+        existing = None
+        if check_exists:
+            existing = self._existing_keys(bucket_name, [prefix + object_key for object_key in object_keys])
+
+        urls = {}
+        for object_key in object_keys:
+            full_key_path = prefix + object_key
+            if existing is not None and full_key_path not in existing:
+                urls[object_key] = None
+            else:
+                urls[object_key] = _presigned_urls.get_or_sign(self.aws_s3, bucket_name, full_key_path, expiry_time)
+        return urls
     
-    def get_all_items(self, bucket_name, prefix=''):
-        # Initialize a list to hold the item keys
-        item_keys = []
-
-        # Initialize the pagination marker
-        continuation_token = None
-
-        # Loop to handle pagination
-        while True:
-            # Prepare the arguments for the list_objects_v2 call
-            list_objects_v2_args = {
-                'Bucket': bucket_name,
-                'Prefix': prefix  # Specify the prefix here
-            }
-
-            # If this is not the first page, add the continuation token to the arguments
-            if continuation_token:
-                list_objects_v2_args['ContinuationToken'] = continuation_token
-
-            # Make the list_objects_v2 call with the prepared arguments
-            response = self.aws_s3.list_objects_v2(**list_objects_v2_args)
-
-            # Check if 'Contents' is in the response
-            if 'Contents' in response:
-                # Extend the item keys list with keys from the current page, excluding the prefix itself
-                item_keys.extend(item['Key'] for item in response['Contents'] if item['Key'] != prefix)
-
-            # Check if there are more pages
-            if response.get('IsTruncated'):
-                continuation_token = response.get('NextContinuationToken')
+    def _existing_keys(self, bucket_name, keys):
+        # The subset of keys that exist in the bucket
+        directories = defaultdict(list)
+        for key in dict.fromkeys(keys):
+            directories[key.rpartition('/')[0]].append(key)
+
+        existing, unresolved = set(), []
+        for directory_keys in directories.values():
+            if len(directory_keys) <= HEAD_CHECK_MAX_KEYS:
+                unresolved.extend(directory_keys)
             else:
-                break  # Exit the loop if no more pages
+                found, rest = self._list_existing(bucket_name, sorted(directory_keys))
+                existing |= found
+                unresolved.extend(rest)
+        if not unresolved:
+            return existing
+
+        def exists(key):
+            try:
+                self.aws_s3.head_object(Bucket=bucket_name, Key=key)
+                return True
+            except ClientError as e:
+                if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                    return False
+                raise
+
+        with ThreadPoolExecutor(max_workers=min(len(unresolved), Config.S3_TRANSFER_WORKERS)) as pool:
+            existing.update(key for key, found in zip(unresolved, pool.map(exists, unresolved)) if found)
+        return existing
+
+    def _list_existing(self, bucket_name, keys):
+        """
+        Checks sorted keys from one directory with a listing of only that
+        directory's objects (not its subdirectories) between the first and
+        last key, which S3 returns in key order. The listing stops after
+        LIST_CHECK_MAX_OBJECTS objects.
+
+        :return: The keys found, and the keys past where the listing stopped
+        """
+        wanted = set(keys)
+        found = set()
+        listed = 0
+        paginator = self.aws_s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=_common_prefix(keys), Delimiter='/'):
+            for item in page.get('Contents', []):
+                key = item['Key']
+                if key > keys[-1]:
+                    return found, []
+                if key in wanted:
+                    found.add(key)
+                listed += 1
+                if listed >= LIST_CHECK_MAX_OBJECTS:
+                    return found, [rest for rest in keys if rest > key]
+        return found, []
+
+    def iter_objects(self,
+                     bucket_name: str,
+                     prefix: str = '',
+                     page_size: int = None):
+        """
+        Yields every object under ``prefix`` as a dict with ``key``, ``size``,
+        ``etag`` and ``last_modified``. Pages are fetched lazily through the
+        boto3 paginator, so memory stays constant however many objects there are.
+
+        :param page_size: Optional number of keys per list request (max 1000)
+        """
+        paginator = self.aws_s3.get_paginator('list_objects_v2')
+        pagination = {'PageSize': page_size} if page_size else {}
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix, PaginationConfig=pagination):
+            for item in page.get('Contents', []):
+                yield {
+                    "key": item['Key'],
+                    "size": item['Size'],
+                    "etag": item.get('ETag', '').strip('"'),
+                    "last_modified": item.get('LastModified'),
+                }
+
+    def iter_prefixes(self,
+                      bucket_name: str,
+                      prefix: str = '',
+                      delimiter: str = '/'):
+        """
+        Yields the "directories" directly under ``prefix`` (full common
+        prefixes, ending in ``delimiter``), across every page of results.
+        """
+        paginator = self.aws_s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix, Delimiter=delimiter):
+            for item in page.get('CommonPrefixes', []):
+                yield item['Prefix']
+
+    def iter_objects_parallel(self,
+                              bucket_name: str,
+                              prefix: str = '',
+                              delimiter: str = '/',
+                              max_workers: int = None):
+        """
+        Like ``iter_objects`` but lists each sub-prefix of ``prefix`` on its
+        own thread, which is much faster for wide trees such as a bucket of
+        user folders. Objects come back in no particular order. At most a few
+        pages per worker are buffered, so memory stays bounded.
+        """
+        paginator = self.aws_s3.get_paginator('list_objects_v2')
+        # Objects sitting directly under prefix, plus the sub-prefixes to fan out over
+        sub_prefixes = []
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix, Delimiter=delimiter):
+            yield from ({"key": item['Key'], "size": item['Size'], "etag": item.get('ETag', '').strip('"'),
+                         "last_modified": item.get('LastModified')} for item in page.get('Contents', []))
+            sub_prefixes.extend(item['Prefix'] for item in page.get('CommonPrefixes', []))
+        if not sub_prefixes:
+            return
+
+        max_workers = max_workers or Config.S3_TRANSFER_WORKERS
+        pages = queue.Queue(maxsize=max_workers * 2)
+        stop = threading.Event()
+        done = object()
+
+        def put(item):
+            # Give up if the consumer went away instead of blocking forever
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def list_sub_prefix(sub_prefix):
+            try:
+                chunk = []
+                for item in self.iter_objects(bucket_name, sub_prefix):
+                    chunk.append(item)
+                    if len(chunk) >= 1000 or stop.is_set():
+                        if not put(chunk):
+                            return
+                        chunk = []
+                if chunk:
+                    put(chunk)
+            except Exception as e:
+                put(e)
+            finally:
+                put(done)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for sub_prefix in sub_prefixes:
+                pool.submit(list_sub_prefix, sub_prefix)
+            try:
+                remaining = len(sub_prefixes)
+                while remaining:
+                    item = pages.get()
+                    if item is done:
+                        remaining -= 1
+                    elif isinstance(item, Exception):
+                        raise item
+                    else:
+                        yield from item
+            finally:
+                # Don't start listings nobody will read
+                stop.set()
+                pool.shutdown(wait=False, cancel_futures=True)
+
+    def get_all_items(self, bucket_name, prefix=''):
+        # Every key under the prefix, excluding the prefix itself
+        return [item['key'] for item in self.iter_objects(bucket_name, prefix) if item['key'] != prefix]
 
-        return item_keys
-    
     def create_folder(self, 
                       folder_name,
                       bucket_name,
@@ -380,40 +720,154 @@ class S3():
         return True
     
     def get_list_of_projects(self, key, bucket_name):
-        # Initialize a list to hold the names of the projects
-        project_folders = []
+        # Names of the folders directly under key, without the key or the trailing slash
+        return [folder[len(key):-1] for folder in self.iter_prefixes(bucket_name, key)]
 
-        # Use the S3 client to list objects with the specified prefix and delimiter
-        response = self.aws_s3.list_objects_v2(Bucket=bucket_name, Prefix=key, Delimiter='/')
+    def get_list_of_objects(self, key, bucket_name):
+        # Names of every file under key, relative to key
+        return [item['key'][len(key):] for item in self.iter_objects(bucket_name, key) if item['key'] != key]
+
+    def upload_files(self,
+                     files,
+                     bucket_name: str,
+                     prefix: str = '',
+                     max_workers: int = None) -> dict:
+        """
+        Uploads many files in parallel on a bounded thread pool, with
+        multipart uploads for large files.
 
-        # Check if the 'CommonPrefixes' key is in the response, which contains the folder names
-        if 'CommonPrefixes' in response:
-            for item in response['CommonPrefixes']:
-                # Extract the folder name, remove the user_id prefix and the trailing slash
-                folder_name = item['Prefix'][len(key):-1]
-                project_folders.append(folder_name)
+        :param files: Iterable of (local_path, object_key) pairs
+        :param bucket_name: Name of the S3 bucket
+        :param prefix: Optional prefix prepended to every object key
+        :param max_workers: Files in flight at once, defaults to S3_TRANSFER_WORKERS
+        :return: Per-file results and aggregate stats, see _run_bulk
+        """
+        config = transfer_config()
+
+        def upload(item):
+            local_path, object_key = item
+            self.aws_s3.upload_file(Filename=local_path, Bucket=bucket_name,
+                                    Key=prefix + object_key, Config=config)
+            self.media_cache.invalidate(bucket_name, prefix + object_key)
+            return os.path.getsize(local_path)
+
+        report = _run_bulk(upload, files, max_workers)
+        logging.info(f"Uploaded {report['stats']['succeeded']} of {report['stats']['count']} files to {bucket_name}")
+        return report
+
+    def download_files(self,
+                       object_keys,
+                       bucket_name: str,
+                       local_dir: str,
+                       prefix: str = '',
+                       max_workers: int = None) -> dict:
+        """
+        Downloads many objects in parallel into ``local_dir``, keeping each
+        key's path below ``prefix`` as the relative file path.
 
-        return project_folders
-    
-    def get_list_of_objects(self, key, bucket_name):
-        # Initialize a list to hold the names of the files
-        file_names = []
+        :param object_keys: Keys relative to ``prefix``
+        :return: Per-object results and aggregate stats, see _run_bulk
+        """
+        config = transfer_config()
+        root = os.path.abspath(local_dir)
+
+        def download(object_key):
+            local_path = os.path.abspath(os.path.join(root, object_key))
+            if not local_path.startswith(root + os.sep):
+                raise ValueError(f"Key {object_key} points outside {local_dir}")
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            self.aws_s3.download_file(bucket_name, prefix + object_key, local_path, Config=config)
+            return os.path.getsize(local_path)
+
+        report = _run_bulk(download, object_keys, max_workers)
+        logging.info(f"Downloaded {report['stats']['succeeded']} of {report['stats']['count']} objects from {bucket_name}")
+        return report
+
+    def copy_items(self,
+                   object_keys,
+                   source_bucket: str,
+                   dest_bucket: str,
+                   source_prefix: str = '',
+                   dest_prefix: str = '',
+                   max_workers: int = None) -> dict:
+        """
+        Copies many objects server side in parallel, e.g. to duplicate a
+        project. Keys are relative to the prefixes.
 
-        # Use the S3 client to list objects with the specified prefix
-        response = self.aws_s3.list_objects_v2(Bucket=bucket_name, Prefix=key)
+        :param object_keys: Keys, or ``{"key", "size"}`` dicts when the sizes
+                            are known from a listing; plain keys cost a HEAD
+                            each for the size in the stats
+        :return: Per-object results and aggregate stats, see _run_bulk
+        """
+        config = transfer_config()
+
+        def copy(item):
+            object_key, size = (item['key'], item.get('size')) if isinstance(item, dict) else (item, None)
+            source = {'Bucket': source_bucket, 'Key': source_prefix + object_key}
+            if size is None:
+                size = self.aws_s3.head_object(**source)['ContentLength']
+            self.aws_s3.copy(source, dest_bucket, dest_prefix + object_key, Config=config)
+            self.media_cache.invalidate(dest_bucket, dest_prefix + object_key)
+            return size
+
+        report = _run_bulk(copy, object_keys, max_workers)
+        logging.info(f"Copied {report['stats']['succeeded']} of {report['stats']['count']} objects to {dest_bucket}")
+        return report
+
+    def copy_prefix(self,
+                    source_bucket: str,
+                    source_prefix: str,
+                    dest_bucket: str,
+                    dest_prefix: str,
+                    max_workers: int = None) -> dict:
+        """
+        Copies everything under ``source_prefix`` to ``dest_prefix``. The
+        listing streams into the copies and supplies the sizes.
 
-        # Check if the 'Contents' key is in the response, which contains the file names
-        if 'Contents' in response:
-            for obj in response['Contents']:
-                # Check if the key is not just the folder name
-                if obj['Key'] != key:
-                    # Extract the file name from the key by removing the folder prefix
-                    file_name = obj['Key'][len(key):]
-                    file_names.append(file_name)
+        :return: Per-object results and aggregate stats, see _run_bulk
+        """
+        items = ({"key": item['key'][len(source_prefix):], "size": item['size']}
+                 for item in self.iter_objects(source_bucket, source_prefix))
+        return self.copy_items(items, source_bucket, dest_bucket, source_prefix, dest_prefix, max_workers)
 
-        return file_names
+    def delete_items(self,
+                     bucket_name: str,
+                     object_keys) -> dict:
+        """
+        Deletes many objects with DeleteObjects, 1000 keys per request.
 
-    # ALWAYS CALL THIS AFTER YOU ARE DONE USING THIS CLASS
+        :return: Per-key results and aggregate stats, see _run_bulk
+        """
+        started = time.perf_counter()
+        object_keys = list(dict.fromkeys(object_keys))
+        results = []
+        for start in range(0, len(object_keys), DELETE_BATCH_SIZE):
+            batch = object_keys[start:start + DELETE_BATCH_SIZE]
+            try:
+                response = self.aws_s3.delete_objects(
+                    Bucket=bucket_name,
+                    Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True})
+            except Exception as e:
+                logging.error(f"Failed to delete {len(batch)} items from S3. Error: {str(e)}")
+                results.extend({"key": key, "ok": False, "bytes": 0, "error": str(e)} for key in batch)
+                continue
+            # Quiet mode only reports the keys that failed
+            errors = {error['Key']: error.get('Message', error.get('Code')) for error in response.get('Errors', [])}
+            for key in batch:
+                results.append({"key": key, "ok": key not in errors, "bytes": 0, "error": errors.get(key)})
+                if key not in errors:
+                    self.media_cache.invalidate(bucket_name, key)
+
+        stats = _bulk_stats(results, time.perf_counter() - started)
+        logging.info(f"Deleted {stats['succeeded']} of {stats['count']} items from {bucket_name}")
+        return {"results": results, "stats": stats}
+
+    def delete_prefix(self, bucket_name, prefix) -> dict:
+        # Removes everything under a prefix, e.g. a whole project folder
+        return self.delete_items(bucket_name, self.get_all_items(bucket_name, prefix) + [prefix])
+
+    # Called when the with block exits; call it yourself if you don't use one
     def dispose_temp_files(self):
-        for file in self.temp_files:
-            os.remove(file)
\ No newline at end of file
+        self.temp_dir.cleanup()
+        # Cached media stays on disk for the next render; it just stops being pinned
+        _release_cached_files(self.media_cache, self.cached_files)
\ No newline at end of file
@@ -0,0 +1,281 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+from app.config import Config
+
+# Scoped directories are named <prefix><pid>-<random> so the janitor can tell whose they are
+TEMP_DIR_PREFIX = 's3-'
+
+
+class TempDiskQuotaExceeded(RuntimeError):
+    pass
+
+
+def temp_usage(root):
+    # Bytes used by every scoped temp directory under root
+    total = 0
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except FileNotFoundError:
+                pass
+    return total
+
+
+class TempUsage:
+    """
+    Disk usage under a temp root, kept current without walking the tree for
+    every new file. This process's live temp files are tracked one by one and
+    each counts as at least the bytes reserved for it, so a file that is
+    about to be written large counts before it is. Other processes' usage
+    comes from the last scan, which the janitor repeats on every sweep.
+
+    :param root: Directory the scoped directories live in
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+        # Bytes under root outside this process's directories, None until scanned
+        self._others = None
+        # path -> bytes reserved for it
+        self._files = {}
+
+    def scan(self):
+        own_prefix = f"{TEMP_DIR_PREFIX}{os.getpid()}-"
+        total = 0
+        if os.path.isdir(self.root):
+            for name in os.listdir(self.root):
+                if not name.startswith(own_prefix):
+                    total += temp_usage(os.path.join(self.root, name))
+        with self._lock:
+            self._others = total
+        return total
+
+    def track(self, path, reserved_bytes=0):
+        with self._lock:
+            self._files[path] = reserved_bytes
+
+    def untrack(self, path):
+        with self._lock:
+            self._files.pop(path, None)
+
+    def current(self):
+        if self._others is None:
+            self.scan()
+        with self._lock:
+            others = self._others
+            files = list(self._files.items())
+        own = 0
+        for path, reserved_bytes in files:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                size = 0
+            own += max(size, reserved_bytes)
+        return others + own
+
+
+_temp_usages = {}
+_temp_usages_lock = threading.Lock()
+
+
+def get_temp_usage(root):
+    with _temp_usages_lock:
+        usage = _temp_usages.get(root)
+        if usage is None:
+            usage = _temp_usages[root] = TempUsage(root)
+        return usage
+
+
+def _remove_dir(path):
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ScopedTempDir:
+    """
+    A temp directory owned by one object. It is created on first use and
+    removed with everything in it by ``cleanup``, or by a weakref finalizer
+    if the owner is garbage collected (or the process exits) first.
+
+    Every new file is checked against a disk quota shared by all scoped
+    directories under ``root``; callers that know roughly how big a file
+    will get can reserve that up front, so it can't grow past the quota.
+
+    :param owner: Object whose lifetime bounds the directory
+    :param root: Directory the scoped directories are created in
+    :param quota_bytes: Disk usage allowed under root, 0 for no limit
+    """
+
+    def __init__(self, owner, root, quota_bytes=0):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.path = None
+        self._owner = weakref.ref(owner)
+        self._finalizer = None
+        self._lock = threading.Lock()
+        self._usage = get_temp_usage(root)
+
+    def _ensure(self):
+        with self._lock:
+            if self.path is None:
+                os.makedirs(self.root, exist_ok=True)
+                # Registered together with its creation, so the janitor never sees it unregistered
+                with _live_dirs_lock:
+                    self.path = tempfile.mkdtemp(prefix=f"{TEMP_DIR_PREFIX}{os.getpid()}-", dir=self.root)
+                    _live_dirs.add(self.path)
+                owner = self._owner()
+                # The finalizer only holds the path, so it never keeps the owner alive
+                self._finalizer = weakref.finalize(owner if owner is not None else self,
+                                                   _release_dir, self.path)
+            return self.path
+
+    def _check_quota(self, reserved_bytes):
+        if not self.quota_bytes:
+            return
+        if self._usage.current() + reserved_bytes < self.quota_bytes:
+            return
+        # Reclaim what we can and recount everything before refusing
+        get_temp_janitor().sweep()
+        self._usage.scan()
+        usage = self._usage.current() + reserved_bytes
+        if usage >= self.quota_bytes:
+            raise TempDiskQuotaExceeded(
+                f"Temp disk usage under {self.root} is {usage} bytes, quota is {self.quota_bytes}")
+
+    @contextmanager
+    def file(self, suffix='', reserved_bytes=0):
+        """
+        Yields the path of a new file in the directory and deletes the file
+        when the block exits, whether or not it raised.
+
+        :param reserved_bytes: How big the file is expected to get, counted against the quota from the start
+        """
+        self._check_quota(reserved_bytes)
+        fd, path = tempfile.mkstemp(suffix=suffix, dir=self._ensure())
+        os.close(fd)
+        self._usage.track(path, reserved_bytes)
+        try:
+            yield path
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+            self._usage.untrack(path)
+
+    def cleanup(self):
+        with self._lock:
+            if self._finalizer is not None:
+                self._finalizer()
+            self._finalizer = None
+            self.path = None
+
+
+_live_dirs = set()
+_live_dirs_lock = threading.Lock()
+
+
+def _release_dir(path):
+    with _live_dirs_lock:
+        _live_dirs.discard(path)
+    _remove_dir(path)
+
+
+class TempJanitor:
+    """
+    Periodically removes scoped temp directories nobody will clean up: ones
+    left by processes that died, ones from this process whose owner is gone
+    without running its finalizer, and other processes' directories left
+    untouched for more than ``max_age`` seconds.
+
+    :param root: Directory the scoped directories live in
+    :param interval: Seconds between sweeps
+    :param max_age: Other processes' directories untouched for this long are removed
+    """
+
+    def __init__(self, root, interval=300, max_age=6 * 3600):
+        self.root = root
+        self.interval = interval
+        self.max_age = max_age
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _is_stale(self, path, name, now):
+        try:
+            pid = int(name[len(TEMP_DIR_PREFIX):].split('-', 1)[0])
+            age = now - os.stat(path).st_mtime
+        except (FileNotFoundError, ValueError):
+            return False
+        if pid == os.getpid():
+            # We know exactly which of our own directories are still in use
+            with _live_dirs_lock:
+                return path not in _live_dirs
+        return not _pid_alive(pid) or age > self.max_age
+
+    def sweep(self):
+        # Returns the number of directories removed
+        if not os.path.isdir(self.root):
+            return 0
+        now = time.time()
+        removed = 0
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if not name.startswith(TEMP_DIR_PREFIX) or not os.path.isdir(path):
+                continue
+            if self._is_stale(path, name, now):
+                _remove_dir(path)
+                removed += 1
+        # Other processes' usage, for the quota checks until the next sweep
+        get_temp_usage(self.root).scan()
+        if removed:
+            logging.info(f"Temp janitor removed {removed} stale directories from {self.root}")
+        return removed
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                logging.error(f"Temp janitor sweep failed: {str(e)}")
+
+    def start(self):
+        if self._thread is None:
+            self.sweep()
+            self._thread = threading.Thread(target=self._run, name='temp-janitor', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+
+_temp_janitor = None
+_temp_janitor_lock = threading.Lock()
+
+
+def get_temp_janitor():
+    # Started the first time an S3 wrapper is created
+    global _temp_janitor
+    if _temp_janitor is None:
+        with _temp_janitor_lock:
+            if _temp_janitor is None:
+                _temp_janitor = TempJanitor(Config.S3_TEMP_ROOT,
+                                            interval=Config.S3_TEMP_JANITOR_INTERVAL,
+                                            max_age=Config.S3_TEMP_MAX_AGE).start()
+    return _temp_janitor
@@ -7,5 +7,6 @@ from app import create_app
 application = create_app()
 
 if __name__ == '__main__':
-    # Run the app
+    # Run the app with the development server
+    # In production use gunicorn or the async entry point in asgi.py (see README.md)
     application.run(host='0.0.0.0', port=3000, debug=True)
\ No newline at end of file
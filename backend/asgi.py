@@ -0,0 +1,7 @@
+# Async entry point for the Flask app
+# Serves the chat endpoints on an event loop so one process can hold many
+# concurrent chats while they wait on the model. Run it with an ASGI server:
+# uvicorn asgi:application --host 0.0.0.0 --port 3000 --workers 4
+from app.asgi import create_asgi_app
+
+application = create_asgi_app()
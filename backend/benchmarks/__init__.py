@@ -0,0 +1,7 @@
+# Performance benchmarks and load tests for the backend. Run from backend/:
+#
+#     python -m benchmarks --help
+#
+# Everything runs locally: the model is a fake OpenAI compatible server and
+# S3/DynamoDB are served by moto, so numbers compare between runs and machines
+# rather than measuring AWS.
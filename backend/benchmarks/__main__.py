@@ -0,0 +1,132 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+SUITES = ('startup', 'http', 'memory', 's3', 'dynamodb')
+
+
+def _ints(value):
+    return [int(part) for part in value.split(',') if part]
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks',
+                                     description="Benchmarks and load tests for the backend")
+    parser.add_argument('--suites', default=','.join(SUITES),
+                        help=f"Comma separated suites to run: {', '.join(SUITES)}")
+    parser.add_argument('--concurrency', type=_ints, default=[1, 4, 16, 64],
+                        help="Concurrency levels for the HTTP load test")
+    parser.add_argument('--requests', type=int, default=200, help="Requests per endpoint and concurrency level")
+    parser.add_argument('--latency', type=float, default=0.2, help="Seconds the fake model waits before replying")
+    parser.add_argument('--stream', action='store_true', help="Load test /chat/stream instead of /chat")
+    parser.add_argument('--sizes', type=_ints, default=[1000, 10000, 100000],
+                        help="Memory counts for the memory microbenchmarks")
+    parser.add_argument('--dynamodb-sizes', type=_ints, default=[1000],
+                        help="Memory counts for the DynamoDB benchmarks")
+    parser.add_argument('--s3-files', type=int, default=200, help="Objects per S3 bulk transfer")
+    parser.add_argument('--s3-file-size', type=int, default=256 * 1024, help="Bytes per S3 object")
+    parser.add_argument('--output', default=None,
+                        help="JSON results file (default benchmarks/results/<timestamp>.json)")
+    return parser.parse_args(argv)
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    args = parse_args(argv if argv is not None else sys.argv[1:])
+    suites = [suite for suite in args.suites.split(',') if suite]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        sys.exit(f"Unknown suites: {', '.join(sorted(unknown))}")
+
+    from .fake_llm import FakeLLMServer
+    from .stand_ins import AWSStandIn
+
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    fake_llm = FakeLLMServer(latency=args.latency).start()
+    stand_in = AWSStandIn().start() if {'s3', 'dynamodb'} & set(suites) else None
+
+    # The app reads its settings at import time, so point it at the stand-ins first
+    os.environ.update({
+        'OPENAI_API_KEY': os.getenv('OPENAI_API_KEY', 'bench'),
+        'LLM_BASE_URL': fake_llm.base_url,
+        'MEMORY_DB_PATH': os.path.join(workdir, 'memories.db'),
+        'MEMORY_JOURNAL_PATH': os.path.join(workdir, 'memories.journal'),
+        'MEMORY_LEGACY_JSON_PATH': '',
+        'MEMORY_SWEEP_INTERVAL': '0',
+        'MEDIA_CACHE_DIR': os.path.join(workdir, 'media-cache'),
+        'S3_TEMP_ROOT': os.path.join(workdir, 's3-temp'),
+    })
+    if stand_in is not None:
+        os.environ.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+        os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+        os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+    results = {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+        },
+        "results": {},
+    }
+
+    try:
+        if 'startup' in suites:
+            print("Startup")
+            from .startup import print_report, startup_report
+            results["results"]["startup"] = startup_report()
+            print_report(results["results"]["startup"])
+        if 'http' in suites:
+            print("HTTP load test")
+            from app import create_app
+            from app.chatbotPlayground import save_memories
+            from .http_load import run_http_suite
+            from .micro import make_memories
+
+            save_memories(make_memories(1000), user_id='bench-memories')
+            results["results"]["http"] = run_http_suite(create_app(), args.concurrency, args.requests,
+                                                        stream=args.stream, memories_user='bench-memories')
+            results["results"]["http"]["model_requests"] = fake_llm.requests
+        if 'memory' in suites:
+            print("Memory store microbenchmarks")
+            from .micro import run_memory_suite
+            results["results"]["memory"] = run_memory_suite(args.sizes)
+        if 's3' in suites:
+            print("S3 bulk transfers")
+            from .micro import run_s3_suite
+            results["results"]["s3"] = run_s3_suite(stand_in, args.s3_files, args.s3_file_size)
+        if 'dynamodb' in suites:
+            print("DynamoDB")
+            from .micro import run_dynamodb_suite
+            results["results"]["dynamodb"] = run_dynamodb_suite(stand_in, args.dynamodb_sizes)
+    finally:
+        fake_llm.stop()
+        if stand_in is not None:
+            stand_in.stop()
+
+    output = args.output or os.path.join(os.path.dirname(__file__), 'results',
+                                         time.strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2, default=str)
+    print(f"Results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
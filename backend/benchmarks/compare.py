@@ -0,0 +1,56 @@
+# Compares two benchmark result files:
+#
+#     python -m benchmarks.compare benchmarks/results/old.json benchmarks/results/new.json
+import json
+import sys
+
+# Lower is better for latencies and durations, higher for throughput
+METRICS = {
+    'p50_ms': 'lower', 'p95_ms': 'lower', 'p99_ms': 'lower', 'wall_s': 'lower', 'seconds': 'lower',
+    'rss_mb': 'lower', 'throughput_per_s': 'higher', 'bytes_per_second': 'higher',
+}
+
+
+def flatten(tree, path=()):
+    # Yields (path, metric, value) for every known metric in the results tree
+    for key, value in tree.items():
+        if isinstance(value, dict):
+            yield from flatten(value, path + (key,))
+        elif key in METRICS and isinstance(value, (int, float)):
+            yield '/'.join(path), key, value
+
+
+def compare(old, new, threshold=0.1):
+    """
+    :return: Lines describing every metric present in both runs, flagging
+             changes worse than ``threshold`` (a fraction) as regressions
+    """
+    old_values = {(path, metric): value for path, metric, value in flatten(old['results'])}
+    lines = []
+    for path, metric, value in flatten(new['results']):
+        before = old_values.get((path, metric))
+        if not before:
+            continue
+        change = (value - before) / before
+        worse = change > threshold if METRICS[metric] == 'lower' else change < -threshold
+        flag = 'REGRESSION' if worse else ''
+        lines.append(f"{path:45} {metric:18} {before:>12.3f} -> {value:>12.3f} {change:+8.1%} {flag}")
+    return lines
+
+
+def main(argv=None):
+    argv = argv if argv is not None else sys.argv[1:]
+    if len(argv) != 2:
+        sys.exit("usage: python -m benchmarks.compare OLD.json NEW.json")
+    with open(argv[0]) as f:
+        old = json.load(f)
+    with open(argv[1]) as f:
+        new = json.load(f)
+    lines = compare(old, new)
+    print('\n'.join(lines))
+    if any(line.endswith('REGRESSION') for line in lines):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
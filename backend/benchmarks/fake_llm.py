@@ -0,0 +1,102 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeLLMServer:
+    """
+    Minimal OpenAI compatible chat completions server for benchmarks.
+
+    Every reply waits ``latency`` seconds before the first byte. Streaming
+    replies then send ``chunks`` deltas ``chunk_delay`` seconds apart.
+
+    :param reply: Text of every reply
+    """
+
+    def __init__(self, latency=0.5, chunks=20, chunk_delay=0.02, reply="Okaeri! I missed you so much~"):
+        self.latency = latency
+        self.chunks = chunks
+        self.chunk_delay = chunk_delay
+        self.reply = reply
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/v1"
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                with fake._lock:
+                    fake.requests += 1
+                time.sleep(fake.latency)
+                prompt_tokens = sum(len(m.get('content', '')) // 4 + 1 for m in body.get('messages', []))
+                if body.get('stream'):
+                    self._stream(body, prompt_tokens)
+                else:
+                    self._complete(body, prompt_tokens)
+
+            def _complete(self, body, prompt_tokens):
+                payload = json.dumps({
+                    "id": "chatcmpl-bench", "object": "chat.completion", "created": int(time.time()),
+                    "model": body.get('model', 'bench'),
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": fake.reply}}],
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(fake.reply) // 4 + 1,
+                              "total_tokens": prompt_tokens + len(fake.reply) // 4 + 1},
+                }).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _stream(self, body, prompt_tokens):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                step = max(1, len(fake.reply) // max(1, fake.chunks))
+                for start in range(0, len(fake.reply), step):
+                    chunk = {"id": "chatcmpl-bench", "object": "chat.completion.chunk",
+                             "created": int(time.time()), "model": body.get('model', 'bench'),
+                             "choices": [{"index": 0, "finish_reason": None,
+                                          "delta": {"content": fake.reply[start:start + step]}}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+                    self.wfile.flush()
+                    time.sleep(fake.chunk_delay)
+                if (body.get('stream_options') or {}).get('include_usage'):
+                    completion_tokens = len(fake.reply) // 4 + 1
+                    chunk = {"id": "chatcmpl-bench", "object": "chat.completion.chunk",
+                             "created": int(time.time()), "model": body.get('model', 'bench'), "choices": [],
+                             "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                                       "total_tokens": prompt_tokens + completion_tokens}}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-llm', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
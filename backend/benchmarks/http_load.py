@@ -0,0 +1,110 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from werkzeug.serving import make_server
+
+from .stats import summarize
+
+
+class AppServer:
+    """
+    Serves ``create_app()`` on a local port with werkzeug's threaded server,
+    so requests go through real sockets like they would in production.
+    """
+
+    def __init__(self, app):
+        self._server = make_server('127.0.0.1', 0, app, threaded=True)
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='bench-app', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+
+
+def run_load(send, concurrency, requests):
+    """
+    Calls ``send(client, i)`` ``requests`` times from ``concurrency`` threads.
+    A call counts as an error if it raises or returns a status >= 400.
+
+    :return: Summary from stats.summarize
+    """
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    with httpx.Client(timeout=120, limits=limits) as client:
+        def one(i):
+            nonlocal errors
+            started = time.perf_counter()
+            try:
+                status = send(client, i)
+            except Exception:
+                status = None
+            elapsed = time.perf_counter() - started
+            with lock:
+                if status is None or status >= 400:
+                    errors += 1
+                else:
+                    latencies.append(elapsed)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(one, range(requests)))
+        wall = time.perf_counter() - started
+    return summarize(latencies, wall, errors)
+
+
+def chat_sender(base_url, stream=False):
+    # Every message is unique and opts out of the reply cache, so each one reaches the model
+    path = '/chat_api/chat/stream' if stream else '/chat_api/chat'
+
+    def send(client, i):
+        payload = {"message": f"Benchmark message {i}: how was your day?", "cache": False,
+                   "user_id": f"bench-{i % 50}"}
+        if not stream:
+            return client.post(base_url + path, json=payload).status_code
+        with client.stream('POST', base_url + path, json=payload) as response:
+            for _ in response.iter_bytes():
+                pass
+            return response.status_code
+
+    return send
+
+
+def memories_sender(base_url, user_id):
+    def send(client, i):
+        return client.get(base_url + '/chat_api/memories', params={'user_id': user_id}).status_code
+
+    return send
+
+
+def run_http_suite(app, concurrency_levels, requests, stream=False, memories_user='default'):
+    """
+    Load tests /chat_api/chat and /chat_api/memories at each concurrency level.
+
+    :return: {"chat": {concurrency: summary}, "memories": {concurrency: summary}}
+    """
+    server = AppServer(app).start()
+    results = {"chat": {}, "memories": {}}
+    try:
+        for concurrency in concurrency_levels:
+            results["chat"][str(concurrency)] = run_load(
+                chat_sender(server.base_url, stream), concurrency, requests)
+            results["memories"][str(concurrency)] = run_load(
+                memories_sender(server.base_url, memories_user), concurrency, requests)
+            print(f"  concurrency {concurrency}: chat p50 {results['chat'][str(concurrency)]['p50_ms']} ms, "
+                  f"memories p50 {results['memories'][str(concurrency)]['p50_ms']} ms")
+    finally:
+        server.stop()
+    return results
@@ -0,0 +1,137 @@
+import os
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from .stats import summarize
+
+TIMEFRAMES = ['day', 'week', 'month', 'year', 'indefinitely']
+WORDS = ('anime cats coffee piano rain ramen school work sleep games music movie '
+         'travel tokyo birthday exam friend sister dog garden').split()
+
+
+def make_memories(count, seed_offset=0):
+    # Deterministic mix of timeframes, ages and contents, with no duplicates
+    now = datetime.now()
+    for i in range(count):
+        n = i + seed_offset
+        yield {
+            "id": str(uuid.UUID(int=n)),
+            "timeframe": TIMEFRAMES[n % len(TIMEFRAMES)],
+            "content": f"User likes {WORDS[n % len(WORDS)]} and {WORDS[(n * 7) % len(WORDS)]} #{n}",
+            "timestamp": (now - timedelta(hours=n % 20)).isoformat(),
+        }
+
+
+def timed(function, repeats):
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(repeats):
+        call_started = time.perf_counter()
+        function()
+        latencies.append(time.perf_counter() - call_started)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def run_memory_suite(sizes, repeats=20):
+    """
+    Memory store microbenchmarks against a fresh SQLite database per size:
+    bulk save, cold load (new process view), warm load, search, saving one
+    more memory, and pruning a loaded list.
+    """
+    from app.chatbotPlayground import prune_expired_memories
+    from app.memory import MemoryStore, SQLiteMemoryBackend
+
+    results = {}
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            db_path = os.path.join(directory, 'memories.db')
+            store = MemoryStore(SQLiteMemoryBackend(db_path))
+
+            save = timed(lambda: store.add(make_memories(size)), 1)
+            cold = timed(lambda: MemoryStore(SQLiteMemoryBackend(db_path)).load(), min(repeats, 5))
+            warm = timed(store.load, repeats)
+            search = timed(lambda: store.search("does she like coffee and piano?", 8), repeats)
+            counter = iter(range(size, size + repeats))
+            save_one = timed(lambda: store.add(make_memories(1, seed_offset=next(counter))), repeats)
+            memories = store.load()
+            prune = timed(lambda: prune_expired_memories(memories), min(repeats, 5))
+            store.close()
+
+        results[str(size)] = {"save_all": save, "load_cold": cold, "load_warm": warm,
+                              "search": search, "save_one": save_one, "prune": prune}
+        print(f"  {size} memories: save {save['wall_s']} s, cold load p50 {cold['p50_ms']} ms, "
+              f"warm load p50 {warm['p50_ms']} ms, search p50 {search['p50_ms']} ms")
+    return results
+
+
+def run_s3_suite(stand_in, files=200, file_size=256 * 1024, workers=8):
+    """
+    Bulk S3 transfers through the S3 service against the stand-in: parallel
+    upload, listing, parallel download and batched delete.
+    """
+    from app.services import S3
+
+    bucket_name = 'bench-media'
+    stand_in.create_bucket(bucket_name)
+    payload = os.urandom(file_size)
+
+    with tempfile.TemporaryDirectory() as directory, S3(stand_in.s3_client(max_pool_connections=workers * 4)) as s3:
+        paths = []
+        for i in range(files):
+            path = os.path.join(directory, f"asset-{i}.bin")
+            with open(path, 'wb') as f:
+                f.write(payload)
+            paths.append((path, f"asset-{i}.bin"))
+
+        results = {"upload": s3.upload_files(paths, bucket_name, 'project/', max_workers=workers)['stats']}
+        started = time.perf_counter()
+        listed = sum(1 for _ in s3.iter_objects(bucket_name, 'project/'))
+        results["list"] = {"count": listed, "wall_s": round(time.perf_counter() - started, 3)}
+        keys = [key for _, key in paths]
+        results["download"] = s3.download_files(keys, bucket_name, os.path.join(directory, 'out'),
+                                                'project/', max_workers=workers)['stats']
+        started = time.perf_counter()
+        urls = s3.get_item_urls(bucket_name, keys, prefix='project/')
+        results["presign"] = {"count": len(urls), "wall_s": round(time.perf_counter() - started, 3)}
+        results["delete"] = s3.delete_items(bucket_name, ['project/' + key for key in keys])['stats']
+
+    for name, stats in results.items():
+        print(f"  s3 {name}: {stats}")
+    return results
+
+
+def run_dynamodb_suite(stand_in, sizes):
+    """
+    DynamoDB memory backend and project listing against the stand-in.
+    """
+    from app.memory import DynamoDBMemoryBackend, MemoryStore
+    from app.services.dynamo_db import DynamoDB
+
+    stand_in.create_table('bench-memories', 'user_id', 'id')
+    stand_in.create_table('projects', 'user_id', 'project_id')
+    resource = stand_in.dynamodb_resource()
+    results = {}
+
+    for size in sizes:
+        user_id = f"bench-{size}"
+        store = MemoryStore(DynamoDBMemoryBackend(resource, 'bench-memories'))
+        save = timed(lambda: store.add(make_memories(size), user_id=user_id), 1)
+        cold = timed(lambda: MemoryStore(DynamoDBMemoryBackend(resource, 'bench-memories')).load(user_id), 3)
+        warm = timed(lambda: store.load(user_id), 10)
+        results[f"memories_{size}"] = {"save_all": save, "load_cold": cold, "load_warm": warm}
+        print(f"  dynamodb {size} memories: save {save['wall_s']} s, cold load p50 {cold['p50_ms']} ms, "
+              f"warm load p50 {warm['p50_ms']} ms")
+
+    table = resource.Table('projects')
+    with table.batch_writer() as batch:
+        for i in range(max(sizes)):
+            batch.put_item(Item={'user_id': 'bench', 'project_id': f"p{i:06}", 'name': f"Project {i}",
+                                 'description': 'x' * 500})
+    projects = DynamoDB(resource, cache_ttl=60)
+    results["get_projects_uncached"] = timed(lambda: projects.get_projects('bench', use_cache=False), 3)
+    results["get_projects_cached"] = timed(lambda: projects.get_projects('bench'), 20)
+    print(f"  dynamodb get_projects: uncached p50 {results['get_projects_uncached']['p50_ms']} ms, "
+          f"cached p50 {results['get_projects_cached']['p50_ms']} ms")
+    return results
@@ -0,0 +1,58 @@
+import os
+
+import boto3
+
+# moto's server accepts any credentials
+_CREDENTIALS = {
+    'aws_access_key_id': 'bench',
+    'aws_secret_access_key': 'bench',
+    'region_name': 'us-east-1',
+}
+
+
+class AWSStandIn:
+    """
+    Local S3 and DynamoDB for benchmarks. By default a moto server is
+    started in process; set BENCH_AWS_ENDPOINT_URL to use something already
+    running instead (MinIO, LocalStack, DynamoDB Local...).
+    """
+
+    def __init__(self):
+        self.endpoint_url = os.getenv('BENCH_AWS_ENDPOINT_URL', '')
+        self._server = None
+
+    def start(self):
+        if not self.endpoint_url:
+            from moto.server import ThreadedMotoServer
+
+            self._server = ThreadedMotoServer(ip_address='127.0.0.1', port=0, verbose=False)
+            self._server.start()
+            host, port = self._server.get_host_and_port()
+            self.endpoint_url = f"http://{host}:{port}"
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.stop()
+
+    def s3_client(self, max_pool_connections=50):
+        from botocore.config import Config as BotoConfig
+
+        return boto3.client('s3', endpoint_url=self.endpoint_url,
+                            config=BotoConfig(max_pool_connections=max_pool_connections), **_CREDENTIALS)
+
+    def dynamodb_resource(self):
+        return boto3.resource('dynamodb', endpoint_url=self.endpoint_url, **_CREDENTIALS)
+
+    def create_bucket(self, bucket_name):
+        self.s3_client().create_bucket(Bucket=bucket_name)
+
+    def create_table(self, table_name, partition_key, sort_key):
+        self.dynamodb_resource().create_table(
+            TableName=table_name,
+            KeySchema=[{'AttributeName': partition_key, 'KeyType': 'HASH'},
+                       {'AttributeName': sort_key, 'KeyType': 'RANGE'}],
+            AttributeDefinitions=[{'AttributeName': partition_key, 'AttributeType': 'S'},
+                                  {'AttributeName': sort_key, 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST',
+        )
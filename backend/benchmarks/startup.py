@@ -0,0 +1,137 @@
+# Import-time report for a chat worker's startup:
+#
+#     python -m benchmarks.startup [--max-seconds 1.0] [--top 15]
+#
+# Boots create_app() in fresh interpreters with -X importtime and reports
+# the boot time, peak RSS, the slowest imports and any heavy modules that got
+# loaded. Exits non-zero if a media dependency was imported or the boot took
+# longer than --max-seconds, so it can guard against startup regressions.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Reported when loaded at boot
+HEAVY_MODULES = ('moviepy', 'numpy', 'imageio', 'PIL', 'boto3', 'botocore', 'openai', 'httpx')
+# Only media routes and jobs need these, so a chat worker must not import them at boot
+FORBIDDEN_MODULES = ('moviepy', 'numpy', 'imageio', 'PIL', 'boto3', 'botocore')
+
+BOOT_SNIPPET = """
+import json, resource, sys, time
+started = time.perf_counter()
+from app import create_app
+create_app()
+seconds = time.perf_counter() - started
+print(json.dumps({"seconds": seconds,
+                  "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                  "modules": sorted(name for name in sys.modules if '.' not in name)}))
+"""
+
+
+def parse_importtime(output):
+    """
+    :return: [(module, self microseconds, cumulative microseconds, depth)]
+             from ``-X importtime`` output
+    """
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def boot_once(env):
+    with tempfile.TemporaryDirectory() as directory:
+        child_env = dict(os.environ, **env)
+        child_env.setdefault('OPENAI_API_KEY', 'startup-report')
+        child_env.setdefault('MEMORY_DB_PATH', os.path.join(directory, 'memories.db'))
+        child_env.setdefault('MEMORY_JOURNAL_PATH', os.path.join(directory, 'memories.journal'))
+        child_env.update({
+            'MEMORY_LEGACY_JSON_PATH': '',
+            'MEMORY_SWEEP_INTERVAL': '0',
+            # Measure the boot itself, not the background preloading
+            'SERVICES_PRELOAD': '',
+        })
+        completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', BOOT_SNIPPET],
+                                   cwd=BACKEND_DIR, env=child_env, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Booting the app failed:\n{completed.stderr[-4000:]}")
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["imports"] = parse_importtime(completed.stderr)
+    return result
+
+
+def startup_report(runs=3, top=15, env=None):
+    """
+    :return: Median boot time and peak RSS over ``runs`` boots, with the
+             import breakdown of the last one
+    """
+    boots = [boot_once(env or {}) for _ in range(runs)]
+    imports = boots[-1]["imports"]
+
+    by_package = defaultdict(int)
+    for name, self_us, _, _ in imports:
+        by_package[name.split('.', 1)[0]] += self_us
+    slowest_packages = sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:top]
+    slowest_modules = sorted(imports, key=lambda row: row[1], reverse=True)[:top]
+
+    return {
+        "seconds": round(statistics.median(boot["seconds"] for boot in boots), 4),
+        "rss_mb": round(statistics.median(boot["rss_mb"] for boot in boots), 1),
+        "import_seconds": round(sum(row[2] for row in imports if row[3] == 0) / 1e6, 4),
+        "modules_imported": len(imports),
+        "heavy_modules": [name for name in HEAVY_MODULES if name in boots[-1]["modules"]],
+        "slowest_packages": [{"package": name, "self_ms": round(us / 1000, 2)} for name, us in slowest_packages],
+        "slowest_modules": [{"module": name, "self_ms": round(self_us / 1000, 2),
+                             "cumulative_ms": round(cumulative_us / 1000, 2)}
+                            for name, self_us, cumulative_us, _ in slowest_modules],
+    }
+
+
+def check(report, max_seconds=None):
+    # Problems that should fail the check, empty if the startup is fine
+    problems = [f"{name} is imported at boot" for name in report["heavy_modules"] if name in FORBIDDEN_MODULES]
+    if max_seconds is not None and report["seconds"] > max_seconds:
+        problems.append(f"Boot took {report['seconds']} s, the budget is {max_seconds} s")
+    return problems
+
+
+def print_report(report):
+    print(f"  boot {report['seconds']} s (all imports {report['import_seconds']} s, "
+          f"{report['modules_imported']} modules), peak RSS {report['rss_mb']} MB")
+    print(f"  heavy modules loaded: {', '.join(report['heavy_modules']) or 'none'}")
+    print("  slowest packages (self time):")
+    for row in report["slowest_packages"]:
+        print(f"    {row['package']:30} {row['self_ms']:>9.2f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.startup',
+                                     description="Import-time report for the app's startup")
+    parser.add_argument('--runs', type=int, default=3, help="Boots to take the median of")
+    parser.add_argument('--top', type=int, default=15, help="Slowest packages and modules to list")
+    parser.add_argument('--max-seconds', type=float, default=None, help="Fail if the median boot is slower")
+    parser.add_argument('--json', action='store_true', help="Print the full report as JSON")
+    args = parser.parse_args(argv if argv is not None else sys.argv[1:])
+
+    report = startup_report(args.runs, args.top)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    problems = check(report, args.max_seconds)
+    if problems:
+        sys.exit('\n'.join(problems))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+import math
+
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies, wall_seconds, errors=0):
+    """
+    Latency percentiles (milliseconds) and throughput for one benchmark run.
+
+    :param latencies: Seconds per successful operation
+    :param wall_seconds: Wall clock time of the whole run
+    """
+    values = sorted(latencies)
+    to_ms = lambda value: round(value * 1000, 3) if value is not None else None
+    return {
+        "count": len(values),
+        "errors": errors,
+        "p50_ms": to_ms(percentile(values, 0.50)),
+        "p95_ms": to_ms(percentile(values, 0.95)),
+        "p99_ms": to_ms(percentile(values, 0.99)),
+        "max_ms": to_ms(values[-1] if values else None),
+        "mean_ms": to_ms(sum(values) / len(values) if values else None),
+        "wall_s": round(wall_seconds, 3),
+        "throughput_per_s": round(len(values) / wall_seconds, 2) if wall_seconds > 0 else None,
+    }
@@ -0,0 +1,66 @@
+import os
+import sys
+import tempfile
+
+# Config reads the environment once at import, so point every path it
+# derives at a scratch directory before any app module is imported
+_scratch = tempfile.mkdtemp(prefix='waifu-tests-')
+os.environ.setdefault('OPENAI_API_KEY', 'test')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'test')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'test')
+os.environ['MEMORY_DB_PATH'] = os.path.join(_scratch, 'memories.db')
+os.environ['MEMORY_JOURNAL_PATH'] = os.path.join(_scratch, 'memories.journal')
+os.environ['MEMORY_LEGACY_JSON_PATH'] = os.path.join(_scratch, 'memories.json')
+os.environ['REPLY_CACHE_PATH'] = os.path.join(_scratch, 'reply_cache.db')
+os.environ['MEDIA_CACHE_DIR'] = os.path.join(_scratch, 'media-cache')
+os.environ['S3_TEMP_ROOT'] = os.path.join(_scratch, 's3')
+os.environ['SESSION_DB_PATH'] = ''
+# Background threads stay off; tests call sweep() and merge_journal() themselves
+os.environ['MEMORY_SWEEP_INTERVAL'] = '0'
+os.environ['MEMORY_JOURNAL_MERGE_INTERVAL'] = '0'
+os.environ['SERVICES_PRELOAD'] = ''
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+
+class FakeLLM:
+    """
+    Stands in for the LLM gateway: every call answers ``reply``, streamed
+    in chunks of ``chunk_size`` characters. The prompts it got are kept in ``calls``.
+    """
+
+    def __init__(self, reply='Hello!', chunk_size=4):
+        self.reply = reply
+        self.chunk_size = chunk_size
+        self.calls = []
+
+    def complete(self, messages, model=None, deadline=None):
+        self.calls.append(messages)
+        return self.reply
+
+    def stream(self, messages, model=None, deadline=None):
+        self.calls.append(messages)
+        for start in range(0, len(self.reply), self.chunk_size):
+            yield self.reply[start:start + self.chunk_size]
+
+
+@pytest.fixture
+def llm():
+    return FakeLLM()
+
+
+@pytest.fixture
+def app(llm):
+    from app import create_app
+
+    application = create_app()
+    application.extensions['services'].register('llm', lambda: llm)
+    return application
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
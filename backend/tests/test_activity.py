@@ -0,0 +1,101 @@
+import threading
+import time
+
+import pytest
+
+from app.chat.activity import (DISTRACTING, PRODUCTIVE, ActivityDecision, ActivityPipeline, activity_domain,
+                               classify_domain, parse_activity_alert)
+
+
+class Settled:
+    # Collects the decisions handed to on_settle
+    def __init__(self):
+        self.decisions = []
+        self.event = threading.Event()
+
+    def __call__(self, decision):
+        self.decisions.append(decision)
+        self.event.set()
+
+
+def test_parse_and_classify():
+    assert parse_activity_alert("<ACTIVITY ALERT: https://www.youtube.com/watch?v=1>") == "https://www.youtube.com/watch?v=1"
+    assert parse_activity_alert("hello") is None
+    assert activity_domain("https://m.youtube.com/watch") == 'youtube.com'
+    assert classify_domain('docs.google.com') == PRODUCTIVE
+    assert classify_domain(activity_domain('YouTube')) == DISTRACTING
+    assert classify_domain('example.org') is None
+
+
+def test_single_alerts_are_answered_straight_away():
+    pipeline = ActivityPipeline(burst_window=0)
+    assert pipeline.handle('s', "https://github.com/x").action == ActivityDecision.REPLY
+    assert pipeline.handle('s', "https://example.org").action == ActivityDecision.ESCALATE
+    assert pipeline.handle('s', "chrome://newtab").action == ActivityDecision.SKIP
+
+
+def test_repeats_of_the_same_site_are_skipped():
+    pipeline = ActivityPipeline(burst_window=0, repeat_window=600)
+    assert pipeline.handle('s', "https://github.com/a").action == ActivityDecision.REPLY
+    assert pipeline.handle('s', "https://github.com/b").action == ActivityDecision.SKIP
+    assert pipeline.handle('other', "https://github.com/a").action == ActivityDecision.REPLY
+
+
+def test_burst_is_coalesced_to_its_newest_alert():
+    pipeline = ActivityPipeline(burst_window=0.2)
+    settled = [Settled() for _ in range(3)]
+    started = time.monotonic()
+    first = pipeline.handle('s', "https://github.com", settled[0])
+    rest = [pipeline.handle('s', url, callback) for url, callback in
+            zip(["https://reddit.com", "https://youtube.com"], settled[1:])]
+    # Nothing waited for the window
+    assert time.monotonic() - started < 0.1
+    assert first.action == ActivityDecision.REPLY and first.domain == 'github.com'
+    assert [decision.action for decision in rest] == [ActivityDecision.SKIP] * 2
+
+    assert settled[2].event.wait(2)
+    decision, = settled[2].decisions
+    assert decision.action == ActivityDecision.REPLY and decision.domain == 'youtube.com'
+    assert 'youtube.com' in decision.reply
+    time.sleep(0.1)
+    assert settled[0].decisions == [] and settled[1].decisions == []
+
+
+def test_alert_after_a_settled_burst_starts_a_new_window():
+    pipeline = ActivityPipeline(burst_window=0.2)
+    pipeline.handle('s', "https://github.com")
+    settled = Settled()
+    pipeline.handle('s', "https://reddit.com", settled)
+    assert settled.event.wait(2)
+    late = Settled()
+    assert pipeline.handle('s', "https://youtube.com", late).action == ActivityDecision.SKIP
+    assert late.event.wait(2)
+    assert late.decisions[0].domain == 'youtube.com'
+
+
+@pytest.fixture
+def burst_pipeline(monkeypatch):
+    from app.chat import turns
+
+    pipeline = ActivityPipeline(burst_window=0.2)
+    monkeypatch.setattr(turns, 'activity_pipeline', pipeline)
+    return pipeline
+
+
+def test_newest_alert_of_a_burst_lands_in_the_session(client, llm, burst_pipeline):
+    session_id = client.post('/chat_api/chat', json={"message": "hi", "cache": False}).get_json()['session_id']
+    first = client.post('/chat_api/chat', json={"message": "<ACTIVITY ALERT: https://github.com>",
+                                                "session_id": session_id}).get_json()
+    assert first['reply']
+    skipped = client.post('/chat_api/chat', json={"message": "<ACTIVITY ALERT: https://youtube.com>",
+                                                  "session_id": session_id}).get_json()
+    assert skipped['skipped'] is True
+
+    from app.chat import get_session_store
+    session = get_session_store().get_or_create(session_id)
+    deadline = time.monotonic() + 2
+    while len(session.snapshot()) < 6 and time.monotonic() < deadline:
+        time.sleep(0.02)
+    history = session.snapshot()
+    assert history[-2]['content'] == "<ACTIVITY ALERT: https://youtube.com>"
+    assert 'youtube.com' in history[-1]['content']
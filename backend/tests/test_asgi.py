@@ -0,0 +1,95 @@
+import asyncio
+import json
+import threading
+
+import httpx
+import pytest
+
+from app.asgi import ChatASGIApp
+
+
+class FakeAsyncLLM:
+    # Async twin of conftest's FakeLLM; ``release`` holds every call until set
+    def __init__(self, reply):
+        self.reply = reply
+        self.release = None
+        self.threads = set()
+
+    async def complete(self, messages, model=None, deadline=None):
+        self.threads.add(threading.get_ident())
+        if self.release is not None:
+            await self.release.wait()
+        return self.reply
+
+    async def stream(self, messages, model=None, deadline=None):
+        for start in range(0, len(self.reply), 3):
+            yield self.reply[start:start + 3]
+
+
+@pytest.fixture
+def asgi_app(app):
+    application = ChatASGIApp(app)
+    application.gateway = FakeAsyncLLM("Hi <REMEMBER THIS FOR week: async tea> there")
+    yield application
+    application.executor.shutdown(wait=False)
+
+
+def request(asgi_app, *calls):
+    async def run():
+        transport = httpx.ASGITransport(app=asgi_app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return await asyncio.gather(*(call(client) for call in calls))
+    return asyncio.run(run())
+
+
+def test_chat_matches_the_flask_view(asgi_app):
+    response, = request(asgi_app, lambda client: client.post(
+        '/chat_api/chat', json={"message": "hi", "user_id": "asgi-user", "cache": False}))
+    assert response.status_code == 200
+    assert response.headers['x-request-id']
+    body = response.json()
+    assert body['reply'] == "Hi there" and body['session_id']
+    memories, = request(asgi_app, lambda client: client.get('/chat_api/memories?user_id=asgi-user'))
+    assert [memory['content'] for memory in memories.json()] == ['async tea']
+
+
+def test_stream_sends_deltas_then_done(asgi_app):
+    response, = request(asgi_app, lambda client: client.post(
+        '/chat_api/chat/stream', json={"message": "hi", "user_id": "asgi-stream", "cache": False}))
+    blocks = [block for block in response.text.split('\n\n') if block]
+    assert blocks[-1].startswith('event: done')
+    deltas = ''.join(json.loads(block[len('data: '):])['delta'] for block in blocks[:-1])
+    assert 'REMEMBER' not in deltas
+
+
+def test_missing_message_is_rejected(asgi_app):
+    response, = request(asgi_app, lambda client: client.post('/chat_api/chat', json={}))
+    assert response.status_code == 400
+
+
+def test_concurrent_chats_wait_on_the_loop_not_on_threads(asgi_app):
+    # Every call is parked on the model at once; with a thread per chat this would need 50 threads
+    count = 50
+
+    async def chat(client):
+        return await client.post('/chat_api/chat', json={"message": f"hi {id(client)}", "cache": False,
+                                                         "user_id": "asgi-many"})
+
+    async def run():
+        asgi_app.gateway.release = asyncio.Event()
+        transport = httpx.ASGITransport(app=asgi_app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            pending = [asyncio.ensure_future(chat(client)) for _ in range(count)]
+            await asyncio.sleep(0.3)
+            asgi_app.gateway.release.set()
+            return await asyncio.gather(*pending)
+
+    responses = asyncio.run(run())
+    assert all(response.status_code == 200 for response in responses)
+    assert len(asgi_app.gateway.threads) == 1
+
+
+def test_other_routes_fall_through_to_flask(asgi_app):
+    response, = request(asgi_app, lambda client: client.get('/metrics'))
+    assert response.status_code == 200
+    assert 'waifu_stage_duration_seconds' in response.text
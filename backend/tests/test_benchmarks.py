@@ -0,0 +1,70 @@
+import json
+
+import pytest
+from openai import OpenAI
+
+from benchmarks.compare import compare, main
+from benchmarks.fake_llm import FakeLLMServer
+from benchmarks.stats import percentile, summarize
+
+
+def test_percentiles_use_the_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 0.50) == 50
+    assert percentile(values, 0.99) == 99
+    assert percentile([7], 0.95) == 7
+    assert percentile([], 0.5) is None
+
+
+def test_summarize_reports_milliseconds_and_throughput():
+    summary = summarize([0.002, 0.001, 0.003, 0.004], wall_seconds=2, errors=1)
+    assert summary['count'] == 4 and summary['errors'] == 1
+    assert (summary['p50_ms'], summary['max_ms'], summary['mean_ms']) == (2.0, 4.0, 2.5)
+    assert summary['throughput_per_s'] == 2.0
+    assert summarize([], 0)['p50_ms'] is None
+
+
+def run(results):
+    return {"results": results}
+
+
+def test_compare_flags_regressions_in_the_right_direction():
+    old = run({"chat": {"c8": {"p95_ms": 100.0, "throughput_per_s": 50.0}}, "s3": {"seconds": 2.0}})
+    new = run({"chat": {"c8": {"p95_ms": 105.0, "throughput_per_s": 40.0}}, "s3": {"seconds": 1.0},
+               "new_only": {"p95_ms": 1.0}})
+    lines = {line.split()[1]: line for line in compare(old, new)}
+    assert set(lines) == {'p95_ms', 'throughput_per_s', 'seconds'}
+    assert not lines['p95_ms'].endswith('REGRESSION')
+    assert lines['throughput_per_s'].endswith('REGRESSION')
+    assert not lines['seconds'].endswith('REGRESSION')
+
+
+def test_compare_exits_nonzero_on_a_regression(tmp_path, capsys):
+    old, new = tmp_path / 'old.json', tmp_path / 'new.json'
+    old.write_text(json.dumps(run({"chat": {"p50_ms": 10.0}})))
+    new.write_text(json.dumps(run({"chat": {"p50_ms": 10.5}})))
+    main([str(old), str(new)])
+    new.write_text(json.dumps(run({"chat": {"p50_ms": 20.0}})))
+    with pytest.raises(SystemExit) as exit_info:
+        main([str(old), str(new)])
+    assert exit_info.value.code == 1
+    assert 'REGRESSION' in capsys.readouterr().out
+
+
+@pytest.fixture
+def fake_llm():
+    server = FakeLLMServer(latency=0, chunks=4, chunk_delay=0, reply="Okaeri!").start()
+    yield server
+    server.stop()
+
+
+def test_fake_llm_server_speaks_the_openai_protocol(fake_llm):
+    client = OpenAI(api_key='bench', base_url=fake_llm.base_url)
+    reply = client.chat.completions.create(model='bench', messages=[{"role": "user", "content": "hi"}])
+    assert reply.choices[0].message.content == "Okaeri!"
+    stream = client.chat.completions.create(model='bench', messages=[{"role": "user", "content": "hi"}],
+                                            stream=True, stream_options={"include_usage": True})
+    chunks = list(stream)
+    assert ''.join(chunk.choices[0].delta.content for chunk in chunks if chunk.choices) == "Okaeri!"
+    assert chunks[-1].usage.completion_tokens > 0
+    assert fake_llm.requests == 2
@@ -0,0 +1,71 @@
+from app.chat.context import (ContextBuilder, ContextState, count_message_tokens, count_tokens,
+                              summarize_turns, truncate_to_tokens)
+
+
+def conversation(turns, words=40):
+    history = []
+    for number in range(turns):
+        history.append({"role": "user", "content": f"question {number} " + "word " * words})
+        history.append({"role": "assistant", "content": f"answer {number} " + "word " * words})
+    return history
+
+
+def test_small_history_is_sent_as_is():
+    history = conversation(2)
+    state = ContextState()
+    messages = ContextBuilder(token_budget=6000).build("persona", ["- likes tea"], history, state)
+    assert messages[0] == {"role": "system", "content": "persona"}
+    assert messages[2:] == history
+    assert state.summarized_upto == 0 and state.summary == ''
+
+
+def test_long_history_is_compacted_into_the_summary():
+    builder = ContextBuilder(token_budget=800, memory_tokens=100, summary_tokens=200)
+    history = conversation(20)
+    state = ContextState()
+    messages = builder.build("persona", [], history, state)
+
+    assert state.summarized_upto > 0
+    assert 'question 0' in state.summary or 'answer' in state.summary
+    assert messages[-1] == history[-1]
+    assert messages[2]['content'].startswith("Summary of the earlier conversation:")
+    assert count_message_tokens(messages) <= builder.token_budget
+
+
+def test_compaction_only_happens_again_once_the_history_is_full():
+    builder = ContextBuilder(token_budget=800, memory_tokens=100, summary_tokens=200)
+    history = conversation(20)
+    state = ContextState()
+    builder.build("persona", [], history, state)
+    summarized = state.summarized_upto
+    history.append({"role": "user", "content": "short"})
+    builder.build("persona", [], history, state)
+    assert state.summarized_upto == summarized
+
+
+def test_oversized_newest_message_is_truncated_to_the_budget():
+    builder = ContextBuilder(token_budget=300, memory_tokens=50, summary_tokens=50)
+    history = [{"role": "user", "content": "word " * 5000}]
+    messages = builder.build("persona", [], history, ContextState())
+    assert count_message_tokens(messages) <= builder.token_budget
+    assert history[0]['content'] == "word " * 5000
+
+
+def test_newest_memories_are_kept_within_their_budget():
+    builder = ContextBuilder(memory_tokens=30)
+    lines = [f"- memory number {number} " + "x " * 5 for number in range(20)]
+    kept = builder._fit_memories(lines)
+    assert kept == lines[-len(kept):]
+    assert 0 < len(kept) < len(lines)
+
+
+def test_summary_drops_the_oldest_lines_past_its_budget():
+    summary = summarize_turns('', conversation(30, words=10), max_tokens=50)
+    assert count_tokens(summary) <= 50
+    assert 'answer 29' in summary
+
+
+def test_truncate_to_tokens():
+    assert truncate_to_tokens("short", 100) == "short"
+    assert truncate_to_tokens("anything", 0) == ''
+    assert count_tokens(truncate_to_tokens("word " * 100, 10)) <= 10
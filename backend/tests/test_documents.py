@@ -0,0 +1,80 @@
+import json
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from app.services import documents
+from app.services.documents import DocumentConflict, DocumentStore, encode_json
+
+BUCKET = 'media'
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setattr(documents, '_document_cache', documents._DocumentCache(10 ** 6))
+    with mock_aws():
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def test_plain_json_by_default_and_compressed_on_request(s3):
+    store = DocumentStore(s3)
+    store.put(BUCKET, 'plain.json', {"text": "hi"})
+    plain = s3.get_object(Bucket=BUCKET, Key='plain.json')
+    assert 'ContentEncoding' not in plain and json.loads(plain['Body'].read()) == {"text": "hi"}
+
+    store.put(BUCKET, 'packed.json', {"text": "hi"}, encoding='gzip')
+    assert s3.get_object(Bucket=BUCKET, Key='packed.json')['ContentEncoding'] == 'gzip'
+    assert store.get(BUCKET, 'packed.json')[0] == {"text": "hi"}
+
+
+def test_integer_keys_are_written_as_strings():
+    assert json.loads(encode_json({1: 'a', 'b': {2: 'c'}})) == {"1": "a", "b": {"2": "c"}}
+
+
+def test_reads_revalidate_the_cached_copy(s3):
+    store = DocumentStore(s3)
+    etag = store.put(BUCKET, 'doc.json', {"n": 1})
+    document, read_etag = store.get(BUCKET, 'doc.json')
+    assert (document, read_etag) == ({"n": 1}, etag)
+    document["n"] = 99
+    assert store.get(BUCKET, 'doc.json')[0] == {"n": 1}
+
+    # Another writer changes it behind the cache's back
+    s3.put_object(Bucket=BUCKET, Key='doc.json', Body=b'{"n": 2}')
+    assert store.get(BUCKET, 'doc.json')[0] == {"n": 2}
+
+
+def test_missing_document_raises_key_error(s3):
+    with pytest.raises(KeyError):
+        DocumentStore(s3).get(BUCKET, 'missing.json')
+
+
+def test_conditional_put_conflicts(s3):
+    store = DocumentStore(s3)
+    etag = store.put(BUCKET, 'doc.json', {"n": 1}, if_none_match='*')
+    with pytest.raises(DocumentConflict):
+        store.put(BUCKET, 'doc.json', {"n": 2}, if_none_match='*')
+    store.put(BUCKET, 'doc.json', {"n": 2}, if_match=etag)
+    with pytest.raises(DocumentConflict):
+        store.put(BUCKET, 'doc.json', {"n": 3}, if_match=etag)
+
+
+def test_update_reruns_the_change_after_a_concurrent_write(s3):
+    store = DocumentStore(s3)
+    store.put(BUCKET, 'doc.json', {"n": 0})
+    seen = []
+
+    def change(document):
+        seen.append(document["n"])
+        if len(seen) == 1:
+            # Someone else gets in between our read and write
+            store.put(BUCKET, 'doc.json', {"n": 10})
+        return {"n": document["n"] + 1}
+
+    document, _ = store.update(BUCKET, 'doc.json', change)
+    assert seen == [0, 10]
+    assert document == {"n": 11}
+    assert store.get(BUCKET, 'doc.json')[0] == {"n": 11}
@@ -0,0 +1,70 @@
+import boto3
+import pytest
+from moto import mock_aws
+
+from app.memory import DynamoDBMemoryBackend, MemoryStore
+from app.memory.backends import content_hash
+
+
+@pytest.fixture
+def dynamo_db():
+    with mock_aws():
+        resource = boto3.resource('dynamodb', region_name='us-east-1')
+        resource.create_table(
+            TableName='memories',
+            KeySchema=[{'AttributeName': 'user_id', 'KeyType': 'HASH'},
+                       {'AttributeName': 'id', 'KeyType': 'RANGE'}],
+            AttributeDefinitions=[{'AttributeName': 'user_id', 'AttributeType': 'S'},
+                                  {'AttributeName': 'id', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST',
+        )
+        yield resource
+
+
+def row(memory_id, content='tea', expires_at=None):
+    return {"id": memory_id, "timeframe": "week", "content": content, "timestamp": f"2024-01-01T00:00:{memory_id[-2:]}",
+            "content_hash": content_hash(content), "expires_at": expires_at}
+
+
+def test_insert_counts_only_new_rows(dynamo_db):
+    backend = DynamoDBMemoryBackend(dynamo_db, version_ttl=0)
+    stored, version = backend.insert('u', [row('m-01', 'a'), row('m-02', 'b', expires_at=1e10)])
+    assert (stored, version) == (2, 1)
+    stored, version = backend.insert('u', [row('m-01', 'a'), row('m-03', 'c')])
+    assert (stored, version) == (1, 2)
+    assert backend.insert('u', [row('m-01', 'a')]) == (0, 2)
+    assert backend.count('u') == 3
+
+
+def test_load_round_trips_rows_in_timestamp_order(dynamo_db):
+    backend = DynamoDBMemoryBackend(dynamo_db)
+    backend.insert('u', [row(f'm-{number:02d}', f'fact {number}') for number in reversed(range(20))])
+    rows, version = backend.load('u')
+    assert [r['content'] for r in rows] == [f'fact {number}' for number in range(20)]
+    assert version == 1
+    assert backend.load('other') == ([], 0)
+
+
+def test_delete_bumps_the_version(dynamo_db):
+    backend = DynamoDBMemoryBackend(dynamo_db)
+    backend.insert('u', [row('m-01'), row('m-02', 'b')])
+    assert backend.delete('u', ['m-01']) == 2
+    assert [r['id'] for r in backend.load('u')[0]] == ['m-02']
+
+
+def test_version_reads_are_reused_for_version_ttl(dynamo_db):
+    ours, theirs = DynamoDBMemoryBackend(dynamo_db, version_ttl=60), DynamoDBMemoryBackend(dynamo_db)
+    assert ours.version('u') == 0
+    theirs.insert('u', [row('m-01')])
+    assert ours.version('u') == 0
+    ours.version_ttl = 0
+    assert ours.version('u') == 1
+
+
+def test_store_over_dynamodb(dynamo_db):
+    store = MemoryStore(DynamoDBMemoryBackend(dynamo_db, version_ttl=0))
+    store.add([{"content": "tea", "timeframe": "week"}, {"content": "TEA", "timeframe": "week"}], user_id='a')
+    store.add([{"content": "cats", "timeframe": "indefinitely"}], user_id='b')
+    other = MemoryStore(DynamoDBMemoryBackend(dynamo_db, version_ttl=0))
+    assert [memory['content'] for memory in other.load('a')] == ['tea']
+    assert [memory['content'] for memory in other.load('b')] == ['cats']
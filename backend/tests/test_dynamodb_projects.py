@@ -0,0 +1,80 @@
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from moto import mock_aws
+
+from app.services.dynamo_db import DynamoDB, UnprocessedKeysError
+
+
+@pytest.fixture
+def dynamo_db():
+    with mock_aws():
+        resource = boto3.resource('dynamodb', region_name='us-east-1')
+        resource.create_table(
+            TableName='projects',
+            KeySchema=[{'AttributeName': 'user_id', 'KeyType': 'HASH'},
+                       {'AttributeName': 'project_id', 'KeyType': 'RANGE'}],
+            AttributeDefinitions=[{'AttributeName': 'user_id', 'AttributeType': 'S'},
+                                  {'AttributeName': 'project_id', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST',
+        )
+        table = resource.Table('projects')
+        with table.batch_writer() as batch:
+            for number in range(150):
+                batch.put_item(Item={'user_id': 'u', 'project_id': f'p{number:03d}', 'name': f'Project {number}',
+                                     'data': 'x' * 100})
+        yield resource
+
+
+def test_get_projects_reads_every_page(dynamo_db):
+    projects = DynamoDB(dynamo_db)
+    assert len(list(projects.iter_projects('u', page_size=7))) == 150
+    assert len(list(projects.iter_projects('u', page_size=7, limit=10))) == 10
+    assert len(projects.get_projects('u')) == 150
+
+
+def test_projection_handles_reserved_words(dynamo_db):
+    item = DynamoDB(dynamo_db).get_projects('u', projection=['project_id', 'name'])[0]
+    assert set(item) == {'project_id', 'name'}
+
+
+def test_get_projects_is_cached_until_invalidated(dynamo_db):
+    projects = DynamoDB(dynamo_db)
+    assert len(projects.get_projects('u')) == 150
+    dynamo_db.Table('projects').put_item(Item={'user_id': 'u', 'project_id': 'new'})
+    assert len(projects.get_projects('u')) == 150
+    assert len(projects.get_projects('u', use_cache=False)) == 151
+    projects.invalidate_projects('u')
+    assert len(projects.get_projects('u')) == 151
+
+
+def test_batch_get_projects(dynamo_db):
+    found = DynamoDB(dynamo_db).batch_get_projects('u', [f'p{number:03d}' for number in range(120)] + ['p000', 'nope'])
+    assert sorted(item['project_id'] for item in found) == [f'p{number:03d}' for number in range(120)]
+
+
+def test_batch_get_projects_raises_instead_of_returning_a_partial_result(dynamo_db, monkeypatch):
+    projects = DynamoDB(dynamo_db)
+    real = dynamo_db.batch_get_item
+    calls = []
+
+    def failing_second_call(**kwargs):
+        calls.append(kwargs)
+        if len(calls) == 2:
+            raise ClientError({'Error': {'Code': 'InternalServerError', 'Message': 'boom'}}, 'BatchGetItem')
+        return real(**kwargs)
+
+    monkeypatch.setattr(dynamo_db, 'batch_get_item', failing_second_call)
+    with pytest.raises(ClientError):
+        projects.batch_get_projects('u', [f'p{number:03d}' for number in range(150)])
+    assert len(calls) == 2
+
+
+def test_batch_get_projects_raises_when_keys_stay_unprocessed(dynamo_db, monkeypatch):
+    def never_processed(RequestItems):
+        return {'Responses': {'projects': []}, 'UnprocessedKeys': RequestItems}
+
+    monkeypatch.setattr(dynamo_db, 'batch_get_item', never_processed)
+    with pytest.raises(UnprocessedKeysError) as error:
+        DynamoDB(dynamo_db).batch_get_projects('u', ['p001', 'p002'], max_retries=1)
+    assert len(error.value.unprocessed_keys) == 2 and error.value.items == []
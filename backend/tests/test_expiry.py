@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.memory.expiry import ExpiryIndex, add_months, compute_expires_at
+from app.memory.store import is_memory_expired
+
+CREATED = '2024-01-31T12:00:00'
+
+
+def at(**delta):
+    return (datetime.fromisoformat(CREATED) + timedelta(**delta)).timestamp()
+
+
+@pytest.mark.parametrize('timeframe, expected', [
+    ('day', at(days=1)),
+    ('week', at(weeks=1)),
+    ('3 days', at(days=3)),
+    ('2 weeks', at(weeks=2)),
+    ('12 hours', at(hours=12)),
+    ('90 mins', at(minutes=90)),
+    ('  Week ', at(weeks=1)),
+])
+def test_durations(timeframe, expected):
+    assert compute_expires_at(CREATED, timeframe) == expected
+
+
+def test_months_clamp_to_the_end_of_shorter_months():
+    # 2024 is a leap year
+    assert compute_expires_at(CREATED, 'month') == datetime(2024, 2, 29, 12).timestamp()
+    assert compute_expires_at(CREATED, '13 months') == datetime(2025, 2, 28, 12).timestamp()
+    assert compute_expires_at(CREATED, 'year') == datetime(2025, 1, 31, 12).timestamp()
+
+
+def test_add_months_crosses_years():
+    assert add_months(datetime(2023, 11, 30), 3) == datetime(2024, 2, 29)
+
+
+def test_indefinitely_never_expires():
+    assert compute_expires_at(CREATED, 'indefinitely') is None
+    assert compute_expires_at(CREATED, ' INDEFINITELY ') is None
+
+
+@pytest.mark.parametrize('timeframe', ['', None, 'fortnight', '3', 'soon-ish'])
+def test_unknown_timeframes_expire_immediately(timeframe):
+    assert compute_expires_at(CREATED, timeframe) == at()
+
+
+def test_is_memory_expired():
+    memory = {"timestamp": CREATED, "timeframe": "day"}
+    assert not is_memory_expired(memory, datetime.fromisoformat(CREATED) + timedelta(hours=23))
+    assert is_memory_expired(memory, datetime.fromisoformat(CREATED) + timedelta(days=1))
+    assert not is_memory_expired({"timestamp": CREATED, "timeframe": "indefinitely"}, datetime(2100, 1, 1))
+
+
+def test_expiry_index_pops_only_due_ids_in_order():
+    index = ExpiryIndex([('b', 20.0), ('forever', None), ('a', 10.0)])
+    index.push('c', 30.0)
+    assert len(index) == 3
+    assert index.pop_due(5.0) == []
+    assert index.pop_due(20.0) == ['a', 'b']
+    assert index.pop_due(100.0) == ['c']
@@ -0,0 +1,155 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from openai import APIConnectionError, APIStatusError
+
+from app.llm import AsyncLLMGateway, LLMGateway, LLMOverloadedError, LLMTimeoutError
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+REQUEST = httpx.Request('POST', 'http://model/v1/chat/completions')
+
+
+def status_error(status, retry_after=None):
+    headers = {'retry-after': str(retry_after)} if retry_after is not None else {}
+    return APIStatusError("failed", response=httpx.Response(status, headers=headers, request=REQUEST), body=None)
+
+
+def completion(text):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))], usage=None)
+
+
+def chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))], usage=None)
+
+
+class FakeStream:
+    def __init__(self, parts):
+        self.parts = parts
+        self.closed = False
+
+    def __iter__(self):
+        return (chunk(part) for part in self.parts)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeBackend:
+    """
+    Shaped like an OpenAI client: ``outcomes`` are raised or returned by
+    successive create() calls, the last one repeating.
+    """
+
+    def __init__(self, *outcomes, delay=0):
+        self.outcomes = list(outcomes)
+        self.delay = delay
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, timeout=None, stream=False, **kwargs):
+        self.calls += 1
+        time.sleep(self.delay)
+        outcome = self.outcomes.pop(0) if len(self.outcomes) > 1 else self.outcomes[0]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def gateway(backend, **kwargs):
+    kwargs.setdefault('backoff_base', 0.001)
+    return LLMGateway(backend=backend, **kwargs)
+
+
+def test_transient_errors_are_retried():
+    backend = FakeBackend(status_error(503), APIConnectionError(request=REQUEST), completion("ok"))
+    assert gateway(backend).complete(MESSAGES) == "ok"
+    assert backend.calls == 3
+
+
+def test_client_errors_are_not_retried():
+    backend = FakeBackend(status_error(400))
+    with pytest.raises(APIStatusError):
+        gateway(backend).complete(MESSAGES)
+    assert backend.calls == 1
+
+
+def test_retries_give_up_after_max_retries():
+    backend = FakeBackend(status_error(500))
+    with pytest.raises(APIStatusError):
+        gateway(backend, max_retries=2).complete(MESSAGES)
+    assert backend.calls == 3
+
+
+def test_retry_after_past_the_deadline_times_out():
+    backend = FakeBackend(status_error(429, retry_after=30), completion("ok"))
+    started = time.monotonic()
+    with pytest.raises(LLMTimeoutError):
+        gateway(backend, deadline=1).complete(MESSAGES)
+    assert time.monotonic() - started < 0.5
+
+
+def test_in_flight_limit_queues_then_overloads():
+    backend = FakeBackend(completion("ok"), delay=0.3)
+    llm = gateway(backend, max_in_flight=1)
+    worker = threading.Thread(target=llm.complete, args=(MESSAGES,))
+    worker.start()
+    time.sleep(0.05)
+    with pytest.raises(LLMOverloadedError):
+        llm.complete(MESSAGES, deadline=0.1)
+    worker.join()
+    assert llm.complete(MESSAGES) == "ok"
+
+
+def test_stream_yields_deltas_and_closes_when_abandoned():
+    stream = FakeStream(["Hel", "lo", "!"])
+    llm = gateway(FakeBackend(stream), max_in_flight=1)
+    assert list(llm.stream(MESSAGES)) == ["Hel", "lo", "!"]
+    assert stream.closed
+
+    stream = FakeStream(["a", "b", "c"])
+    llm.backend = FakeBackend(stream)
+    deltas = llm.stream(MESSAGES)
+    next(deltas)
+    deltas.close()
+    assert stream.closed
+    # The in-flight slot came back too
+    llm.backend = FakeBackend(completion("ok"))
+    assert llm.complete(MESSAGES, deadline=0.2) == "ok"
+
+
+class FakeAsyncStream:
+    def __init__(self, parts):
+        self.parts = parts
+        self.closed = False
+
+    async def __aiter__(self):
+        for part in self.parts:
+            yield chunk(part)
+
+    async def close(self):
+        self.closed = True
+
+
+def test_async_gateway_retries_and_streams():
+    stream = FakeAsyncStream(["x", "y"])
+    outcomes = [status_error(502), completion("ok"), stream]
+
+    async def create(timeout=None, stream=False, **kwargs):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    async def run():
+        llm = AsyncLLMGateway(backend=SimpleNamespace(chat=SimpleNamespace(
+            completions=SimpleNamespace(create=create))), backoff_base=0.001)
+        reply = await llm.complete(MESSAGES)
+        deltas = [delta async for delta in llm.stream(MESSAGES)]
+        return reply, deltas
+
+    assert asyncio.run(run()) == ("ok", ["x", "y"])
+    assert stream.closed
@@ -0,0 +1,84 @@
+import json
+import logging
+import queue
+
+import pytest
+from prometheus_client import REGISTRY
+
+from app.logs import BoundedQueueHandler, StructuredFormatter, cap, log_event, parse_sample_rates
+from app.metrics import begin_request, end_request
+
+
+@pytest.fixture
+def logged(request):
+    # Routes the root logger into a queue of the given size for one test
+    size, options = getattr(request, 'param', (100, {}))
+    log_queue = queue.Queue(maxsize=size)
+    handler = BoundedQueueHandler(log_queue, **options)
+    root = logging.getLogger()
+    handlers, level = root.handlers, root.level
+    root.handlers, root.level = [handler], logging.INFO
+    yield log_queue
+    root.handlers, root.level = handlers, level
+
+
+def dropped(reason):
+    return REGISTRY.get_sample_value('waifu_log_records_dropped_total', {'reason': reason}) or 0
+
+
+def drain(log_queue):
+    records = []
+    while not log_queue.empty():
+        records.append(log_queue.get_nowait())
+    return records
+
+
+def test_cap_cuts_long_values_only():
+    assert cap(12, 3) == 12 and cap(None, 3) is None
+    assert cap('abc', 3) == 'abc'
+    assert cap('abcdef', 3) == 'abc...(+3 chars)'
+    assert cap(['x'] * 10, 5).startswith("['x',")
+
+
+def test_sample_rates_are_clamped_and_bad_ones_skipped():
+    assert parse_sample_rates(' a=0.5, b=2 ,c=x,,d=-1') == {'a': 0.5, 'b': 1.0, 'd': 0.0}
+
+
+@pytest.mark.parametrize('logged', [(100, {'message_max_chars': 10, 'field_max_chars': 4})], indirect=True)
+def test_records_are_capped_and_carry_the_request_id(logged):
+    _, token = begin_request('req-7')
+    try:
+        log_event('chat.reply', 'x' * 50, reply='y' * 50, tokens=123)
+    finally:
+        end_request(token)
+    record, = drain(logged)
+    assert record.msg.startswith('x' * 10 + '...')
+    assert record.fields == {'reply': 'yyyy...(+46 chars)', 'tokens': 123}
+    line = json.loads(StructuredFormatter().format(record))
+    assert (line['request_id'], line['event'], line['tokens']) == ('req-7', 'chat.reply', 123)
+
+
+@pytest.mark.parametrize('logged', [(2, {})], indirect=True)
+def test_full_queue_drops_instead_of_blocking(logged):
+    before = dropped('queue_full')
+    for number in range(5):
+        logging.info(f"record {number}")
+    assert len(drain(logged)) == 2
+    assert dropped('queue_full') == before + 3
+
+
+@pytest.mark.parametrize('logged', [(100, {'sample_rates': {'noisy': 0.0}})], indirect=True)
+def test_sampling_never_drops_warnings(logged):
+    before = dropped('sampled')
+    log_event('noisy', 'hit')
+    log_event('noisy', 'slow', level=logging.WARNING)
+    log_event('other', 'kept')
+    assert [record.msg for record in drain(logged)] == ['slow', 'kept']
+    assert dropped('sampled') == before + 1
+
+
+def test_text_format_puts_fields_after_the_message():
+    record = logging.LogRecord('app', logging.INFO, __file__, 1, 'saved', None, None)
+    record.event, record.fields = 'memory.saved', {'user_id': 'u1'}
+    line = StructuredFormatter('text').format(record)
+    assert line.endswith('INFO app: saved event=memory.saved user_id=u1')
@@ -0,0 +1,116 @@
+import os
+import threading
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from app.services.media_cache import MediaCache
+
+BUCKET = 'media'
+
+
+@pytest.fixture
+def s3():
+    with mock_aws():
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+class Counting:
+    # Wraps the client to count the calls the cache makes
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+
+        def call(*args, **kwargs):
+            self.calls.append(name)
+            return method(*args, **kwargs)
+        return call
+
+
+def test_second_acquire_is_served_from_disk(s3, tmp_path):
+    s3.put_object(Bucket=BUCKET, Key='clip.mp4', Body=b'video')
+    cache, client = MediaCache(str(tmp_path)), Counting(s3)
+    path = cache.acquire(client, BUCKET, 'clip.mp4', '.mp4')
+    assert path.endswith('.mp4') and open(path, 'rb').read() == b'video'
+    cache.release(path)
+    assert cache.acquire(client, BUCKET, 'clip.mp4', '.mp4') == path
+    assert client.calls == ['head_object', 'get_object']
+
+
+def test_new_version_is_downloaded_after_invalidate(s3, tmp_path):
+    s3.put_object(Bucket=BUCKET, Key='clip.mp4', Body=b'v1')
+    cache = MediaCache(str(tmp_path))
+    first = cache.acquire(s3, BUCKET, 'clip.mp4')
+    s3.put_object(Bucket=BUCKET, Key='clip.mp4', Body=b'v2')
+    cache.invalidate(BUCKET, 'clip.mp4')
+    second = cache.acquire(s3, BUCKET, 'clip.mp4')
+    assert second != first and open(second, 'rb').read() == b'v2'
+
+
+def test_object_overwritten_after_its_head_is_not_cached_under_the_old_etag(s3, tmp_path):
+    s3.put_object(Bucket=BUCKET, Key='clip.mp4', Body=b'v1')
+    cache = MediaCache(str(tmp_path))
+    real_head = s3.head_object
+
+    def head_then_overwrite(**kwargs):
+        response = real_head(**kwargs)
+        if not getattr(head_then_overwrite, 'done', False):
+            head_then_overwrite.done = True
+            s3.put_object(Bucket=BUCKET, Key='clip.mp4', Body=b'v2')
+        return response
+
+    client = Counting(s3)
+    client.head_object = head_then_overwrite
+    path = cache.acquire(client, BUCKET, 'clip.mp4')
+    assert open(path, 'rb').read() == b'v2'
+    assert path == cache._path(BUCKET, 'clip.mp4', real_head(Bucket=BUCKET, Key='clip.mp4')['ETag'].strip('"'), '')
+    assert cache.stats()['files'] == 1
+
+
+def test_failed_download_leaves_nothing_behind(s3, tmp_path):
+    s3.put_object(Bucket=BUCKET, Key='clip.mp4', Body=b'video')
+    cache = MediaCache(str(tmp_path))
+    client = Counting(s3)
+
+    def broken(**kwargs):
+        raise OSError('connection reset')
+
+    client.get_object = broken
+    with pytest.raises(OSError):
+        cache.acquire(client, BUCKET, 'clip.mp4')
+    assert cache._downloads == {}
+    assert os.listdir(tmp_path) == ['.lock']
+    assert open(cache.acquire(s3, BUCKET, 'clip.mp4'), 'rb').read() == b'video'
+
+
+def test_concurrent_fetches_share_one_download(s3, tmp_path):
+    s3.put_object(Bucket=BUCKET, Key='clip.mp4', Body=b'x' * 100000)
+    cache, client = MediaCache(str(tmp_path)), Counting(s3)
+    paths = []
+    threads = [threading.Thread(target=lambda: paths.append(cache.acquire(client, BUCKET, 'clip.mp4')))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(paths)) == 1
+    assert client.calls.count('get_object') == 1
+
+
+def test_eviction_skips_files_pinned_by_another_instance(s3, tmp_path):
+    for name in 'abc':
+        s3.put_object(Bucket=BUCKET, Key=name, Body=b'x' * 100)
+    # Two instances stand in for two worker processes sharing the directory
+    ours, theirs = MediaCache(str(tmp_path), max_bytes=250), MediaCache(str(tmp_path), max_bytes=250)
+    pinned = theirs.acquire(s3, BUCKET, 'a')
+    for name in 'bc':
+        ours.release(ours.acquire(s3, BUCKET, name))
+    assert os.path.exists(pinned)
+    assert ours.stats()['bytes'] <= 250
+    theirs.release(pinned)
@@ -0,0 +1,120 @@
+import os
+
+import pytest
+
+from app.memory import MemoryJournal, MemoryStore, SQLiteMemoryBackend
+from app.memory.journal import MERGING_SUFFIX
+
+OLD = '2000-01-01T00:00:00'
+
+
+@pytest.fixture
+def backend(tmp_path):
+    backend = SQLiteMemoryBackend(str(tmp_path / 'memories.db'))
+    yield backend
+    backend.close()
+
+
+@pytest.fixture
+def journal_path(tmp_path):
+    return str(tmp_path / 'memories.journal')
+
+
+def contents(memories):
+    return sorted(memory['content'] for memory in memories)
+
+
+def test_version_moves_with_journaled_writes(backend, journal_path):
+    store = MemoryStore(backend, journal=MemoryJournal(journal_path, fsync=False))
+    before = store.version()
+    store.add([{"content": "tea", "timeframe": "week"}])
+    journaled = store.version()
+    assert journaled != before
+    store.merge_journal()
+    assert store.version() not in (before, journaled)
+
+
+def test_journaled_memories_are_visible_before_the_merge(backend, journal_path):
+    store = MemoryStore(backend, journal=MemoryJournal(journal_path, fsync=False))
+    store.add([{"content": "tea", "timeframe": "week"}])
+    assert backend.count('default') == 0
+    assert contents(store.load()) == ['tea']
+    assert store.merge_journal() == 1
+    assert backend.count('default') == 1
+    assert not os.path.exists(journal_path)
+
+
+def test_journal_is_replayed_after_a_crash(backend, journal_path):
+    crashed = MemoryStore(backend, journal=MemoryJournal(journal_path, fsync=False))
+    crashed.add([{"content": "tea", "timeframe": "week"}], user_id='a')
+    crashed.add([{"content": "cats", "timeframe": "week"}], user_id='b')
+    # The process dies without merging; a torn last line is left behind too
+    with open(journal_path, 'a') as f:
+        f.write('{"user_id": "a", "row": {"id"')
+
+    restarted = MemoryStore(backend, journal=MemoryJournal(journal_path, fsync=False))
+    assert restarted.merge_journal() == 2
+    assert contents(restarted.load('a')) == ['tea']
+    assert contents(restarted.load('b')) == ['cats']
+
+
+def test_batch_claimed_by_a_dead_process_is_merged_again(backend, journal_path):
+    crashed = MemoryStore(backend, journal=MemoryJournal(journal_path, fsync=False))
+    crashed.add([{"content": "tea", "timeframe": "week"}])
+    # Renamed aside for merging by a process that is no longer running
+    os.rename(journal_path, f"{journal_path}.999999-0{MERGING_SUFFIX}")
+
+    restarted = MemoryStore(backend, journal=MemoryJournal(journal_path, fsync=False))
+    assert restarted.merge_journal() == 1
+    assert contents(restarted.load()) == ['tea']
+    assert not os.path.exists(f"{journal_path}.999999-0{MERGING_SUFFIX}")
+
+
+def test_replaying_an_already_merged_batch_stores_nothing_twice(backend, journal_path):
+    store = MemoryStore(backend, journal=MemoryJournal(journal_path, fsync=False))
+    store.add([{"content": "tea", "timeframe": "week"}])
+    with open(journal_path) as f:
+        journaled = f.read()
+    store.merge_journal()
+    # Crash after the commit but before the journal was removed
+    with open(journal_path, 'w') as f:
+        f.write(journaled)
+    assert MemoryStore(backend, journal=MemoryJournal(journal_path, fsync=False)).merge_journal() == 1
+    assert backend.count('default') == 1
+
+
+def test_failed_merge_leaves_every_batch_for_the_next_one(backend, journal_path, monkeypatch):
+    journal = MemoryJournal(journal_path, fsync=False)
+    store = MemoryStore(backend, journal=journal)
+    store.add([{"content": "tea", "timeframe": "week"}])
+    os.rename(journal_path, f"{journal_path}.999999-0{MERGING_SUFFIX}")
+    store.add([{"content": "cats", "timeframe": "week"}])
+
+    def fail(*args):
+        raise RuntimeError('backend down')
+
+    monkeypatch.setattr(backend, 'insert', fail)
+    with pytest.raises(RuntimeError):
+        store.merge_journal()
+    assert not journal._claimed
+    monkeypatch.undo()
+    assert store.merge_journal() == 2
+    assert backend.count('default') == 2
+
+
+def test_expired_journaled_memories_are_not_merged(backend, journal_path):
+    store = MemoryStore(backend, journal=MemoryJournal(journal_path, fsync=False))
+    store.add([{"content": "old", "timeframe": "day", "timestamp": OLD}])
+    assert store.load() == []
+    assert store.merge_journal() == 0
+    assert backend.count('default') == 0
+
+
+def test_merging_another_process_journal_shows_its_rows(backend, journal_path):
+    writer = MemoryStore(backend, journal=MemoryJournal(journal_path, fsync=False))
+    merger = MemoryStore(backend, journal=MemoryJournal(journal_path, fsync=False))
+    assert merger.load() == []
+    writer.add([{"content": "tea", "timeframe": "week"}])
+    assert merger.merge_journal() == 1
+    assert contents(merger.load()) == ['tea']
+    assert contents(writer.load()) == ['tea']
@@ -0,0 +1,116 @@
+import json
+
+import pytest
+
+from app.memory import MemoryStore, SQLiteMemoryBackend
+
+
+@pytest.fixture
+def backend(tmp_path):
+    backend = SQLiteMemoryBackend(str(tmp_path / 'memories.db'))
+    yield backend
+    backend.close()
+
+
+def contents(memories):
+    return sorted(memory['content'] for memory in memories)
+
+
+def test_added_memories_are_loaded_with_ids_and_timestamps(backend):
+    store = MemoryStore(backend)
+    store.add([{"content": "tea", "timeframe": "week"}])
+    memory, = store.load()
+    assert memory['content'] == 'tea' and memory['timeframe'] == 'week'
+    assert memory['id'] and memory['timestamp']
+    assert contents(MemoryStore(backend).load()) == ['tea']
+
+
+def test_reads_are_served_from_the_cache(backend, monkeypatch):
+    store = MemoryStore(backend)
+    store.add([{"content": "tea", "timeframe": "week"}])
+    store.load()
+    monkeypatch.setattr(backend, 'load', lambda user_id: pytest.fail('reloaded an unchanged namespace'))
+    assert contents(store.load()) == ['tea']
+
+
+def test_writes_from_another_process_are_picked_up(backend):
+    first, second = MemoryStore(backend), MemoryStore(backend)
+    assert first.load() == []
+    version = first.version()
+    second.add([{"content": "tea", "timeframe": "week"}])
+    assert first.version() != version
+    assert contents(first.load()) == ['tea']
+
+
+def test_namespaces_are_separate(backend):
+    store = MemoryStore(backend, max_cached_users=1)
+    store.add([{"content": "tea", "timeframe": "week"}], user_id='a')
+    store.add([{"content": "cats", "timeframe": "week"}], user_id='b')
+    assert contents(store.load('a')) == ['tea']
+    assert contents(store.load('b')) == ['cats']
+    assert store.stats()['cached_users'] == 1
+
+
+def test_legacy_json_is_imported_once(backend, tmp_path):
+    path = tmp_path / 'memories.json'
+    path.write_text(json.dumps([{"content": "tea", "timeframe": "indefinitely",
+                                 "timestamp": "2024-01-01T00:00:00"}]))
+    store = MemoryStore(backend)
+    store.import_legacy_json(str(path))
+    path.write_text(json.dumps([{"content": "cats", "timeframe": "indefinitely"}]))
+    store.import_legacy_json(str(path))
+    assert contents(store.load()) == ['tea']
+
+
+def test_add_skips_normalized_duplicates(backend):
+    store = MemoryStore(backend)
+    inserted = store.add([
+        {"content": "Likes green tea", "timeframe": "week"},
+        {"content": "  likes   GREEN tea ", "timeframe": "week"},
+        {"content": "Has a cat", "timeframe": "indefinitely"},
+    ])
+    assert contents(inserted) == ['Has a cat', 'Likes green tea']
+    assert store.add([{"content": "LIKES green TEA", "timeframe": "day"}]) == []
+    assert backend.count('default') == 2
+
+
+def test_add_streams_a_generator_in_batches(backend):
+    store = MemoryStore(backend)
+    inserted = store.add(({"content": f"fact {number % 50}", "timeframe": "week"} for number in range(120)),
+                         batch_size=7)
+    assert len(inserted) == 50
+    assert backend.count('default') == 50
+
+
+def test_dedup_is_per_user(backend):
+    store = MemoryStore(backend)
+    store.add([{"content": "tea", "timeframe": "week"}], user_id='a')
+    assert len(store.add([{"content": "tea", "timeframe": "week"}], user_id='b')) == 1
+
+
+def test_dedup_sees_writes_from_another_process(backend):
+    first, second = MemoryStore(backend), MemoryStore(backend)
+    first.load()
+    second.add([{"content": "tea", "timeframe": "week"}])
+    assert first.add([{"content": "Tea", "timeframe": "week"}]) == []
+    assert contents(first.load()) == ['tea']
+
+
+OLD = '2000-01-01T00:00:00'
+
+
+def test_expired_memories_are_deleted_on_read(backend):
+    store = MemoryStore(backend)
+    store.add([{"content": "old", "timeframe": "day", "timestamp": OLD},
+               {"content": "kept", "timeframe": "indefinitely", "timestamp": OLD}])
+    assert contents(store.load()) == ['kept']
+    assert backend.count('default') == 1
+
+
+def test_sweep_removes_rows_of_cached_and_uncached_users(backend):
+    store = MemoryStore(backend)
+    store.add([{"content": "old", "timeframe": "day", "timestamp": OLD}], user_id='cached')
+    MemoryStore(backend).add([{"content": "old", "timeframe": "day", "timestamp": OLD}], user_id='elsewhere')
+    store.sweep()
+    assert backend.count('cached') == 0
+    assert backend.count('elsewhere') == 0
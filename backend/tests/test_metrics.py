@@ -0,0 +1,88 @@
+import threading
+import time
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from moto import mock_aws
+from prometheus_client import REGISTRY
+
+from app.metrics import (REQUEST_ID_HEADER, begin_request, end_request, finish_profile, instrument_client,
+                         stage, start_profile)
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_requests_are_counted_and_exposed_on_metrics(client):
+    labels = dict(route='/chat_api/memories', method='GET', status='200')
+    before = sample('waifu_requests_total', **labels)
+    assert client.get('/chat_api/memories?user_id=metrics-user').status_code == 200
+    assert sample('waifu_requests_total', **labels) == before + 1
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert b'waifu_requests_total{' in response.data
+
+
+@pytest.mark.parametrize('incoming, kept', [('trace-123', True), ('bad id <script>', False)])
+def test_request_id_is_echoed_only_when_valid(client, incoming, kept):
+    response = client.get('/chat_api/memories?user_id=metrics-user', headers={REQUEST_ID_HEADER: incoming})
+    assert (response.headers[REQUEST_ID_HEADER] == incoming) is kept
+
+
+def test_stages_add_up_into_the_request_timings():
+    context, token = begin_request()
+    try:
+        with stage('retrieval'):
+            pass
+        with stage('retrieval'):
+            pass
+    finally:
+        end_request(token)
+    assert list(context.timings) == ['retrieval']
+    assert context.server_timing().startswith('retrieval;dur=')
+
+
+def test_aws_calls_are_counted_once_per_call():
+    with mock_aws():
+        s3 = boto3.client('s3', region_name='us-east-1')
+        instrument_client(s3)
+        instrument_client(s3)
+        s3.create_bucket(Bucket='metrics')
+        labels = dict(service='s3', operation='PutObject')
+        calls = sample('waifu_aws_calls_total', status='200', **labels)
+        sent = sample('waifu_aws_bytes_total', direction='sent', **labels)
+        s3.put_object(Bucket='metrics', Key='a', Body=b'x' * 100)
+        assert sample('waifu_aws_calls_total', status='200', **labels) == calls + 1
+        assert sample('waifu_aws_bytes_total', direction='sent', **labels) == sent + 100
+
+        missing = sample('waifu_aws_calls_total', service='s3', operation='HeadObject', status='404')
+        with pytest.raises(ClientError):
+            s3.head_object(Bucket='metrics', Key='missing')
+        assert sample('waifu_aws_calls_total', service='s3', operation='HeadObject', status='404') == missing + 1
+
+
+def busy(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_profiler_samples_the_profiled_thread_only_once_at_a_time(tmp_path):
+    stop = threading.Event()
+    worker = threading.Thread(target=busy, args=(stop,))
+    worker.start()
+    try:
+        profiler = start_profile([worker.ident], interval=0.001)
+        assert start_profile() is None
+        time.sleep(0.05)
+    finally:
+        stop.set()
+        worker.join()
+    path = finish_profile(profiler, str(tmp_path), 'req-1')
+    assert profiler.samples > 0
+    assert all('busy' in stack for stack in profiler.stacks)
+    assert open(path).read().count('\n') == len(profiler.stacks)
+    # The next profile can start once this one has finished
+    finish_profile(start_profile(), str(tmp_path), 'req-2')
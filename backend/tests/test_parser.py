@@ -0,0 +1,106 @@
+import json
+
+import pytest
+
+from app.memory import RememberTagParser, extract_memories
+
+
+def stream(reply, chunk_size):
+    parser = RememberTagParser()
+    visible = ''.join(parser.feed(reply[i:i + chunk_size]) for i in range(0, len(reply), chunk_size))
+    return visible + parser.close(), parser.memories
+
+
+def test_extracts_tag_and_strips_it():
+    visible, memories = extract_memories("Sure! <REMEMBER THIS FOR week: likes green tea> Got it.")
+    assert visible == "Sure! Got it."
+    assert memories == [{"timeframe": "week", "content": "likes green tea"}]
+
+
+def test_reply_starting_with_tag_has_no_leading_space():
+    visible, memories = extract_memories("<REMEMBER THIS FOR day: tired> Rest well.")
+    assert visible == "Rest well."
+    assert len(memories) == 1
+
+
+def test_whitespace_around_consecutive_tags_collapses():
+    tag = "<REMEMBER THIS FOR day: x>"
+    visible, memories = extract_memories(f"hi {tag} ok {tag} bye")
+    assert visible == "hi ok bye"
+    assert len(memories) == 2
+
+
+def test_doubled_angle_bracket_still_finds_tag():
+    visible, memories = extract_memories("<<REMEMBER THIS FOR day: x> hi")
+    assert visible == "< hi"
+    assert memories == [{"timeframe": "day", "content": "x"}]
+
+
+def test_marker_is_case_insensitive():
+    _, memories = extract_memories("<remember this for month: birthday in May>")
+    assert memories == [{"timeframe": "month", "content": "birthday in May"}]
+
+
+def test_text_that_only_looks_like_a_tag_is_kept():
+    visible, memories = extract_memories("a < b and <REMEMBER me")
+    assert visible == "a < b and <REMEMBER me"
+    assert memories == []
+
+
+def test_malformed_tag_is_dropped_without_a_memory():
+    visible, memories = extract_memories("ok <REMEMBER THIS FOR week no colon> done")
+    assert visible == "ok done"
+    assert memories == []
+
+
+def test_unclosed_tag_is_given_back_as_text():
+    visible, memories = extract_memories("hello <REMEMBER THIS FOR week: never closed")
+    assert visible == "hello <REMEMBER THIS FOR week: never closed"
+    assert memories == []
+
+
+def test_overlong_tag_is_given_back_as_text():
+    body = "week: " + "x" * 3000
+    visible, memories = extract_memories(f"<REMEMBER THIS FOR {body}>")
+    assert visible.startswith("<REMEMBER THIS FOR week: xxx")
+    assert memories == []
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 1000])
+def test_streamed_output_matches_whole_reply(chunk_size):
+    reply = ("Hello <REMEMBER THIS FOR week: likes cats> there, <3 you. "
+             "<<REMEMBER THIS FOR indefinitely: name is Sam> bye <REMEMBER")
+    whole = extract_memories(reply)
+    visible, memories = stream(reply, chunk_size)
+    assert visible.strip() == whole[0]
+    assert memories == whole[1]
+
+
+def test_feed_withholds_a_possible_tag_until_it_is_decided():
+    parser = RememberTagParser()
+    assert parser.feed("Hi <REMEM") == "Hi "
+    assert parser.feed("BER THIS FOR day: x>!") == "!"
+    assert parser.memories == [{"timeframe": "day", "content": "x"}]
+
+
+def sse_events(response):
+    events = []
+    for block in response.get_data(as_text=True).strip().split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.splitlines())
+        events.append((lines.get('event', 'message'), json.loads(lines['data'])))
+    return events
+
+
+def test_stream_endpoint_holds_back_tags_and_saves_them(client, llm):
+    llm.reply = "Noted! <REMEMBER THIS FOR week: likes oolong> Anything else?"
+    llm.chunk_size = 3
+    response = client.post('/chat_api/chat/stream',
+                           json={"message": "I like oolong", "user_id": "stream-user", "cache": False})
+    assert response.mimetype == 'text/event-stream'
+    events = sse_events(response)
+    deltas = ''.join(data['delta'] for event, data in events if event == 'message')
+    assert 'REMEMBER' not in deltas
+    assert events[-1][0] == 'done'
+    assert events[-1][1]['reply'] == "Noted! Anything else?"
+    memories = client.get('/chat_api/memories?user_id=stream-user').get_json()
+    assert [memory['content'] for memory in memories] == ['likes oolong']
@@ -0,0 +1,67 @@
+import threading
+import time
+
+import pytest
+from moto import mock_aws
+
+from app.config import Config
+from app.services import registry
+from app.services.registry import ServiceRegistry, create_service_registry
+
+
+def test_services_are_built_once_on_first_use():
+    built = []
+
+    def factory():
+        time.sleep(0.01)
+        built.append(1)
+        return object()
+
+    services = ServiceRegistry({'thing': factory})
+    assert services.loaded() == []
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(services.get('thing'))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(built) == 1 and len(set(map(id, results))) == 1
+    assert services.loaded() == ['thing']
+    with pytest.raises(KeyError):
+        services.get('missing')
+
+
+def test_register_replaces_and_per_use_builds_every_time():
+    services = ServiceRegistry({'thing': lambda: 'old'})
+    assert services.get('thing') == 'old'
+    services.register('thing', lambda: 'new')
+    assert services.get('thing') == 'new'
+    services.register('job', object, per_use=True)
+    assert services.get('job') is not services.get('job')
+    assert 'job' not in services.loaded()
+
+
+def test_preload_skips_per_use_services_and_survives_failures():
+    def broken():
+        raise RuntimeError('no credentials')
+
+    services = ServiceRegistry({'broken': broken, 'ok': lambda: 'ok', 'job': object}, per_use=('job',))
+    services.preload(['broken', 'job', 'ok']).join()
+    assert services.loaded() == ['ok']
+
+
+def test_s3_wrappers_are_per_job_over_one_shared_client(monkeypatch):
+    monkeypatch.setattr(registry, '_s3_client', None)
+    with mock_aws():
+        services = create_service_registry()
+        first, second = services.get('s3'), services.get('s3')
+        assert first is not second
+        assert first.aws_s3 is second.aws_s3 is services.get('s3_client')
+        expected = max(10, Config.S3_TRANSFER_WORKERS * Config.S3_MULTIPART_CONCURRENCY)
+        assert first.aws_s3.meta.config.max_pool_connections == expected
+        first.dispose_temp_files()
+        second.dispose_temp_files()
+
+
+def test_app_starts_without_building_services(app):
+    assert app.extensions['services'].loaded() == []
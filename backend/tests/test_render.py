@@ -0,0 +1,71 @@
+import io
+
+import boto3
+import numpy as np
+import pytest
+from moto import mock_aws
+from moviepy.editor import ImageClip
+
+from app.services.render import MultipartStreamUploader, _still_frame, is_static_image_clip, render_static_image
+from app.services.temp_files import ScopedTempDir
+
+BUCKET = 'media'
+PART = 5 * 1024 ** 2
+
+
+@pytest.fixture
+def s3():
+    with mock_aws():
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+class Trickle(io.RawIOBase):
+    # A pipe: every read returns at most a small chunk
+    def __init__(self, data, chunk=65536):
+        self.data = io.BytesIO(data)
+        self.chunk = chunk
+
+    def read(self, size=-1):
+        return self.data.read(min(size, self.chunk))
+
+
+def test_stream_is_uploaded_in_full_parts(s3):
+    data = bytes(range(256)) * (PART * 2 // 256 + 100)
+    uploaded = MultipartStreamUploader(s3, BUCKET, 'out.mp4', max_in_flight=2).upload(Trickle(data))
+    assert uploaded == len(data)
+    assert s3.get_object(Bucket=BUCKET, Key='out.mp4')['Body'].read() == data
+    assert s3.list_multipart_uploads(Bucket=BUCKET).get('Uploads', []) == []
+
+
+@pytest.mark.parametrize('data, confirmed', [(b'', True), (b'video', False)])
+def test_unconfirmed_or_empty_stream_is_aborted(s3, data, confirmed):
+    with pytest.raises((ValueError, RuntimeError)):
+        MultipartStreamUploader(s3, BUCKET, 'out.mp4').upload(io.BytesIO(data), confirm=lambda: confirmed)
+    assert s3.list_objects_v2(Bucket=BUCKET).get('Contents', []) == []
+    assert s3.list_multipart_uploads(Bucket=BUCKET).get('Uploads', []) == []
+
+
+def test_static_image_detection():
+    image = ImageClip(np.zeros((4, 6, 3), dtype='uint8'), duration=2)
+    assert is_static_image_clip(image)
+    assert not is_static_image_clip(image.fl(lambda get_frame, t: get_frame(t) + int(t)))
+    assert not is_static_image_clip(ImageClip(np.zeros((4, 6, 3), dtype='uint8')))
+
+
+def test_still_frame_takes_float_frames_and_masks():
+    image = ImageClip(np.full((4, 6, 3), 300.0), duration=1)
+    assert _still_frame(image).mode == 'RGB'
+    assert _still_frame(image).getpixel((0, 0)) == (255, 255, 255)
+    masked = ImageClip(np.zeros((4, 6, 4), dtype='uint8'), duration=1, transparent=True)
+    assert _still_frame(masked).mode == 'RGBA'
+
+
+def test_render_static_image_uploads_a_playable_mp4(s3, tmp_path):
+    owner = type('Owner', (), {})()
+    image = ImageClip(np.zeros((5, 7, 3), dtype='uint8'), duration=1).set_fps(4)
+    uploaded = render_static_image(image, s3, BUCKET, 'still.mp4', ScopedTempDir(owner, str(tmp_path)))
+    body = s3.get_object(Bucket=BUCKET, Key='still.mp4')['Body'].read()
+    assert uploaded == len(body) > 0
+    assert body[4:8] == b'ftyp'
@@ -0,0 +1,85 @@
+import time
+
+import pytest
+
+from app.chat import InMemoryReplyCache, SQLiteReplyCache, create_reply_cache, reply_cache_key
+
+HISTORY = [{"role": "user", "content": "Hello  there"}]
+
+
+def test_key_normalizes_whitespace_and_case():
+    assert (reply_cache_key('m', 'p', 1, HISTORY) ==
+            reply_cache_key('m', 'p', 1, [{"role": "user", "content": "hello there "}]))
+
+
+@pytest.mark.parametrize('change', [
+    dict(model='other'), dict(system_prompt='other'), dict(memory_version=2),
+    dict(summary='user: earlier'), dict(messages=HISTORY + [{"role": "user", "content": "more"}]),
+])
+def test_key_changes_with_the_prompt_state(change):
+    base = dict(model='m', system_prompt='p', memory_version=1, messages=HISTORY, summary='')
+    assert reply_cache_key(**base) != reply_cache_key(**dict(base, **change))
+
+
+def test_key_only_looks_at_the_last_turns():
+    older = [{"role": "user", "content": "long ago"}] + HISTORY
+    assert reply_cache_key('m', 'p', 1, older, turns=1) == reply_cache_key('m', 'p', 1, HISTORY, turns=1)
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def make_cache(request, tmp_path):
+    def make(**kwargs):
+        return create_reply_cache(request.param, db_path=str(tmp_path / 'cache.db'), **kwargs)
+    return make
+
+
+def test_get_set_and_stats(make_cache):
+    cache = make_cache()
+    assert cache.get('k') is None
+    cache.set('k', 'reply')
+    assert cache.get('k') == 'reply'
+    assert cache.stats() == {"hits": 1, "misses": 1, "entries": 1}
+
+
+def test_entries_expire(make_cache, monkeypatch):
+    cache = make_cache(ttl=10)
+    cache.set('k', 'reply')
+    monkeypatch.setattr(time, 'time', lambda now=time.time(): now + 11)
+    assert cache.get('k') is None
+
+
+def test_least_recently_used_entries_are_evicted(make_cache):
+    cache = make_cache(max_entries=2)
+    cache.set('a', 1)
+    time.sleep(0.01)
+    cache.set('b', 2)
+    time.sleep(0.01)
+    cache.get('a')
+    time.sleep(0.01)
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+
+
+def test_sqlite_cache_is_shared_and_reads_do_not_write(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    writer, reader = SQLiteReplyCache(path), SQLiteReplyCache(path)
+    writer.set('k', 'reply')
+    before = reader._conn.total_changes
+    assert reader.get('k') == 'reply'
+    assert reader._conn.total_changes == before
+
+
+def test_none_backend_disables_caching():
+    assert create_reply_cache('none') is None
+    assert isinstance(create_reply_cache('memory'), InMemoryReplyCache)
+
+
+def test_repeated_question_is_answered_from_the_cache(client, llm):
+    body = {"message": "what's the capital of France?", "conversation_history": [], "user_id": "cache-user"}
+    first = client.post('/chat_api/chat', json=body).get_json()
+    second = client.post('/chat_api/chat', json=body).get_json()
+    assert first['reply'] == second['reply'] == llm.reply
+    assert len(llm.calls) == 1
+    client.post('/chat_api/chat', json=dict(body, cache=False))
+    assert len(llm.calls) == 2
@@ -0,0 +1,44 @@
+from app.memory import MemoryIndex, MemoryStore, SQLiteMemoryBackend
+from app.memory.retrieval import tokenize
+
+
+def test_tokenize_drops_stopwords_and_alert_boilerplate():
+    assert tokenize("ACTIVITY ALERT: Your boyfriend is on https://www.YouTube.com") == ['youtube']
+
+
+def test_search_ranks_matching_memories_first():
+    index = MemoryIndex()
+    index.add('tea', "likes green tea in the morning")
+    index.add('cat', "has a cat called Miso")
+    index.add('both', "drinks tea with the cat")
+    results = [memory_id for memory_id, _ in index.search("what tea should I make", top_k=5)]
+    assert set(results) == {'tea', 'both'}
+    assert index.search("football", top_k=5) == []
+
+
+def test_search_respects_top_k_and_removals():
+    index = MemoryIndex()
+    for number in range(10):
+        index.add(str(number), f"likes song number {number}")
+    assert len(index.search("song", top_k=3)) == 3
+    index.remove('0')
+    index.remove('0')
+    assert len(index) == 9
+    assert '0' not in dict(index.search("song", top_k=10))
+
+
+def test_re_adding_replaces_the_old_content():
+    index = MemoryIndex()
+    index.add('m', "likes tea")
+    index.add('m', "likes coffee")
+    assert index.search("tea") == []
+    assert [memory_id for memory_id, _ in index.search("coffee")] == ['m']
+
+
+def test_store_search_always_includes_indefinite_memories(tmp_path):
+    store = MemoryStore(SQLiteMemoryBackend(str(tmp_path / 'memories.db')))
+    store.add([{"content": "name is Sam", "timeframe": "indefinitely"},
+               {"content": "likes green tea", "timeframe": "week"},
+               {"content": "exam on Friday", "timeframe": "week"}])
+    found = [memory['content'] for memory in store.search("make me some tea", top_k=1)]
+    assert found == ["name is Sam", "likes green tea"]
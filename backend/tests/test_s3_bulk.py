@@ -0,0 +1,87 @@
+import boto3
+import pytest
+from moto import mock_aws
+
+from app.services.media_cache import MediaCache
+from app.services.s3 import S3
+
+BUCKET = 'media'
+OTHER_BUCKET = 'copies'
+
+
+@pytest.fixture
+def s3(tmp_path):
+    with mock_aws():
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket=BUCKET)
+        client.create_bucket(Bucket=OTHER_BUCKET)
+        with S3(client, media_cache=MediaCache(str(tmp_path / 'cache'), max_bytes=10 ** 8)) as wrapper:
+            yield wrapper
+
+
+def put(s3, key, body):
+    s3.aws_s3.put_object(Bucket=BUCKET, Key=key, Body=body)
+
+
+def keys(s3, bucket, prefix=''):
+    return sorted(item['key'] for item in s3.iter_objects(bucket, prefix))
+
+
+def test_upload_and_download_files(s3, tmp_path):
+    files = []
+    for number in range(5):
+        path = tmp_path / f'file{number}.txt'
+        path.write_bytes(b'x' * (number + 1))
+        files.append((str(path), f'file{number}.txt'))
+
+    report = s3.upload_files(iter(files), BUCKET, prefix='up/', max_workers=2)
+    assert report['stats']['succeeded'] == 5
+    assert report['stats']['bytes'] == 15
+    assert [result['key'] for result in report['results']] == [key for _, key in files]
+
+    report = s3.download_files([key for _, key in files], BUCKET, str(tmp_path / 'down'), prefix='up/')
+    assert report['stats']['succeeded'] == 5
+    assert (tmp_path / 'down' / 'file4.txt').read_bytes() == b'xxxxx'
+
+
+def test_download_refuses_keys_outside_the_target(s3, tmp_path):
+    put(s3, 'secret', b'x')
+    report = s3.download_files(['../secret'], BUCKET, str(tmp_path / 'down'))
+    assert report['stats']['failed'] == 1
+
+
+def test_copy_items_counts_bytes_and_failures(s3):
+    put(s3, 'src/a', b'aaa')
+    put(s3, 'src/b', b'bb')
+    report = s3.copy_items(['a', {"key": "b", "size": 2}, 'missing'], BUCKET, OTHER_BUCKET,
+                           source_prefix='src/', dest_prefix='dst/')
+    assert report['stats']['succeeded'] == 2
+    assert report['stats']['failed'] == 1
+    assert report['stats']['bytes'] == 5
+    assert keys(s3, OTHER_BUCKET) == ['dst/a', 'dst/b']
+
+
+def test_copy_prefix(s3):
+    for number in range(12):
+        put(s3, f'project/{number:02d}.json', b'{}')
+    report = s3.copy_prefix(BUCKET, 'project/', OTHER_BUCKET, 'clone/', max_workers=3)
+    assert report['stats']['succeeded'] == 12
+    assert report['stats']['bytes'] == 24
+    assert keys(s3, OTHER_BUCKET, 'clone/') == [f'clone/{number:02d}.json' for number in range(12)]
+
+
+def test_delete_items_batches_and_dedups(s3, monkeypatch):
+    monkeypatch.setattr('app.services.s3.DELETE_BATCH_SIZE', 4)
+    for number in range(10):
+        put(s3, f'trash/{number}', b'x')
+    report = s3.delete_items(BUCKET, [f'trash/{number}' for number in range(10)] + ['trash/0'])
+    assert report['stats']['count'] == 10
+    assert report['stats']['succeeded'] == 10
+    assert keys(s3, BUCKET, 'trash/') == []
+
+
+def test_delete_prefix(s3):
+    put(s3, 'project/a', b'x')
+    put(s3, 'project/sub/b', b'x')
+    put(s3, 'other/c', b'x')
+    s3.delete_prefix(BUCKET, 'project/')
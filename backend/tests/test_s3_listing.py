@@ -0,0 +1,57 @@
+import boto3
+import pytest
+from moto import mock_aws
+
+from app.services.s3 import S3
+
+BUCKET = 'media'
+
+
+@pytest.fixture
+def s3():
+    with mock_aws():
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket=BUCKET)
+        with S3(client) as wrapper:
+            yield wrapper
+
+
+def put(s3, key, body=b'x'):
+    s3.aws_s3.put_object(Bucket=BUCKET, Key=key, Body=body)
+
+
+def test_iter_objects_follows_every_page(s3):
+    for number in range(7):
+        put(s3, f'users/{number}.json', b'{}')
+    items = list(s3.iter_objects(BUCKET, 'users/', page_size=2))
+    assert [item['key'] for item in items] == [f'users/{number}.json' for number in range(7)]
+    assert all(item['size'] == 2 and item['etag'] and '"' not in item['etag'] for item in items)
+
+
+def test_iter_prefixes_lists_directories_only(s3):
+    for key in ('users/a/1', 'users/a/2', 'users/b/1', 'users/top'):
+        put(s3, key)
+    assert list(s3.iter_prefixes(BUCKET, 'users/')) == ['users/a/', 'users/b/']
+
+
+def test_iter_objects_parallel_matches_iter_objects(s3):
+    keys = ['users/top'] + [f'users/{user}/{number}' for user in 'abcde' for number in range(3)]
+    for key in keys:
+        put(s3, key)
+    found = sorted(item['key'] for item in s3.iter_objects_parallel(BUCKET, 'users/', max_workers=2))
+    assert found == sorted(keys)
+
+
+def test_iter_objects_parallel_can_stop_early(s3):
+    for user in 'abcdef':
+        put(s3, f'users/{user}/1')
+    listing = s3.iter_objects_parallel(BUCKET, 'users/', max_workers=2)
+    assert next(listing)['key'].startswith('users/')
+    listing.close()
+
+
+def test_get_all_items_excludes_the_folder_itself(s3):
+    s3.create_folder('project', BUCKET)
+    put(s3, 'project/a')
+    put(s3, 'project/sub/b')
+    assert s3.get_all_items(BUCKET, 'project/') == ['project/a', 'project/sub/b']
@@ -0,0 +1,80 @@
+import boto3
+import pytest
+from moto import mock_aws
+
+from app.services.s3 import S3, _signer_identity
+
+BUCKET = 'media'
+
+
+@pytest.fixture
+def s3():
+    with mock_aws():
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket=BUCKET)
+        with S3(client) as wrapper:
+            yield wrapper
+
+
+def put(s3, key):
+    s3.aws_s3.put_object(Bucket=BUCKET, Key=key, Body=b'x')
+
+
+def listed_prefixes(s3, monkeypatch):
+    # Records the prefix of every listing get_item_urls makes
+    prefixes = []
+    get_paginator = s3.aws_s3.get_paginator
+
+    def paginator(name):
+        pages = get_paginator(name)
+        paginate = pages.paginate
+
+        def record(**kwargs):
+            prefixes.append(kwargs.get('Prefix'))
+            return paginate(**kwargs)
+        monkeypatch.setattr(pages, 'paginate', record)
+        return pages
+    monkeypatch.setattr(s3.aws_s3, 'get_paginator', paginator)
+    return prefixes
+
+
+@pytest.mark.parametrize('count', [3, 40])
+def test_get_item_urls_marks_missing_keys(s3, count):
+    # Few keys are checked with HEADs, many with a listing
+    names = [f'{number}.png' for number in range(count)]
+    for name in names[1:]:
+        put(s3, f'thumbs/{name}')
+    put(s3, 'thumbs/nested/0.png')
+    urls = s3.get_item_urls(BUCKET, names, prefix='thumbs/', check_exists=True)
+    assert urls[names[0]] is None
+    assert all(urls[name].startswith('https://') for name in names[1:])
+
+
+def test_unrelated_keys_never_list_the_whole_bucket(s3, monkeypatch):
+    keys = [f'user{number}/avatar.png' for number in range(40)]
+    for key in keys[1:]:
+        put(s3, key)
+    prefixes = listed_prefixes(s3, monkeypatch)
+    urls = s3.get_item_urls(BUCKET, keys, check_exists=True)
+    assert prefixes == []
+    assert urls[keys[0]] is None and all(urls[key] for key in keys[1:])
+
+
+def test_long_directory_listing_falls_back_to_heads(s3, monkeypatch):
+    monkeypatch.setattr('app.services.s3.LIST_CHECK_MAX_OBJECTS', 5)
+    names = [f'{number:02d}.png' for number in range(40)]
+    for name in names:
+        if name != '39.png':
+            put(s3, f'thumbs/{name}')
+    prefixes = listed_prefixes(s3, monkeypatch)
+    urls = s3.get_item_urls(BUCKET, names, prefix='thumbs/', check_exists=True)
+    assert prefixes == ['thumbs/']
+    assert urls['39.png'] is None
+    assert all(urls[name] for name in names[:-1])
+
+
+def test_clients_from_one_session_share_presigned_urls(s3):
+    other = boto3.client('s3', region_name='us-east-1')
+    assert _signer_identity(other) == _signer_identity(s3.aws_s3)
+    elsewhere = boto3.client('s3', region_name='eu-west-1')
+    assert _signer_identity(elsewhere) != _signer_identity(s3.aws_s3)
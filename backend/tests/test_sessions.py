@@ -0,0 +1,86 @@
+import sqlite3
+import time
+
+import pytest
+
+from app.chat import SessionStore
+
+
+def turn(number):
+    return [{"role": "user", "content": f"q{number}"}, {"role": "assistant", "content": f"a{number}"}]
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'sessions.db')
+
+
+def stored_sessions(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return {row[0] for row in conn.execute("SELECT id FROM sessions")}
+
+
+def test_history_survives_eviction_and_restart(db_path):
+    store = SessionStore(max_sessions=1, db_path=db_path)
+    first = store.get_or_create()
+    store.append(first, turn(1))
+    store.append(store.get_or_create(), turn(2))
+    assert len(store) == 1
+    assert store.get_or_create(first.id).snapshot() == turn(1)
+    assert SessionStore(db_path=db_path).get_or_create(first.id).snapshot() == turn(1)
+
+
+def test_unknown_session_id_starts_an_empty_session():
+    session = SessionStore().get_or_create('missing')
+    assert session.id == 'missing' and session.snapshot() == []
+
+
+def test_history_is_capped_in_memory_and_on_disk(db_path):
+    store = SessionStore(db_path=db_path, max_messages=4)
+    session = store.get_or_create()
+    session.context.summarized_upto = 3
+    for number in range(5):
+        store.append(session, turn(number))
+    assert session.snapshot() == turn(3) + turn(4)
+    assert session.context.summarized_upto == 0
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM session_messages").fetchone()[0] == 4
+
+    reloaded = SessionStore(db_path=db_path, max_messages=4).get_or_create(session.id)
+    assert reloaded.snapshot() == turn(3) + turn(4)
+    store.append(reloaded, turn(5))
+    assert SessionStore(db_path=db_path).get_or_create(session.id).snapshot() == turn(4) + turn(5)
+
+
+def test_sweep_deletes_idle_sessions_nobody_has_loaded(db_path, monkeypatch):
+    # Written by an earlier run, then never touched again
+    old = SessionStore(db_path=db_path)
+    stale = old.get_or_create()
+    old.append(stale, turn(1))
+
+    store = SessionStore(db_path=db_path, idle_timeout=60)
+    live = store.get_or_create()
+    store.append(live, turn(1))
+    monkeypatch.setattr(time, 'time', lambda now=time.time(): now + 120)
+    store.get_or_create(live.id)
+
+    assert store.sweep() == 1
+    assert stored_sessions(db_path) == {live.id}
+
+
+def test_sweep_forgets_idle_sessions_in_memory(db_path, monkeypatch):
+    store = SessionStore(db_path=db_path, idle_timeout=60)
+    store.append(store.get_or_create(), turn(1))
+    monkeypatch.setattr(time, 'time', lambda now=time.time(): now + 120)
+    assert store.sweep() == 1
+    assert len(store) == 0
+    assert stored_sessions(db_path) == set()
+
+
+def test_chat_keeps_history_server_side(client, llm):
+    llm.reply = "Hi there"
+    first = client.post('/chat_api/chat', json={"message": "hello", "cache": False}).get_json()
+    assert first['reply'] == "Hi there" and 'conversation_history' not in first
+    client.post('/chat_api/chat', json={"message": "again", "session_id": first['session_id'], "cache": False})
+    sent = [message['content'] for message in llm.calls[-1] if message['role'] != 'system']
+    assert sent == ['hello', 'Hi there', 'again']
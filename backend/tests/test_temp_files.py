@@ -0,0 +1,74 @@
+import gc
+import os
+
+import pytest
+
+from app.services.temp_files import (TEMP_DIR_PREFIX, ScopedTempDir, TempDiskQuotaExceeded, TempJanitor,
+                                     TempUsage)
+
+
+class Owner:
+    pass
+
+
+def test_file_is_removed_when_the_block_raises(tmp_path):
+    scoped = ScopedTempDir(Owner(), str(tmp_path))
+    with pytest.raises(ValueError):
+        with scoped.file(suffix='.mp4') as path:
+            open(path, 'wb').write(b'x')
+            raise ValueError
+    assert not os.path.exists(path)
+    assert os.listdir(scoped.path) == []
+
+
+def test_reserved_bytes_count_before_the_file_is_written(tmp_path):
+    owner = Owner()
+    scoped = ScopedTempDir(owner, str(tmp_path), quota_bytes=1000)
+    with scoped.file(reserved_bytes=600):
+        with pytest.raises(TempDiskQuotaExceeded):
+            with scoped.file(reserved_bytes=600):
+                pass
+    # The reservation is released with the file
+    with scoped.file(reserved_bytes=600):
+        pass
+
+
+def test_usage_counts_other_processes_directories(tmp_path):
+    other = tmp_path / f"{TEMP_DIR_PREFIX}1-abc"
+    other.mkdir()
+    (other / 'part').write_bytes(b'x' * 100)
+    usage = TempUsage(str(tmp_path))
+    assert usage.current() == 100
+    own = ScopedTempDir(Owner(), str(tmp_path))
+    with own.file(reserved_bytes=50):
+        assert usage.current() == 100
+
+
+def test_cleanup_and_garbage_collection_remove_the_directory(tmp_path):
+    scoped = ScopedTempDir(Owner(), str(tmp_path))
+    with scoped.file():
+        path = scoped.path
+    scoped.cleanup()
+    assert not os.path.exists(path)
+
+    owner = Owner()
+    scoped = ScopedTempDir(owner, str(tmp_path))
+    with scoped.file():
+        path = scoped.path
+    del owner
+    gc.collect()
+    assert not os.path.exists(path)
+
+
+def test_janitor_removes_only_directories_nobody_will_clean_up(tmp_path):
+    owner = Owner()
+    live = ScopedTempDir(owner, str(tmp_path))
+    with live.file():
+        pass
+    orphan = tmp_path / f"{TEMP_DIR_PREFIX}{os.getpid()}-orphan"
+    dead = tmp_path / f"{TEMP_DIR_PREFIX}{2 ** 22 + 1}-dead"
+    unrelated = tmp_path / 'keep'
+    for path in (orphan, dead, unrelated):
+        path.mkdir()
+    assert TempJanitor(str(tmp_path)).sweep() == 2
+    assert sorted(os.listdir(tmp_path)) == sorted(['keep', os.path.basename(live.path)])
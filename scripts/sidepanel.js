@@ -2,9 +2,16 @@ document.addEventListener('DOMContentLoaded', function() {
     const chatMessages = document.getElementById('chat-messages');
     const messageInput = document.getElementById('message-input');
     const sendButton = document.getElementById('send-button');
-    let conversationHistory = [];
+    // The server keeps the conversation history; we only remember which session we are in
+    let sessionId = null;
+    // Memories are stored per user, so keep an anonymous id across sessions
+    let userId = localStorage.getItem('waifuUserId');
+    if (!userId) {
+        userId = crypto.randomUUID();
+        localStorage.setItem('waifuUserId', userId);
+    }
 
-    function addMessage(message, isUser) {
+    function createMessageElement(message, isUser) {
         const messageElement = document.createElement('div');
         messageElement.classList.add('message');
         messageElement.classList.add(isUser ? 'user-message' : 'ai-message');
@@ -15,12 +22,86 @@ document.addEventListener('DOMContentLoaded', function() {
         messageElement.appendChild(paragraphElement);
         chatMessages.appendChild(messageElement);
         chatMessages.scrollTop = chatMessages.scrollHeight;
+        return paragraphElement;
+    }
+
+    function addMessage(message, isUser) {
+        createMessageElement(message, isUser);
+    }
 
-        // Add message to conversation history
-        conversationHistory.push({
-            role: isUser ? 'user' : 'assistant',
-            content: message
+    // Sends a message to the streaming chat endpoint and renders the reply
+    // as it arrives. Resolves with the final 'done' event payload.
+    async function streamChat(message) {
+        const response = await fetch('http://localhost:3000/chat_api/chat/stream', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({
+                message: message,
+                session_id: sessionId,
+                user_id: userId
+            })
         });
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+
+        let replyElement = null;
+        let replyText = '';
+        let buffer = '';
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) {
+                break;
+            }
+            buffer += decoder.decode(value, { stream: true });
+
+            // Server-Sent Events are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let eventName = 'message';
+                let data = '';
+                for (const line of rawEvent.split('\n')) {
+                    if (line.startsWith('event: ')) {
+                        eventName = line.slice(7);
+                    } else if (line.startsWith('data: ')) {
+                        data += line.slice(6);
+                    }
+                }
+                const payload = JSON.parse(data);
+
+                if (eventName === 'error') {
+                    throw new Error(payload.error);
+                } else if (eventName === 'done') {
+                    sessionId = payload.session_id;
+                    // Repeated or superseded activity alerts get no reply
+                    if (payload.skipped) {
+                        return payload;
+                    }
+                    if (!replyElement) {
+                        replyElement = createMessageElement('', false);
+                    }
+                    replyElement.textContent = payload.reply;
+                    return payload;
+                } else {
+                    // Show the first tokens as soon as they arrive
+                    if (!replyElement) {
+                        replyElement = createMessageElement('', false);
+                    }
+                    replyText += payload.delta;
+                    replyElement.textContent = replyText;
+                    chatMessages.scrollTop = chatMessages.scrollHeight;
+                }
+            }
+        }
+        throw new Error('Stream ended before the reply was complete');
     }
 
     function sendMessage() {
@@ -29,30 +110,8 @@ document.addEventListener('DOMContentLoaded', function() {
             addMessage(message, true);
             messageInput.value = '';
 
-            // Prepare the request body
-            const requestBody = {
-                message: message,
-                conversation_history: conversationHistory
-            };
-
-            // Make the API call
-            fetch('http://localhost:3000/chat_api/chat', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify(requestBody)
-            })
-            .then(response => {
-                if (!response.ok) {
-                    throw new Error(`HTTP error! status: ${response.status}`);
-                }
-                return response.json();
-            })
-            .then(data => {
-                // Change 'data.response' to 'data.reply'
-                addMessage(data.reply, false);
-            })
+            // Stream the reply into the chat as it is generated
+            streamChat(message)
             .catch(error => {
                 console.error('Error:', error);
                 let errorMessage = 'Sorry, there was an error processing your request.';
@@ -74,29 +133,9 @@ document.addEventListener('DOMContentLoaded', function() {
         console.log("Sending activity alert:", activity);
         const alertMessage = `<ACTIVITY ALERT: ${activity}>`;
         
-        // Prepare the request body
-        const requestBody = {
-            message: alertMessage,
-            conversation_history: conversationHistory
-        };
-
-        // Make the API call
-        fetch('http://localhost:3000/chat_api/chat', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify(requestBody)
-        })
-        .then(response => {
-            if (!response.ok) {
-                throw new Error(`HTTP error! status: ${response.status}`);
-            }
-            return response.json();
-        })
+        streamChat(alertMessage)
         .then(data => {
             console.log("Activity alert response:", data);
-            addMessage(data.reply, false);
         })
         .catch(error => {
             console.error('Error:', error);